@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import os
+import random
+import argparse
+
+GENE_ID = "{species}c{chrom:02d}g{index:05d}"
+# The stub wgdi gives the blocks of BLOCK_SPAN genes Ks values of their own around their peak
+BLOCK_SPAN = 40
+BLOCK_GAP = 12
+
+def species_names(species):
+    """
+    Name the synthetic species.
+    :param species: Number of species
+    :return: A list of names S1, S2, ...
+    """
+    return [f"S{i + 1}" for i in range(species)]
+
+def write_genome(directory, species, genes, chromosomes):
+    """
+    Write the .gff and .len files of a synthetic species with genes spread evenly over its chromosomes.
+    :param directory: Directory the files are written to
+    :param species: Name of the species
+    :param genes: Number of genes
+    :param chromosomes: Number of chromosomes
+    :return: The gene IDs of every chromosome, as a list of lists
+    """
+    per_chrom = max(1, genes // chromosomes)
+    chrom_genes = []
+    with open(os.path.join(directory, f"{species}.gff"), 'w') as gff, \
+            open(os.path.join(directory, f"{species}.len"), 'w') as lens:
+        for chrom in range(1, chromosomes + 1):
+            ids = [GENE_ID.format(species=species, chrom=chrom, index=i) for i in range(per_chrom)]
+            for i, gene in enumerate(ids):
+                gff.write(f"{chrom}\t{gene}\t{i * 1000 + 1}\t{i * 1000 + 900}\t+\t{i + 1}\t{gene}\n")
+            lens.write(f"{chrom}\t{per_chrom * 1000}\t{per_chrom}\n")
+            chrom_genes.append(ids)
+    return chrom_genes
+
+def write_blast(blast_file, genes1, genes2, peaks, hit_density, rng):
+    """
+    Write a synthetic BLAST file between two species.
+    Collinear set k pairs gene i of chromosome c of the first species with gene i of chromosome c + k
+    of the second, so the stub wgdi gives its blocks the k-th Ks peak; every BLOCK_SPAN genes, the last
+    BLOCK_GAP are left out, which splits the set into blocks. hit_density random hits per gene
+    add noise, some of them weak enough to be filtered out.
+    :param blast_file: Path to the BLAST file
+    :param genes1: The gene IDs of every chromosome of the first species
+    :param genes2: The gene IDs of every chromosome of the second species
+    :param peaks: Number of collinear sets, that is of Ks peaks
+    :param hit_density: Mean number of random hits per gene
+    :param rng: A random.Random instance
+    :return: The number of hits written
+    """
+    all_genes2 = [gene for ids in genes2 for gene in ids]
+    hits = 0
+    with open(blast_file, 'w') as file:
+        for chrom, ids in enumerate(genes1):
+            for i, gene in enumerate(ids):
+                for k in range(peaks):
+                    if chrom + k >= len(genes2) or i >= len(genes2[chrom + k]):
+                        continue
+                    # Older duplications keep fewer of their genes
+                    if i % BLOCK_SPAN < BLOCK_SPAN - BLOCK_GAP and rng.random() < 0.9 - 0.2 * k:
+                        file.write(f"{gene}\t{genes2[chrom + k][i]}\t{90 - 10 * k}\t300\t10\t0\t1\t300\t1\t300\t"
+                                   f"1e-{rng.randint(40, 90)}\t{rng.randint(200, 500)}\n")
+                        hits += 1
+                for _ in range(int(hit_density) + (rng.random() < hit_density % 1)):
+                    file.write(f"{gene}\t{rng.choice(all_genes2)}\t{rng.randint(30, 80)}\t{rng.randint(50, 300)}\t"
+                               f"20\t1\t1\t100\t1\t100\t1e-{rng.randint(1, 30)}\t{rng.randint(40, 300)}\n")
+                    hits += 1
+    return hits
+
+def write_fasta(directory, species, gene_ids, rng):
+    """
+    Write the CDS and protein FASTA files of a species, covering the given genes.
+    :param directory: Directory the files are written to
+    :param species: Name of the species
+    :param gene_ids: The gene IDs to write
+    :param rng: A random.Random instance
+    """
+    codons = [a + b + c for a in 'ACGT' for b in 'ACGT' for c in 'ACGT' if a + b + c not in ('TAA', 'TAG', 'TGA')]
+    with open(os.path.join(directory, f"{species}_cds.fasta"), 'w') as cds, \
+            open(os.path.join(directory, f"{species}_pep.fasta"), 'w') as pep:
+        for gene in gene_ids:
+            cds.write(f">{gene}\nATG{''.join(rng.choice(codons) for _ in range(99))}TAA\n")
+            pep.write(f">{gene}\nM{''.join(rng.choice('ACDEFGHIKLMNPQRSTVWY') for _ in range(99))}\n")
+
+def generate_inputs(directory, species=2, genes=2000, chromosomes=4, hit_density=2.0, peaks=2, seed=1):
+    """
+    Generate the inputs of a synthetic star of species pairs, S1 against every other species,
+    and a manifest listing the pairs.
+    :param directory: Directory the files are written to
+    :param species: Number of species, so species - 1 pairs
+    :param genes: Number of genes per species
+    :param chromosomes: Number of chromosomes per species
+    :param hit_density: Mean number of random BLAST hits per gene
+    :param peaks: Number of Ks peaks, at most the number of chromosomes
+    :param seed: Seed of the random generator
+    :return: A list of (name1, name2) pairs
+    """
+    if species < 2:
+        raise ValueError("At least two species are needed")
+    if not 1 <= peaks <= chromosomes:
+        raise ValueError("The number of peaks must be between 1 and the number of chromosomes")
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    names = species_names(species)
+    genomes = {name: write_genome(directory, name, genes, chromosomes) for name in names}
+    pairs = [(names[0], name) for name in names[1:]]
+    for name1, name2 in pairs:
+        write_blast(os.path.join(directory, f"{name1}_{name2}.blast"), genomes[name1], genomes[name2], peaks,
+                    hit_density, rng)
+    # The .cds and .pep files of name1 cover the genes of every species it is paired with
+    write_fasta(directory, names[0], [gene for name in names for ids in genomes[name] for gene in ids], rng)
+    with open(os.path.join(directory, "manifest.txt"), 'w') as file:
+        for name1, name2 in pairs:
+            file.write(f"{name1} {name2}\n")
+    return pairs
+
+def main():
+    """
+    Generate synthetic pipeline inputs.
+    """
+    parser = argparse.ArgumentParser(description="Generate synthetic .gff, .len, .blast and CDS/PEP FASTA inputs")
+    parser.add_argument("directory", help="Directory the inputs are written to")
+    parser.add_argument("--species", type=int, default=2, help="Number of species; S1 is paired with each other "
+                                                                 "one (default: 2)")
+    parser.add_argument("--genes", type=int, default=2000, help="Genes per species (default: 2000)")
+    parser.add_argument("--chromosomes", type=int, default=4, help="Chromosomes per species (default: 4)")
+    parser.add_argument("--hit-density", type=float, default=2.0,
+                        help="Mean number of random BLAST hits per gene (default: 2)")
+    parser.add_argument("--peaks", type=int, default=2, help="Number of Ks peaks (default: 2)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the random generator (default: 1)")
+    args = parser.parse_args()
+    try:
+        pairs = generate_inputs(args.directory, args.species, args.genes, args.chromosomes, args.hit_density,
+                                args.peaks, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Inputs of {len(pairs)} pairs written to {args.directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import subprocess
+import tempfile
+
+from generate_inputs import generate_inputs
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PIPELINE = os.path.join(os.path.dirname(BENCHMARK_DIR), "wgdi_pipeline_linux.py")
+DEFAULT_STUB_SECONDS = "default=0.05,icl=0.3,ks=0.3"
+
+def parse_int_list(text):
+    """
+    Parse a comma-separated list of integers.
+    :param text: The list as text
+    :return: A list of ints
+    """
+    return [int(value) for value in text.split(',') if value.strip()]
+
+def run_pipeline(workdir, args, env):
+    """
+    Run the pipeline once and measure it.
+    :param workdir: Directory the pipeline runs in
+    :param args: Arguments of the pipeline
+    :param env: Environment of the pipeline
+    :return: A dictionary with the 'wall_seconds' and 'max_rss_kb' of the pipeline process and its stages,
+             and the 'stages' of its run report
+    """
+    started = time.monotonic()
+    with open(os.path.join(workdir, "pipeline.log"), 'a') as log:
+        process = subprocess.Popen([sys.executable, PIPELINE] + args, cwd=workdir, env=env, stdout=log,
+                                   stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+        _, wait_status, usage = os.wait4(process.pid, 0)
+    wall_seconds = time.monotonic() - started
+    with open(os.path.join(workdir, "batch_run_report.json"), 'r') as file:
+        stages = json.load(file)['stages']
+    return {'wall_seconds': wall_seconds, 'max_rss_kb': usage.ru_maxrss, 'stages': stages,
+            'exit_status': os.waitstatus_to_exitcode(wait_status)}
+
+def run_scenario(workdir, pairs, peaks, jobs, options, env):
+    """
+    Run a benchmark scenario: generate the inputs, run the pipeline from scratch (cold),
+    then again with every stage cached (warm).
+    :param workdir: Directory the scenario runs in
+    :param pairs: Number of species pairs
+    :param peaks: Number of Ks peaks per pair
+    :param jobs: Number of stages running at the same time, and of CPUs
+    :param options: The parsed command line options
+    :param env: Environment of the pipeline
+    :return: A dictionary of metrics
+    """
+    generate_inputs(workdir, pairs + 1, options.genes, options.chromosomes, options.hit_density, peaks,
+                    options.seed)
+    args = ['--manifest', 'manifest.txt', '--max-peaks', str(peaks), '-j', str(jobs), '--cpus', str(jobs)]
+    cold = run_pipeline(workdir, args, env)
+    warm = run_pipeline(workdir, args, env)
+    cached = sum(1 for stage in warm['stages'] if stage['status'] == 'cached')
+    return {
+        'pairs': pairs, 'peaks': peaks, 'jobs': jobs,
+        'stages': len(cold['stages']),
+        'failed': sum(1 for stage in cold['stages'] + warm['stages'] if stage['status'] in ('failed', 'skipped')),
+        'cold_seconds': round(cold['wall_seconds'], 3),
+        'warm_seconds': round(warm['wall_seconds'], 3),
+        'stage_seconds': round(sum(stage['wall_seconds'] for stage in cold['stages']), 3),
+        'cache_hit_rate': round(cached / len(warm['stages']), 3) if warm['stages'] else 0,
+        'max_rss_mb': round(max([cold['max_rss_kb']] + [stage['max_rss_kb'] for stage in cold['stages']]) / 1024, 1),
+    }
+
+def compare_to_baseline(results, baseline, tolerance, slack_seconds=0.5):
+    """
+    Find the metrics of a benchmark that regressed from a baseline.
+    A time or memory regresses when it exceeds the baseline by more than tolerance (and, for times,
+    slack_seconds); the cache hit rate regresses when it drops.
+    :param results: The benchmark results
+    :param baseline: The baseline results
+    :param tolerance: Allowed relative increase
+    :param slack_seconds: Allowed absolute increase of times, for short runs
+    :return: A list of messages, one per regression
+    """
+    regressions = []
+    base_scenarios = {scenario['name']: scenario for scenario in baseline['scenarios']}
+    for scenario in results['scenarios']:
+        base = base_scenarios.get(scenario['name'])
+        if base is None:
+            continue
+        for metric in ('cold_seconds', 'warm_seconds'):
+            if scenario[metric] > base[metric] * (1 + tolerance) + slack_seconds:
+                regressions.append(f"{scenario['name']}: {metric} {scenario[metric]} > {base[metric]}")
+        if scenario['max_rss_mb'] > base['max_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{scenario['name']}: max_rss_mb {scenario['max_rss_mb']} > {base['max_rss_mb']}")
+        if scenario['cache_hit_rate'] < base['cache_hit_rate'] - 0.01:
+            regressions.append(f"{scenario['name']}: cache_hit_rate {scenario['cache_hit_rate']} < "
+                               f"{base['cache_hit_rate']}")
+        if scenario['failed'] > base['failed']:
+            regressions.append(f"{scenario['name']}: {scenario['failed']} failed or skipped stages")
+    return regressions
+
+def print_results(results):
+    """
+    Print a table of the benchmark results.
+    :param results: The benchmark results
+    """
+    print(f"{'scenario':<22} {'stages':>6} {'failed':>6} {'cold':>8} {'warm':>8} {'stages':>8} {'hits':>6} {'RSS':>8}")
+    for scenario in results['scenarios']:
+        print(f"{scenario['name']:<22} {scenario['stages']:>6} {scenario['failed']:>6} "
+              f"{scenario['cold_seconds']:>7.2f}s {scenario['warm_seconds']:>7.2f}s {scenario['stage_seconds']:>7.2f}s "
+              f"{scenario['cache_hit_rate']:>6.0%} {scenario['max_rss_mb']:>6.0f}MB")
+
+def main():
+    """
+    Benchmark the pipeline end to end on synthetic inputs with the stub wgdi.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the wall time, concurrency scaling, cache hit rate "
+                                                 "and memory of the pipeline on synthetic inputs with a stub wgdi")
+    parser.add_argument("--pairs", type=parse_int_list, default=[1, 4], metavar="N,N",
+                        help="Numbers of species pairs (default: 1,4)")
+    parser.add_argument("--peaks", type=parse_int_list, default=[1, 2], metavar="N,N",
+                        help="Numbers of Ks peaks per pair (default: 1,2)")
+    parser.add_argument("--jobs", type=parse_int_list, default=[1, 4], metavar="N,N",
+                        help="Numbers of concurrent stages and CPUs (default: 1,4)")
+    parser.add_argument("--genes", type=int, default=2000, help="Genes per species (default: 2000)")
+    parser.add_argument("--chromosomes", type=int, default=4, help="Chromosomes per species (default: 4)")
+    parser.add_argument("--hit-density", type=float, default=2.0,
+                        help="Mean number of random BLAST hits per gene (default: 2)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the input generator (default: 1)")
+    parser.add_argument("--stub-seconds", default=DEFAULT_STUB_SECONDS, metavar="SPEC",
+                        help=f"Runtime of the stub wgdi subcommands (default: {DEFAULT_STUB_SECONDS})")
+    parser.add_argument("--stub-busy", action="store_true", help="Have the stub wgdi burn CPU instead of sleeping")
+    parser.add_argument("--output", metavar="FILE", help="Save the results as JSON")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="Compare the results to a baseline saved with --output and exit with status 1 "
+                             "if a scenario regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative increase of times and memory over the baseline (default: 0.25)")
+    parser.add_argument("--keep", metavar="DIR", help="Run the scenarios in DIR and keep their files")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PATH=BENCHMARK_DIR + os.pathsep + os.environ.get('PATH', ''),
+               WGDI_STUB_SECONDS=args.stub_seconds, WGDI_STUB_BUSY='1' if args.stub_busy else '0')
+    results = {'environment': {'python': platform.python_version(), 'cpus': os.cpu_count(),
+                               'platform': platform.platform()},
+               'settings': {'genes': args.genes, 'chromosomes': args.chromosomes, 'hit_density': args.hit_density,
+                            'seed': args.seed, 'stub_seconds': args.stub_seconds, 'stub_busy': args.stub_busy},
+               'scenarios': []}
+    with tempfile.TemporaryDirectory(prefix="wgdi_benchmark_") as scratch:
+        root = args.keep or scratch
+        for pairs, peaks, jobs in itertools.product(args.pairs, args.peaks, args.jobs):
+            name = f"pairs{pairs}_peaks{peaks}_jobs{jobs}"
+            print(f"Running {name}", flush=True)
+            scenario = run_scenario(os.path.join(root, name), pairs, peaks, jobs, args, env)
+            results['scenarios'].append(dict(name=name, **scenario))
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+        print(f"Results saved to {args.output}")
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        if baseline['settings'] != results['settings'] or baseline['environment']['cpus'] != os.cpu_count():
+            print("Warning: the baseline was measured with other settings or on another number of CPUs")
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regression from {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wgdi_pipeline_linux as pipeline
+
+def write_in_place(path, text):
+    # Truncate and write through the existing inode, as wgdi does
+    with open(path, 'r+') as file:
+        file.truncate()
+        file.write(text)
+    return True
+
+def test_wgdi_stage_does_not_rewrite_published_files(tmp_path):
+    output_file = str(tmp_path / "pair" / "dotplot.pdf")
+    os.makedirs(os.path.dirname(output_file))
+    with open(output_file, 'w') as file:
+        file.write("old figure")
+    store = pipeline.new_artifact_store(str(tmp_path / "store"), str(tmp_path / "pair" / "artifacts.json"))
+    pipeline.publish_artifacts(store, [output_file])
+    digest = store['entries'][output_file]['digest']
+    object_file = os.path.join(str(tmp_path / "store"), 'objects', digest[:2], digest[2:])
+    assert os.path.samefile(output_file, object_file)
+
+    # A later run without the artifact store
+    conf_file = str(tmp_path / "pair" / "dotplot.conf")
+    stage = pipeline.make_stage('dotplot', [], [output_file], lambda conf: write_in_place(output_file, "new figure"),
+                                conf=lambda: conf_file)
+    assert pipeline.run_stages([stage], 1) == {'dotplot': 'done'}
+    with open(output_file) as file:
+        assert file.read() == "new figure"
+    with open(object_file) as file:
+        assert file.read() == "old figure"
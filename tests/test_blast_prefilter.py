@@ -0,0 +1,89 @@
+import os
+import sys
+import random
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wgdi_pipeline_linux as pipeline
+
+def write_genome(path, species, genes):
+    with open(path, 'w') as file:
+        for i in range(genes):
+            file.write(f"1\t{species}g{i}\t{i * 1000 + 1}\t{i * 1000 + 900}\t+\t{i + 1}\t{species}g{i}\n")
+
+def write_blast(path, rng, queries, hits_per_query, scores, distinct=False):
+    with open(path, 'w') as file:
+        for i in range(queries):
+            hit_scores = rng.sample(scores, hits_per_query) if distinct else rng.choices(scores, k=hits_per_query)
+            for j, score in zip(rng.sample(range(200), hits_per_query), hit_scores):
+                file.write(f"Ag{i}\tBg{j}\t90\t300\t10\t0\t1\t300\t1\t300\t1e-{rng.randint(6, 90)}\t{score}\n")
+            # Hits wgdi drops: weak, or with a gene missing from the GFF files
+            file.write(f"Ag{i}\tBg{i}\t30\t50\t20\t1\t1\t50\t1\t50\t1e-2\t{rng.randint(20, 90)}\n")
+            file.write(f"Ag{i}\tCg{i}\t90\t300\t10\t0\t1\t300\t1\t300\t1e-50\t400\n")
+
+def wgdi_newblast(blast_file, gff1_file, gff2_file):
+    """
+    Filter hits as wgdi 0.75 base.newblast does.
+    """
+    gff1 = pd.read_csv(gff1_file, sep="\t", header=None, index_col=1)
+    gff2 = pd.read_csv(gff2_file, sep="\t", header=None, index_col=1)
+    blast = pd.read_csv(blast_file, sep="\t", header=None)
+    blast = blast[(blast[11] >= pipeline.BLAST_SCORE) & (blast[10] < pipeline.BLAST_EVALUE) & (blast[1] != blast[0])]
+    blast = blast[(blast[0].isin(gff1.index)) & (blast[1].isin(gff2.index))]
+    return blast.drop_duplicates(subset=[0, 1], keep='first')
+
+def wgdi_genomes_selection(blast_file, gff1_file, gff2_file, repeat_number):
+    """
+    Select hits as wgdi 0.75 collinearity does in genomes mode: base.newblast, then for every query
+    group.sort_values(by=[11], ascending=[False])[:repeat_number].
+    :return: A dictionary mapping every query to the list of its (subject, score) pairs, best first
+    """
+    selection = {}
+    for (query,), group in wgdi_newblast(blast_file, gff1_file, gff2_file).groupby([0]):
+        best = group.sort_values(by=[11], ascending=[False])[:repeat_number]
+        selection[query] = list(zip(best[1], best[11]))
+    return selection
+
+@pytest.fixture
+def inputs(tmp_path):
+    write_genome(tmp_path / "A.gff", "A", 50)
+    write_genome(tmp_path / "B.gff", "B", 200)
+    return tmp_path
+
+def prefilter(tmp_path):
+    filtered_file = tmp_path / "filtered.blast"
+    pipeline.prefilter_blast_file(str(tmp_path / "A_B.blast"), str(tmp_path / "A.gff"), str(tmp_path / "B.gff"),
+                                  str(filtered_file), str(tmp_path / "columns"))
+    return filtered_file
+
+@pytest.mark.parametrize("repeat_number", [10, 20, 50])
+def test_wgdi_selects_the_same_hits_without_ties(inputs, repeat_number):
+    write_blast(inputs / "A_B.blast", random.Random(1), 50, 40, list(range(100, 10000)), distinct=True)
+    filtered_file = prefilter(inputs)
+    full = wgdi_genomes_selection(inputs / "A_B.blast", inputs / "A.gff", inputs / "B.gff", repeat_number)
+    assert wgdi_genomes_selection(filtered_file, inputs / "A.gff", inputs / "B.gff", repeat_number) == full
+
+@pytest.mark.parametrize("repeat_number", [10, 20, 50])
+def test_wgdi_selects_the_same_hits_on_ties(inputs, repeat_number):
+    # More than 16 hits per query, where pandas' quicksort is no longer stable, tied on few scores
+    write_blast(inputs / "A_B.blast", random.Random(2), 50, 40, [100, 150, 200, 250])
+    filtered_file = prefilter(inputs)
+    full = wgdi_genomes_selection(inputs / "A_B.blast", inputs / "A.gff", inputs / "B.gff", repeat_number)
+    assert wgdi_genomes_selection(filtered_file, inputs / "A.gff", inputs / "B.gff", repeat_number) == full
+
+def test_prefilter_keeps_the_rows_of_newblast(inputs):
+    write_blast(inputs / "A_B.blast", random.Random(3), 50, 40, [100, 150, 200, 250])
+    with open(inputs / "A_B.blast", 'a') as file:
+        # At the score and e-value bounds, a self hit, and a second hit of the same pair
+        file.write("Ag0\tBg199\t90\t300\t10\t0\t1\t300\t1\t300\t1e-10\t99.99999\n")
+        file.write("Ag1\tBg199\t90\t300\t10\t0\t1\t300\t1\t300\t1e-10\t100.0\n")
+        file.write("Ag2\tBg199\t90\t300\t10\t0\t1\t300\t1\t300\t1e-5\t300\n")
+        file.write("Ag3\tAg3\t90\t300\t10\t0\t1\t300\t1\t300\t1e-10\t300\n")
+        file.write("Ag1\tBg199\t90\t300\t10\t0\t1\t300\t1\t300\t1e-90\t900\n")
+    filtered_file = prefilter(inputs)
+    expected = wgdi_newblast(inputs / "A_B.blast", inputs / "A.gff", inputs / "B.gff")
+    filtered = pd.read_csv(filtered_file, sep="\t", header=None)
+    assert filtered.values.tolist() == expected.values.tolist()
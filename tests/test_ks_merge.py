@@ -0,0 +1,105 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wgdi_pipeline_linux as pipeline
+
+PAIRS = [("Ag1", "Bg1"), ("Ag2", "Bg2"), ("Ag3", "Bg3"), ("Ag4", "Bg4")]
+
+def write_collinearity(path):
+    with open(path, 'w') as file:
+        file.write("# Alignment 1: score=200 pvalue=0.01 N=4 1&1 plus\n")
+        for gene1, gene2 in PAIRS:
+            file.write(f"{gene1} 1 {gene2} 1 1\n")
+
+def write_shard(path, pairs):
+    with open(path, 'w') as file:
+        file.write(pipeline.KS_HEADER)
+        for i, (gene1, gene2) in enumerate(pairs):
+            file.write(f"{gene1}\t{gene2}\t0.1\t0.{i + 2}\t0.1\t0.{i + 2}\n")
+
+def age(path):
+    os.utime(path, (1000000000, 1000000000))
+
+def test_merge_keeps_the_collinearity_order(tmp_path):
+    write_collinearity(tmp_path / "pairs.collinearity")
+    write_shard(tmp_path / "shard_0.ks", [PAIRS[2], PAIRS[3]])
+    write_shard(tmp_path / "shard_1.ks", [PAIRS[0], PAIRS[1]])
+    ks_file = tmp_path / "pairs.ks"
+    pipeline.merge_ks_shards(str(tmp_path / "pairs.collinearity"),
+                             [str(tmp_path / "shard_0.ks"), str(tmp_path / "shard_1.ks")], str(ks_file))
+    lines = ks_file.read_text().splitlines()
+    assert lines[0] + "\n" == pipeline.KS_HEADER
+    assert [tuple(line.split('\t')[:2]) for line in lines[1:]] == PAIRS
+
+def test_unchanged_merge_keeps_the_ks_file(tmp_path):
+    write_collinearity(tmp_path / "pairs.collinearity")
+    write_shard(tmp_path / "shard_0.ks", PAIRS[:2])
+    write_shard(tmp_path / "shard_1.ks", PAIRS[2:])
+    shard_ks_files = [str(tmp_path / "shard_0.ks"), str(tmp_path / "shard_1.ks")]
+    ks_file = tmp_path / "pairs.ks"
+    pipeline.merge_ks_shards(str(tmp_path / "pairs.collinearity"), shard_ks_files, str(ks_file))
+    age(ks_file)
+    pipeline.merge_ks_shards(str(tmp_path / "pairs.collinearity"), shard_ks_files, str(ks_file))
+    assert os.stat(ks_file).st_mtime == 1000000000
+    write_shard(tmp_path / "shard_1.ks", PAIRS[2:3])
+    pipeline.merge_ks_shards(str(tmp_path / "pairs.collinearity"), shard_ks_files, str(ks_file))
+    assert os.stat(ks_file).st_mtime != 1000000000
+    assert len(ks_file.read_text().splitlines()) == 4
+
+def write_fasta(path, genes):
+    with open(path, 'w') as file:
+        for gene in genes:
+            file.write(f">{gene}\nATGAAACCC{gene}\n")
+
+def test_merge_from_the_ks_store_keeps_the_ks_file(tmp_path):
+    write_collinearity(tmp_path / "pairs.collinearity")
+    genes = [gene for pair in PAIRS for gene in pair]
+    write_fasta(tmp_path / "pairs.cds", genes)
+    write_fasta(tmp_path / "pairs.pep", genes)
+    ks_store = {'file': str(tmp_path / "ks.sqlite"), 'cds': str(tmp_path / "pairs.cds"),
+                'pep': str(tmp_path / "pairs.pep"), 'aligner': pipeline.KS_ALIGNER}
+    write_shard(tmp_path / "shard_0.ks", PAIRS)
+    ks_file = tmp_path / "pairs.ks"
+    pipeline.merge_ks_shards(str(tmp_path / "pairs.collinearity"), [str(tmp_path / "shard_0.ks")], str(ks_file),
+                             ks_store)
+    merged = ks_file.read_text()
+    age(ks_file)
+    # Every pair is now in the store, so the shards compute nothing
+    write_shard(tmp_path / "shard_0.ks", [])
+    pipeline.merge_ks_shards(str(tmp_path / "pairs.collinearity"), [str(tmp_path / "shard_0.ks")], str(ks_file),
+                             ks_store)
+    assert ks_file.read_text() == merged
+    assert os.stat(ks_file).st_mtime == 1000000000
+
+def empty_shard_stage(tmp_path):
+    pairs_file = str(tmp_path / "pairs_1.txt")
+    with open(pairs_file, 'w') as file:
+        file.write("# Alignment 1: score=200 pvalue=0.01 N=0 1&1 plus\n")
+    shard_ks_file = str(tmp_path / "ks_1.ks")
+    # No wgdi is run for a shard without gene pairs, so the option does not matter
+    stage = pipeline.make_wgdi_stage('ks_shard_1', [pairs_file], [shard_ks_file], '--no-such-option',
+                                     conf=lambda: str(tmp_path / "ks_1.conf"),
+                                     before=lambda conf_file: pipeline.write_empty_ks_shard(pairs_file, shard_ks_file))
+    return stage, shard_ks_file
+
+def test_empty_shard_skips_wgdi(tmp_path):
+    stage, shard_ks_file = empty_shard_stage(tmp_path)
+    assert pipeline.run_stages([stage], 1) == {'ks_shard_1': 'done'}
+    with open(shard_ks_file) as file:
+        assert file.read() == pipeline.KS_HEADER
+
+def test_empty_shard_skips_wgdi_async(tmp_path):
+    stage, shard_ks_file = empty_shard_stage(tmp_path)
+    assert asyncio.run(pipeline.run_stages_async([stage], 1)) == {'ks_shard_1': 'done'}
+    with open(shard_ks_file) as file:
+        assert file.read() == pipeline.KS_HEADER
+
+def test_shards_run_wgdi_as_commands():
+    found_files = {'cds': 'S1_S2.cds', 'pep': 'S1_S2.pep'}
+    stages = pipeline.build_ks_stages('S1', 'S2', found_files, {'ks_shards': 3})
+    shards = [stage for stage in stages if stage['name'].startswith('ks_shard_')]
+    assert len(shards) == 3
+    assert all(stage['command']['option'] == '-ks' for stage in shards)
@@ -0,0 +1,85 @@
+import os
+import sys
+import random
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wgdi_pipeline_linux as pipeline
+
+COLUMNS = ['id', 'chr1', 'chr2', 'start1', 'end1', 'start2', 'end2', 'pvalue', 'length', 'ks_median', 'homo1']
+
+def wgdi_kspeaks_selection(bkinfo, pvalue, block_length=3, tandem='true', tandem_length=200, multiple=1,
+                           homo=(-1, 1), ks_area=(-1, 3)):
+    """
+    Select blocks as wgdi 0.75 kspeaks.run does: length > block_length and pvalue < pvalue, tandem blocks
+    removed unless base.str_to_bool(tandem), then homo{multiple} and ks_median within their bounds, inclusive.
+    """
+    bkinfo = bkinfo.copy()
+    bkinfo['chr1'] = bkinfo['chr1'].astype(str)
+    bkinfo['chr2'] = bkinfo['chr2'].astype(str)
+    bkinfo['length'] = bkinfo['length'].astype(int)
+    bkinfo = bkinfo[(bkinfo['length'] > block_length) & (bkinfo['pvalue'] < pvalue)]
+    if str(tandem).strip().lower() != 'true':
+        group = bkinfo[bkinfo['chr1'] == bkinfo['chr2']].copy()
+        group.loc[:, 'start'] = group.loc[:, 'start1'] - group.loc[:, 'start2']
+        group.loc[:, 'end'] = group.loc[:, 'end1'] - group.loc[:, 'end2']
+        bkinfo = bkinfo.drop(group[(group['start'].abs() <= tandem_length) |
+                                   (group['end'].abs() <= tandem_length)].index)
+    bkinfo = bkinfo[(bkinfo[f'homo{multiple}'] >= homo[0]) & (bkinfo[f'homo{multiple}'] <= homo[1])]
+    bkinfo = bkinfo[(bkinfo['ks_median'] >= ks_area[0]) & (bkinfo['ks_median'] <= ks_area[1])]
+    return list(bkinfo['id'])
+
+def write_kspeaks_conf(directory, name, **options):
+    conf_file = os.path.join(directory, f"{name}.conf")
+    with open(conf_file, 'w') as file:
+        file.write("[kspeaks]\n")
+        for key, value in dict(options, savefile=os.path.join(directory, f"{name}.csv")).items():
+            file.write(f"{key} = {value}\n")
+    return conf_file
+
+def native_selection(tmp_path, rows, **options):
+    blockinfo_file = tmp_path / "blockinfo.csv"
+    pd.DataFrame(rows, columns=COLUMNS).to_csv(blockinfo_file, index=False)
+    conf_file = write_kspeaks_conf(str(tmp_path), "kspeaks", **options)
+    pipeline.filter_kspeaks_blockinfo(str(blockinfo_file), [conf_file])
+    return list(pd.read_csv(tmp_path / "kspeaks.csv")['id'])
+
+def test_bounds_are_strict_like_wgdi(tmp_path):
+    rows = [
+        [1, 1, 2, 1, 50, 1, 50, 0.01, 5, 0.5, 0.1],
+        [2, 1, 2, 1, 50, 1, 50, 0.05, 10, 0.5, 0.1],
+        [3, 1, 2, 1, 50, 1, 50, 0.01, 10, 0.5, 0.1],
+    ]
+    assert native_selection(tmp_path, rows, pvalue=0.05, block_length=5) == [3]
+
+def test_block_length_defaults_to_3(tmp_path):
+    rows = [[1, 1, 2, 1, 50, 1, 50, 0.01, 3, 0.5, 0.1], [2, 1, 2, 1, 50, 1, 50, 0.01, 4, 0.5, 0.1]]
+    assert native_selection(tmp_path, rows, pvalue=0.05) == [2]
+
+@pytest.mark.parametrize("tandem, kept", [("true", [1, 2]), ("True", [1, 2]), ("false", [2]), ("no", [2]),
+                                          ("1", [2])])
+def test_tandem_like_str_to_bool(tmp_path, tandem, kept):
+    rows = [[1, 1, 1, 100, 500, 150, 550, 0.01, 10, 0.5, 0.1], [2, 1, 2, 100, 500, 150, 550, 0.01, 10, 0.5, 0.1]]
+    assert native_selection(tmp_path, rows, pvalue=0.05, tandem=tandem) == kept
+
+def test_matches_wgdi_selection_on_random_blocks(tmp_path):
+    rng = random.Random(1)
+    rows = []
+    for i in range(300):
+        chr1, chr2 = rng.randint(1, 3), rng.randint(1, 3)
+        start1, start2 = rng.randrange(0, 2000, 50), rng.randrange(0, 2000, 50)
+        rows.append([i + 1, chr1, chr2, start1, start1 + 400, start2, start2 + 400,
+                     rng.choice([0.01, 0.05, 0.2]), rng.randint(2, 8), round(rng.uniform(0, 4), 2),
+                     round(rng.uniform(-1.2, 1.2), 2)])
+    bkinfo = pd.DataFrame(rows, columns=COLUMNS)
+    for options in [dict(pvalue=0.05, block_length=5), dict(pvalue=0.05, tandem='false', ks_area='0,3'),
+                    dict(pvalue=0.2, homo='-0.5,0.5', tandem='false', tandem_length=300)]:
+        expected = wgdi_kspeaks_selection(
+            bkinfo, options['pvalue'], options.get('block_length', 3), options.get('tandem', 'true'),
+            options.get('tandem_length', 200),
+            homo=[float(v) for v in options.get('homo', '-1,1').split(',')],
+            ks_area=[float(v) for v in options.get('ks_area', '-1,3').split(',')])
+        assert native_selection(tmp_path, rows, **options) == expected
@@ -0,0 +1,68 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wgdi_pipeline_linux as pipeline
+
+# Injected Ks peaks as (centre, standard deviation, blocks), most prominent first; the tallest is not the first in
+# Ks order, so that max_peaks must pick by prominence
+PEAKS = [(1.2, 0.1, 500), (0.3, 0.05, 150), (2.5, 0.2, 100)]
+
+def write_kspeaks(path, peaks, seed=1):
+    rng = np.random.default_rng(seed)
+    ks = np.concatenate([rng.normal(centre, sd, blocks) for centre, sd, blocks in peaks])
+    with open(path, 'w') as file:
+        file.write("id,chr1,chr2,length,pvalue,ks_median\n")
+        for i, value in enumerate(rng.permutation(ks)):
+            file.write(f"{i + 1},1,2,10,0.01,{value:.4f}\n")
+    return str(path)
+
+def covers(window, centre):
+    return window[0] < centre < window[1]
+
+def test_windows_cover_the_injected_peaks(tmp_path):
+    kspeaks_file = write_kspeaks(tmp_path / "kspeaks.csv", PEAKS)
+    windows = pipeline.detect_ks_peaks(kspeaks_file)
+    assert len(windows) == len(PEAKS)
+    # In increasing Ks order, one window per injected peak, without overlap
+    for window, (centre, _, _) in zip(windows, sorted(PEAKS)):
+        assert covers(window, centre)
+    assert all(left[1] <= right[0] for left, right in zip(windows, windows[1:]))
+
+@pytest.mark.parametrize("max_peaks", [1, 2])
+def test_max_peaks_keeps_the_most_prominent(tmp_path, max_peaks):
+    kspeaks_file = write_kspeaks(tmp_path / "kspeaks.csv", PEAKS)
+    windows = pipeline.detect_ks_peaks(kspeaks_file, max_peaks)
+    kept = sorted(centre for centre, _, _ in PEAKS[:max_peaks])
+    assert len(windows) == max_peaks
+    assert windows == sorted(windows)
+    for window, centre in zip(windows, kept):
+        assert covers(window, centre)
+
+def test_small_bumps_are_not_peaks(tmp_path):
+    kspeaks_file = write_kspeaks(tmp_path / "kspeaks.csv", [(0.8, 0.1, 500), (2.5, 0.05, 3)])
+    windows = pipeline.detect_ks_peaks(kspeaks_file)
+    assert len(windows) == 1 and covers(windows[0], 0.8)
+
+def test_too_few_values_raise(tmp_path):
+    kspeaks_file = write_kspeaks(tmp_path / "kspeaks.csv", [(0.8, 0, 5)])
+    with pytest.raises(ValueError):
+        pipeline.detect_ks_peaks(kspeaks_file)
+
+def test_resolve_peaks_detects_without_a_terminal(tmp_path, monkeypatch):
+    kspeaks_file = write_kspeaks(tmp_path / "kspeaks.csv", PEAKS)
+    monkeypatch.setattr(sys, 'stdin', io.StringIO("3\n"))
+    assert pipeline.resolve_peaks(kspeaks_file, {'max_peaks': 2}) == pipeline.detect_ks_peaks(kspeaks_file, 2)
+
+def test_resolve_peaks_prefers_the_given_peaks(tmp_path, monkeypatch):
+    kspeaks_file = write_kspeaks(tmp_path / "kspeaks.csv", PEAKS)
+    peaks_file = tmp_path / "peaks.txt"
+    peaks_file.write_text("# start,end\n1,1.5\n")
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(""))
+    options = {'peaks': [(0.1, 0.5)], 'peaks_file': str(peaks_file), 'auto': True}
+    assert pipeline.resolve_peaks(kspeaks_file, options) == [(0.1, 0.5), (1, 1.5)]
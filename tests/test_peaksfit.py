@@ -0,0 +1,47 @@
+import os
+import sys
+import json
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wgdi_pipeline_linux as pipeline
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+# Parameters and R-square printed by wgdi 0.75 -pf for peaksfit_blockinfo.csv, one entry per mode and area
+with open(os.path.join(DATA_DIR, "peaksfit_wgdi_0.75.json"), 'r') as file:
+    REFERENCE = json.load(file)
+
+def write_peaksfit_conf(directory, blockinfo_file, mode, area, bins_number):
+    conf_file = os.path.join(directory, f"peaksfit_{mode}_{area}.conf")
+    with open(conf_file, 'w') as file:
+        file.write(f"[peaksfit]\nblockinfo = {blockinfo_file}\nmode = {mode}\nbins_number = {bins_number}\n"
+                   f"area = {area}\n")
+    return conf_file
+
+def fit_reference(directory, blockinfo_file):
+    conf_files = [write_peaksfit_conf(directory, blockinfo_file, ref['mode'], ref['area'], ref['bins_number'])
+                  for ref in REFERENCE]
+    return pipeline.fit_ks_peaks(conf_files)
+
+def assert_matches_reference(fits):
+    for fit, ref in zip(fits, REFERENCE):
+        assert fit['params'] == pytest.approx(ref['params'], rel=1e-6), (ref['mode'], ref['area'])
+        assert fit['r_square'] == pytest.approx(ref['r_square'], rel=1e-9), (ref['mode'], ref['area'])
+
+def test_fits_match_wgdi(tmp_path):
+    assert_matches_reference(fit_reference(str(tmp_path), os.path.join(DATA_DIR, "peaksfit_blockinfo.csv")))
+
+def test_total_mode_drops_only_a_leading_underscore(tmp_path):
+    # wgdi only drops the first character of the Ks lists that start with '_'
+    bkinfo = pd.read_csv(os.path.join(DATA_DIR, "peaksfit_blockinfo.csv"))
+    bkinfo.loc[::2, 'ks'] = bkinfo.loc[::2, 'ks'].str[1:]
+    bkinfo.to_csv(tmp_path / "blockinfo.csv", index=False)
+    assert_matches_reference(fit_reference(str(tmp_path), "blockinfo.csv"))
+    bkinfo.loc[1, 'ks'] = '_' + bkinfo.loc[1, 'ks']
+    bkinfo.to_csv(tmp_path / "blockinfo.csv", index=False)
+    conf_file = write_peaksfit_conf(str(tmp_path), "blockinfo.csv", 'total', '0,3', 200)
+    with pytest.raises(ValueError):
+        pipeline.fit_ks_peaks([conf_file])
@@ -1,645 +1,4330 @@
-import os
-import argparse
-import subprocess
-
-def search_files(name1, name2):
-    """
-    Search for .blast, .gff, .len, .cds, and .pep files under the current directory based on the given names.
-    :param name1: The first name
-    :param name2: The second name
-    :return: A dictionary containing the paths of the found files
-    """
-    current_dir = os.getcwd()  # Get the current working directory
-    found_files = {}
-
-    # Search for .blast file
-    blast_file_name = f"{name1}_{name2}.blast"
-    if os.path.exists(os.path.join(current_dir, blast_file_name)):
-        found_files['blast'] = blast_file_name
-    # Search for .gff files
-    gff1_file_name = f"{name1}.gff"
-    if os.path.exists(os.path.join(current_dir, gff1_file_name)):
-        found_files['gff1'] = gff1_file_name
-    gff2_file_name = f"{name2}.gff"
-    if os.path.exists(os.path.join(current_dir, gff2_file_name)):
-        found_files['gff2'] = gff2_file_name
-    # Search for .len files
-    len1_file_name = f"{name1}.len"
-    if os.path.exists(os.path.join(current_dir, len1_file_name)):
-        found_files['lens1'] = len1_file_name
-    len2_file_name = f"{name2}.len"
-    if os.path.exists(os.path.join(current_dir, len2_file_name)):
-        found_files['lens2'] = len2_file_name
-    # Search for .cds file, default is based on name1
-    cds_file_name = f"{name1}_cds.fasta"
-    if os.path.exists(os.path.join(current_dir, cds_file_name)):
-        found_files['cds'] = cds_file_name
-    # Search for .pep file, default is based on name1
-    pep_file_name = f"{name1}_pep.fasta"
-    if os.path.exists(os.path.join(current_dir, pep_file_name)):
-        found_files['pep'] = pep_file_name
-    return found_files
-
-def create_dotplot_conf_file(name1, name2, found_files):
-    """
-    Create a configuration file in the current directory
-    with the filename format {name1}_{name2}_dotplot.conf.
-    :param name1: The first name
-    :param name2: The second name
-    :param found_files: A dictionary containing the paths of the found files
-    """
-    file_name = f"{name1}_{name2}_dotplot.conf"
-    file_path = os.path.join(os.getcwd(), file_name)
-    
-    with open(file_path, 'w') as file:
-        file.write("[dotplot]\n")
-        file.write(f"blast = {found_files.get('blast', '')}\n")
-        file.write(f"gff1 = {found_files.get('gff1', '')}\n")
-        file.write(f"gff2 = {found_files.get('gff2', '')}\n")
-        file.write(f"lens1 = {found_files.get('lens1', '')}\n")
-        file.write(f"lens2 = {found_files.get('lens2', '')}\n")
-        file.write(f"genome1_name = {name1}\n")
-        file.write(f"genome2_name = {name2}\n")
-        file.write("multiple = 1\n")
-        file.write("score = 100\n")
-        file.write("evalue = 1e-5\n")
-        file.write("repeat_number = 10\n")
-        file.write("position = order\n")
-        file.write("blast_reverse = false\n")
-        file.write("ancestor_left = none\n")
-        file.write("ancestor_top = none\n")
-        file.write("markersize = 0.5\n")
-        file.write("figsize = 10,10\n")
-        file.write(f"savefig = {name1}_{name2}_dotplot.pdf\n")
-    
-    print(f"File created: {file_name}")
-    return file_name
-def create_icl_conf_file(name1, name2, found_files):
-    """
-    Create a configuration file in the current directory
-    with the filename format {name1}_{name2}_icl.conf.
-    :param name1: The first name
-    :param name2: The second name
-    :param found_files: A dictionary containing the paths of the found files
-    """
-    file_name = f"{name1}_{name2}_icl.conf"
-    file_path = os.path.join(os.getcwd(), file_name)
-    
-    with open(file_path, 'w') as file:
-        file.write("[collinearity]\n")
-       
-        file.write(f"gff1 = {found_files.get('gff1', '')}\n")
-        file.write(f"gff2 = {found_files.get('gff2', '')}\n")
-        file.write(f"lens1 = {found_files.get('lens1', '')}\n")
-        file.write(f"lens2 = {found_files.get('lens2', '')}\n")
-        file.write(f"blast = {found_files.get('blast', '')}\n")
-        file.write("blast_reverse = false\n")
-        # file.write(f"genome1_name = {name1}\n")
-        # file.write(f"genome2_name = {name2}\n")
-        file.write("multiple = 1\n")
-        file.write("process = 8\n")
-        file.write("evalue = 1e-5\n")
-        file.write("score = 100\n")
-        file.write("grading = 50,40,25\n")
-        file.write("mg=40,40\n")
-        file.write("pvalue=0.2\n")
-        file.write("repeat_number = 20\n")
-        file.write("position = order\n")
-        file.write(f"savefile = {name1}_{name2}_collinearity.txt\n")
-    
-    print(f"File created: {file_name}")
-    return file_name
-def create_ks_conf_file(name1, name2, found_files):
-    """
-    Create a configuration file in the current directory 
-    with the filename format {name1}_ks.conf.
-    :param name1: The first name
-    :param name2: The second name
-    :param found_files: A dictionary containing the paths of the found files
-    """
-    file_name = f"{name1}_ks.conf"
-    file_path = os.path.join(os.getcwd(), file_name)
-    
-    with open(file_path, 'w') as file:
-        file.write("[ks]\n")
-        file.write(f"cds_file = {found_files.get('cds', '')}\n")
-        file.write(f"pep_file = {found_files.get('pep', '')}\n")
-        file.write("align_software = muscle\n")
-        file.write(f"pairs_file = {name1}_{name2}_collinearity.txt\n")
-        file.write(f"ks_file = {name1}_ks_result.ks\n")
-    
-    print(f"File created: {file_name}")
-    return file_name
-
-def create_blockinfo_conf_file(name1, name2, found_files):
-    """
-    Create a configuration file in the current directory 
-    with the filename format {name1}_{name2}_blockinfo.conf.
-    :param name1: The first name
-    :param name2: The second name
-    :param found_files: A dictionary containing the paths of the found files
-    """
-    file_name = f"{name1}_{name2}_blockinfo.conf"
-    file_path = os.path.join(os.getcwd(), file_name)
-    
-    with open(file_path, 'w') as file:
-        file.write("[blockinfo]\n")
-        file.write(f"blast = {found_files.get('blast', '')}\n")
-        file.write(f"gff1 = {found_files.get('gff1', '')}\n")
-        file.write(f"gff2 = {found_files.get('gff2', '')}\n")
-        file.write(f"lens1 = {found_files.get('lens1', '')}\n")
-        file.write(f"lens2 = {found_files.get('lens2', '')}\n")
-        file.write(f"collinearity = {name1}_{name2}_collinearity.txt\n")
-        file.write("evalue = 1e-5\n")
-        file.write("score = 100\n")
-        file.write("repeat_number = 20\n")
-        file.write("position = order\n")
-        file.write(f"ks = {name1}_ks_result.ks\n")
-        file.write(f"ks_col = ks_NG86\n")
-        file.write(f"savefile = {name1}_{name2}_blockinfo.csv\n")
-    
-    print(f"File created: {file_name}")
-    return file_name
-
-def create_blockks_conf_file(name1, name2, found_files):
-    """
-    Create a configuration file in the current directory 
-    with the filename format {name1}_{name2}_blockks.conf.
-    :param name1: The first name
-    :param name2: The second name
-    :param found_files: A dictionary containing the paths of the found files
-    """
-    file_name = f"{name1}_{name2}_blockks.conf"
-    file_path = os.path.join(os.getcwd(), file_name)
-    
-    with open(file_path, 'w') as file:   
-        file.write("[blockks]\n")
-        file.write(f"lens1 = {found_files.get('lens1', '')}\n")
-        file.write(f"lens2 = {found_files.get('lens2', '')}\n")
-        file.write(f"genome1_name = {name1}\n")
-        file.write(f"genome2_name = {name2}\n")
-        file.write(f"blockinfo = {name1}_{name2}_blockinfo.csv\n")
-        file.write("pvalue = 0.05\n")
-        file.write("tandem = true\n")
-        file.write("tandem_length = 200\n")
-        file.write("makersize = 1\n")
-        file.write("area = 0,3\n")
-        file.write("block_length = 5\n")
-        file.write("figsize = 8,8\n")
-        file.write(f"savefig = {name1}_{name2}_blockks.pdf\n")
-    
-    print(f"File created: {file_name}")
-    return file_name
-
-def create_kspeaks_conf_file(name1, name2, found_files):
-    """
-    Create a configuration file in the current directory 
-    with the filename format {name1}_{name2}_kspeaks.conf.
-    :param name1: The first name
-    :param name2: The second name
-    :param found_files: A dictionary containing the paths of the found files
-    """
-    file_name = f"{name1}_{name2}_kspeaks.conf"
-    file_path = os.path.join(os.getcwd(), file_name)
-    
-    with open(file_path, 'w') as file:   
-        file.write("[kspeaks]\n")
-        file.write(f"blockinfo = {name1}_{name2}_blockinfo.csv\n")
-        file.write("pvalue = 0.05\n")
-        file.write("tandem = true\n") 
-        file.write("block_length = 5\n")
-        file.write("ks_area = 0,10\n")
-        file.write("multiple = 1\n")
-        file.write("homo = -1,1\n")
-        file.write("fontsize = 9\n")
-        file.write("area = 0,3\n")
-        file.write("figsize = 10,6.18\n")
-        
-        file.write(f"savefig = {name1}_{name2}_kspeaks_distri.pdf\n")
-        file.write(f"savefile = {name1}_{name2}_kspeaks_distri.csv\n")
-    
-    print(f"File created: {file_name}")
-    return file_name
-
-def create_filtered_kspeaks_conf_file(name1, name2, ksarea_start, ksarea_end, peak_num, found_files):
-    """
-    Create a configuration file in the current directory 
-    with the filename format {name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}.conf.
-    :param name1: The first name
-    :param name2: The second name
-    :param ksarea_start: The start value for the Ks area
-    :param ksarea_end: The end value for the Ks area
-    :param peak_num: The number of peaks (not used in the current implementation)
-    :param found_files: A dictionary containing the paths of the found files
-    """
-    file_name = f"{name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}.conf"
-    file_path = os.path.join(os.getcwd(), file_name)
-    
-    with open(file_path, 'w') as file:   
-        file.write("[kspeaks]\n")
-        file.write(f"blockinfo = {name1}_{name2}_blockinfo.csv\n")
-        file.write("pvalue = 0.05\n")
-        file.write("tandem = true\n") 
-        file.write("block_length = 5\n")
-        file.write(f"ks_area = {ksarea_start},{ksarea_end}\n")
-        file.write("multiple = 1\n")
-        file.write("homo = -1,1\n")
-        file.write("fontsize = 9\n")
-        file.write("area = 0,3\n")
-        file.write("figsize = 10,6.18\n")
-        file.write(f"savefig = {name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri.pdf\n")
-        file.write(f"savefile = {name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri.csv\n")
-    
-    print(f"File created: {file_name}")
-    return file_name
-
-def create_filtered_blockks_conf_file(name1, name2, ksarea_start, ksarea_end, peak_num, found_files):
-    """
-    Create a configuration file in the current directory 
-    with the filename format {name1}_{name2}_blockks_peaks_{peak_num}.conf.
-    :param name1: The first name
-    :param name2: The second name
-    :param ksarea_start: The start value for the Ks area
-    :param ksarea_end: The end value for the Ks area
-    :param peak_num: The number of peaks
-    :param found_files: A dictionary containing the paths of the found files
-    """
-    file_name = f"{name1}_{name2}_blockks_peaks_{peak_num}.conf"
-    file_path = os.path.join(os.getcwd(), file_name)
-    
-    with open(file_path, 'w') as file:   
-        file.write("[blockks]\n")
-        file.write(f"lens1 = {found_files.get('lens1', '')}\n")
-        file.write(f"lens2 = {found_files.get('lens2', '')}\n")
-        file.write(f"genome1_name = {name1}\n")
-        file.write(f"genome2_name = {name2}\n")
-        file.write(f"blockinfo = {name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri.csv\n")
-        file.write("pvalue = 0.05\n")
-        file.write("tandem = true\n")
-        file.write("tandem_length = 200\n")
-        file.write("makersize = 1\n")
-        file.write("area = 0,3\n")
-        file.write("block_length = 5\n")
-        file.write("figsize = 8,8\n")
-        file.write(f"savefig = {name1}_{name2}_blockks_peaks_{peak_num}.pdf\n")
-    
-    print(f"File created: {file_name}")
-    return file_name
-def create_peaksfit_conf_file(name1, name2, ksarea_start, ksarea_end, peak_num, found_files):
-    """
-    Create a configuration file in the current directory 
-    with the filename format {name1}_{name2}_peaksfit.conf.
-    :param name1: The first name
-    :param name2: The second name
-    :param ksarea_start: The start value for the Ks area
-    :param ksarea_end: The end value for the Ks area
-    :param peak_num: The number of peaks
-    :param found_files: A dictionary containing the paths of the found files
-    """
-    file_name = f"{name1}_{name2}_peaksfit.conf"
-    file_path = os.path.join(os.getcwd(), file_name)
-    
-    with open(file_path, 'w') as file:   
-        file.write("[peaksfit]\n")
-        file.write(f"blockinfo = {name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri.csv\n")
-        file.write("mode = median\n")
-        file.write("bins_number = 200\n")
-        file.write("ks_area = 0,10\n")
-        file.write("fontsize=9\n")
-        file.write("area = 0,3\n")
-        file.write("figsize = 10,6.18\n")
-        file.write(f"savefig = {name1}_{name2}_peaksfit_{peak_num}.pdf\n")
-    
-    print(f"File created: {file_name}")
-    return file_name
-
-def create_ksfigure_data_conf_file(name1, name2, peak_num):
-    """
-    Create a configuration file in the current directory 
-    with the filename format {name1}_{name2}_peaksfit.conf.
-    :param name1: The first name
-    :param name2: The second name
-    :param peak_num: The number of peaks
-    
-    """
-    file_name = f"{name1}_{name2}_ksfigure_data.csv"
-    file_path = os.path.join(os.getcwd(), file_name)
-     # 读取源文件的最后一行
-    
-    with open(file_path, 'w') as file: 
-        # 动态生成 linestyle 后面的逗号
-        extra_commas = ',' * (3 * peak_num)  
-        file.write(f",color,linewidth,linestyle{extra_commas}\n")
-        file.write(f"{name1}_{name2},green,1,-")
-        file.close()
-    for i in range(peak_num):
-        source_file = f"peaksfit_{i+1}_result.txt"
-        with open(source_file, 'r') as src_file:
-            lines = src_file.readlines()
-            last_line = lines[-1].strip() if lines else ""
-            # 按 | 分割最后一行
-            params = last_line.split('|')    
-            # 写入提取的参数
-            with open(file_path, 'a') as file:
-                for param in params:
-                    file.write(f",{param.strip()}")
-    # 写入换行符
-    with open(file_path, 'a') as file:
-        file.write(f"\n")
-    print(f"File created: {file_name}")
-    return file_name
-import os
-
-def create_ksfigure_conf_file(name1, name2):
-    """
-    Create a configuration file in the current directory with the filename format {name1}_{name2}_ksfigure.conf.
-    :param name1: First name
-    :param name2: Second name
-    :param found_files: Dictionary containing paths of found files
-    """
-    file_name = f"{name1}_{name2}_ksfigure.conf"
-    file_path = os.path.join(os.getcwd(), file_name)
-    
-    with open(file_path, 'w') as file:   
-        file.write("[ksfigure]\n")
-        # file.write(f"lens1 = {found_files.get('lens1', '')}\n")
-        # file.write(f"lens2 = {found_files.get('lens2', '')}\n")
-        # file.write(f"genome1_name = {name1}\n")
-        # file.write(f"genome2_name = {name2}\n")
-        file.write(f"ksfit = {name1}_{name2}_ksfigure_data.csv\n")
-        file.write("labelfontsize = 15\n")
-        file.write("legendfontsize = 15\n")
-        file.write("xlabel = none\n")
-        file.write("ylabel = none\n")
-        file.write("title = none\n")
-
-        file.write("area = 0,4\n")
-        file.write("fontsize=9\n")
-
-        # file.write("pvalue = 0.05\n")
-        # file.write("tandem = true\n")
-        # file.write("tandem_length = 200\n")
-        # file.write("makersize = 1\n")
-        # file.write("block_length = 5\n")
-        file.write("figsize = 10,6.18\n")
-        file.write("shadow = false\n")
-        file.write(f"savefig = {name1}_{name2}_ksfigure.pdf\n")
-    
-    print(f"File created: {file_name}")
-    return file_name
-
-def run_wgdi_dotplot_command(conf_file):
-    """
-    Run the wgdi -d command.
-    :param conf_file: Path to the configuration file
-    """
-    command = f"wgdi -d {conf_file}"
-    print(f"Executing command: {command}")
-    try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("Command output:")
-        print(result.stdout)
-        if result.stderr:
-            print("Error output:")
-            print(result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Command execution failed: {e}")
-        print(f"Error output: {e.stderr}")
-def run_wgdi_icl_command(conf_file):
-    """
-    Run the wgdi -icl command.
-    :param conf_file: Path to the configuration file
-    """
-    command = f"wgdi -icl {conf_file}"
-    print(f"Executing command: {command}")
-    try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("Command output:")
-        print(result.stdout)
-        if result.stderr:
-            print("Error output:")
-            print(result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Command execution failed: {e}")
-        print(f"Error output: {e.stderr}")
-def run_wgdi_ks_command(conf_file):
-    """
-    Run the wgdi -ks command.
-    :param conf_file: Path to the configuration file
-    """
-    command = f"wgdi -ks {conf_file}"
-    print(f"Executing command: {command}")
-    try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("Command output:")
-        print(result.stdout)
-        if result.stderr:
-            print("Error output:")
-            print(result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Command execution failed: {e}")
-        print(f"Error output: {e.stderr}")
-
-def run_wgdi_blockinfo_command(conf_file):
-    """
-    Run the wgdi -bi command.
-    :param conf_file: Path to the configuration file
-    """
-    command = f"wgdi -bi {conf_file}"
-    print(f"Executing command: {command}")
-    try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("Command output:")
-        print(result.stdout)
-        if result.stderr:
-            print("Error output:")
-            print(result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Command execution failed: {e}")
-        print(f"Error output: {e.stderr}")
-
-def run_wgdi_blockks_command(conf_file):
-    """
-    Run the wgdi -bk command.
-    :param conf_file: Path to the configuration file
-    """
-    command = f"wgdi -bk {conf_file}"
-    print(f"Executing command: {command}")
-    try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("Command output:")
-        print(result.stdout)
-        if result.stderr:
-            print("Error output:")
-            print(result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Command execution failed: {e}")
-        print(f"Error output: {e.stderr}")
-def run_wgdi_kspeaks_command(conf_file):
-    """
-    Run the wgdi -kp command.
-    :param conf_file: Path to the configuration file
-    """
-    command = f"wgdi -kp {conf_file}"
-    print(f"Executing command: {command}")
-    try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("Command output:")
-        print(result.stdout)
-        if result.stderr:
-            print("Error output:")
-            print(result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Command execution failed: {e}")
-        print(f"Error output: {e.stderr}")
-
-def run_wgdi_filtered_kspeaks_command(conf_file):
-    """
-    Run the wgdi -kp command.
-    :param conf_file: Path to the configuration file
-    """
-    command = f"wgdi -kp {conf_file}"
-    print(f"Executing command: {command}")
-    try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("Command output:")
-        print(result.stdout)
-        if result.stderr:
-            print("Error output:")
-            print(result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Command execution failed: {e}")
-        print(f"Error output: {e.stderr}")
-def run_wgdi_filtered_blockks_command(conf_file):
-    """
-    Run the wgdi -bk command.
-    :param conf_file: Path to the configuration file
-    """
-    command = f"wgdi -bk {conf_file}"
-    print(f"Executing command: {command}")
-    try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("Command output:")
-        print(result.stdout)
-        if result.stderr:
-            print("Error output:")
-            print(result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Command execution failed: {e}")
-        print(f"Error output: {e.stderr}")
-
-def run_wgdi_peaksfit_command(conf_file, peaks_num):
-    """
-    Run the wgdi -pf command.
-    :param conf_file: Path to the configuration file
-    :param peaks_num: Number of peaks
-    """
-    command = f"wgdi -pf {conf_file}"
-    print(f"Executing command: {command}")
-    try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("Command output:")
-        print(result.stdout)
-        if result.stderr:
-            print("Error output:")
-            print(result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Command execution failed: {e}")
-        print(f"Error output: {e.stderr}")
-    
-    result = subprocess.run(command, shell=True, capture_output=True, text=True)
-    # Check if the command was executed successfully
-    if result.returncode == 0:
-        # Get the command output
-        output = result.stdout
-        print(output)
-        # Define the output file path
-        output_file = f"peaksfit_{peaks_num}_result.txt"
-        # Write the output to a file
-        with open(output_file, "w") as file:
-            file.write(output)
-        print(f"Results saved to {output_file}")
-    else:
-        print("Command execution failed")
-        print(f"Error message: {result.stderr}")
-
-def run_wgdi_ksfigure_command(conf_file):
-    """
-    Run the wgdi -kf command.
-    :param conf_file: Path to the configuration file
-    """
-    command = f"wgdi -kf {conf_file}"
-    print(f"Executing command: {command}")
-    try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("Command output:")
-        print(result.stdout)
-        if result.stderr:
-            print("Error output:")
-            print(result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Command execution failed: {e}")
-        print(f"Error output: {e.stderr}")
-
-
-
-def main():
-    """
-    Generate configuration files and run wgdi commands.
-    """
-    parser = argparse.ArgumentParser(description="Generate configuration files and run wgdi commands")
-    parser.add_argument("name1", help="First species name")
-    parser.add_argument("name2", help="Second species name")
-
-    args = parser.parse_args()
-
-    name1 = args.name1
-    name2 = args.name2
-
-    found_files = search_files(name1, name2)
-
-    print(f"Found files:")
-    for key, value in found_files.items():
-        print(f"{key}: {value}")
-
-    dotplot_conf_file = create_dotplot_conf_file(name1, name2, found_files)
-    run_wgdi_dotplot_command(dotplot_conf_file)
-    
-    icl_conf_file = create_icl_conf_file(name1, name2, found_files)
-    run_wgdi_icl_command(icl_conf_file)
-    
-    ks_conf_file = create_ks_conf_file(name1, name2, found_files)
-    run_wgdi_ks_command(ks_conf_file)
-    
-    blockinfo_conf_file = create_blockinfo_conf_file(name1, name2, found_files)
-    run_wgdi_blockinfo_command(blockinfo_conf_file)
-    
-    blockks_conf_file = create_blockks_conf_file(name1, name2, found_files)
-    run_wgdi_blockks_command(blockks_conf_file)
-    
-    kspeaks_conf_file = create_kspeaks_conf_file(name1, name2, found_files)
-    run_wgdi_kspeaks_command(kspeaks_conf_file)
-    
-    # Prompt user for peak_num and ksarea_start, ksarea_end
-    peak_num = eval(input("Enter peak number: "))
-    for i in range(peak_num):
-        ksarea_start = eval(input("Enter peak start: "))
-        ksarea_end = eval(input("Enter peak end: "))
-        
-        filtered_kspeaks_conf_file = create_filtered_kspeaks_conf_file(name1, name2, ksarea_start, ksarea_end, i + 1, found_files)
-        run_wgdi_filtered_kspeaks_command(filtered_kspeaks_conf_file)
-        
-        filtered_blockks_conf_file = create_filtered_blockks_conf_file(name1, name2, ksarea_start, ksarea_end, i + 1, found_files)
-        run_wgdi_filtered_blockks_command(filtered_blockks_conf_file)
-        
-        peaksfit_conf_file = create_peaksfit_conf_file(name1, name2, ksarea_start, ksarea_end, i + 1, found_files)
-        run_wgdi_peaksfit_command(peaksfit_conf_file, i + 1)
-        
-        source_file = f"peaksfit_{i + 1}_result.txt"
-    
-    ksfigure_data_file = create_ksfigure_data_conf_file(name1, name2, peak_num)
-    ksfigure_conf_file = create_ksfigure_conf_file(name1, name2)
-    run_wgdi_ksfigure_command(ksfigure_conf_file)
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+import os
+import json
+import time
+import re
+import sys
+import csv
+import sqlite3
+import collections
+import configparser
+import hashlib
+import argparse
+import asyncio
+import functools
+import itertools
+import resource
+import shutil
+import fcntl
+import filecmp
+import threading
+import contextlib
+import gzip
+import io
+import signal
+import subprocess
+import tempfile
+import importlib
+import runpy
+import socket
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+INPUT_PATTERNS = [
+    ('blast', re.compile(r'^(.+)\.blast$')),
+    ('gff', re.compile(r'^(.+)\.gff$')),
+    ('len', re.compile(r'^(.+)\.len$')),
+    ('cds', re.compile(r'^(.+)_cds\.fasta$')),
+    ('pep', re.compile(r'^(.+)_pep\.fasta$')),
+]
+
+def list_search_root(root, listings):
+    """
+    List the files of a search root, reusing the listing of a previous scan while the directory's
+    modification time, which changes whenever an entry is added, removed or renamed, is unchanged.
+    :param root: Absolute path to the directory
+    :param listings: A dictionary of previous listings, updated in place
+    :return: True if the directory was scanned
+    """
+    try:
+        mtime = os.stat(root).st_mtime_ns
+    except OSError:
+        listings.pop(root, None)
+        return False
+    listing = listings.get(root)
+    if listing and listing['mtime_ns'] == mtime:
+        return False
+    with os.scandir(root) as entries:
+        files = sorted(entry.name for entry in entries if entry.is_file())
+    listings[root] = {'mtime_ns': mtime, 'files': files}
+    # A file added within the same clock tick as the scan would not change the modification time again
+    if time.time_ns() - mtime < 2 * 10 ** 9:
+        listings[root]['mtime_ns'] = None
+    return True
+
+def scan_search_roots(roots, index_file=None):
+    """
+    Index the input files in the search roots by species and kind. Each root is listed with one
+    os.scandir call (not recursively), or not at all if the listing saved in index_file is still valid.
+    A file in an earlier root takes precedence, and an uncompressed file over a compressed one.
+    :param roots: Directories to search, in order of precedence
+    :param index_file: Path to the persistent index of directory listings, or None
+    :return: A dictionary mapping (species, kind) to the path of the file, where kind is one of
+             'gff', 'len', 'cds', 'pep' or 'blast', whose species is '{name1}_{name2}'
+    """
+    listings = {}
+    if index_file and os.path.exists(index_file):
+        with open(index_file, 'r') as file:
+            listings = json.load(file)
+    roots = [os.path.abspath(root) for root in roots]
+    scanned = [root for root in roots if list_search_root(root, listings)]
+    if index_file and scanned:
+        tmp_file = f"{index_file}.tmp"
+        with open(tmp_file, 'w') as file:
+            json.dump(listings, file)
+        os.replace(tmp_file, index_file)
+    input_index = {}
+    ranks = {}
+    for root_num, root in enumerate(roots):
+        for file_name in listings.get(root, {}).get('files', []):
+            base_name = file_name
+            for suffix in COMPRESSED_SUFFIXES:
+                if file_name.endswith(suffix):
+                    base_name = file_name[:-len(suffix)]
+            rank = (root_num, base_name != file_name)
+            for kind, pattern in INPUT_PATTERNS:
+                match = pattern.match(base_name)
+                if match and rank < ranks.get((match.group(1), kind), (len(roots), True)):
+                    input_index[(match.group(1), kind)] = os.path.join(root, file_name)
+                    ranks[(match.group(1), kind)] = rank
+    print(f"Indexed {len(input_index)} input files in {len(roots)} search roots ({len(scanned)} scanned)")
+    return input_index
+
+def search_files(name1, name2, input_index=None):
+    """
+    Search for .blast, .gff, .len, .cds, and .pep files based on the given names.
+    A file compressed with gzip or zstd (name ending in .gz or .zst) is used when the uncompressed file is missing.
+    :param name1: The first name
+    :param name2: The second name
+    :param input_index: The index of the search roots built by scan_search_roots
+                        (default: an index of the current directory)
+    :return: A dictionary containing the paths of the found files
+    """
+    if input_index is None:
+        input_index = scan_search_roots([os.getcwd()])
+    found_files = {}
+    for key, species, kind in [
+        ('blast', f"{name1}_{name2}", 'blast'),
+        ('gff1', name1, 'gff'),
+        ('gff2', name2, 'gff'),
+        ('lens1', name1, 'len'),
+        ('lens2', name2, 'len'),
+        # The .cds and .pep files are based on name1
+        ('cds', name1, 'cds'),
+        ('pep', name1, 'pep'),
+    ]:
+        if (species, kind) in input_index:
+            found_files[key] = input_index[(species, kind)]
+    return found_files
+
+def find_missing_inputs(name1, name2, found_files):
+    """
+    List the inputs of a pair that search_files did not find.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :return: The names of the missing files
+    """
+    expected = {'blast': f"{name1}_{name2}.blast", 'gff1': f"{name1}.gff", 'gff2': f"{name2}.gff",
+                'lens1': f"{name1}.len", 'lens2': f"{name2}.len", 'cds': f"{name1}_cds.fasta",
+                'pep': f"{name1}_pep.fasta"}
+    return [file_name for key, file_name in expected.items() if key not in found_files]
+
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+
+def is_compressed(path):
+    """
+    Tell whether a file is compressed with gzip or zstd, by its name.
+    :param path: Path to the file
+    :return: True if the name ends in .gz or .zst
+    """
+    return path.endswith(COMPRESSED_SUFFIXES)
+
+def decompress_command(path):
+    """
+    Get the command decompressing a file to its standard output: pigz or gzip for .gz files, zstd for .zst files.
+    :param path: Path to the compressed file
+    :return: The command and its arguments, or None if no such program is installed
+    """
+    programs = ['pigz', 'gzip'] if path.endswith('.gz') else ['zstd']
+    for program in programs:
+        executable = shutil.which(program)
+        if executable:
+            return [executable, '-dc', path]
+    return None
+
+@contextlib.contextmanager
+def open_input(path):
+    """
+    Open an input file for reading as a binary stream, decompressing gzip and zstd files on the fly
+    with an external program, or in-process when none is installed.
+    :param path: Path to the file
+    :return: A context manager yielding the binary stream
+    """
+    if not is_compressed(path):
+        with open(path, 'rb') as file:
+            yield file
+        return
+    args = decompress_command(path)
+    if args is None:
+        if path.endswith('.gz'):
+            with gzip.open(path, 'rb') as file:
+                yield file
+            return
+        try:
+            import zstandard
+        except ImportError:
+            raise OSError(f"Cannot decompress {path}: neither the zstd program nor the zstandard module is installed")
+        with open(path, 'rb') as file, zstandard.ZstdDecompressor().stream_reader(file) as reader:
+            yield io.BufferedReader(reader)
+        return
+    process = subprocess.Popen(args, stdout=subprocess.PIPE)
+    try:
+        yield process.stdout
+    finally:
+        # A reader stopping early closes the pipe, which ends the program with SIGPIPE
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode not in (0, -signal.SIGPIPE):
+        raise OSError(f"{' '.join(args)} failed with exit status {returncode}")
+
+# BLAST hit filters shared by the dotplot, collinearity and blockinfo configurations
+BLAST_SCORE = 100
+BLAST_EVALUE = 1e-5
+
+def create_dotplot_conf_file(name1, name2, found_files, workdir=None):
+    """
+    Create a configuration file in the current directory
+    with the filename format {name1}_{name2}_dotplot.conf.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :param workdir: Directory the file is created in (default: the current directory)
+    """
+    file_name = f"{name1}_{name2}_dotplot.conf"
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    
+    with open(file_path, 'w') as file:
+        file.write("[dotplot]\n")
+        file.write(f"blast = {found_files.get('blast', '')}\n")
+        file.write(f"gff1 = {found_files.get('gff1', '')}\n")
+        file.write(f"gff2 = {found_files.get('gff2', '')}\n")
+        file.write(f"lens1 = {found_files.get('lens1', '')}\n")
+        file.write(f"lens2 = {found_files.get('lens2', '')}\n")
+        file.write(f"genome1_name = {name1}\n")
+        file.write(f"genome2_name = {name2}\n")
+        file.write("multiple = 1\n")
+        file.write(f"score = {BLAST_SCORE}\n")
+        file.write(f"evalue = {BLAST_EVALUE}\n")
+        file.write("repeat_number = 10\n")
+        file.write("position = order\n")
+        file.write("blast_reverse = false\n")
+        file.write("ancestor_left = none\n")
+        file.write("ancestor_top = none\n")
+        file.write("markersize = 0.5\n")
+        file.write("figsize = 10,10\n")
+        file.write(f"savefig = {name1}_{name2}_dotplot.pdf\n")
+    
+    print(f"File created: {file_name}")
+    return file_name
+ICL_PARAMETERS = {'multiple': '1', 'grading': '50,40,25', 'mg': '40,40', 'pvalue': '0.2'}
+
+def create_icl_conf_file(name1, name2, found_files, workdir=None, process=8, params=None, suffix=''):
+    """
+    Create a configuration file in the current directory
+    with the filename format {name1}_{name2}_icl{suffix}.conf.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :param workdir: Directory the file is created in (default: the current directory)
+    :param process: Number of processes wgdi -icl runs
+    :param params: A dictionary overriding some of the ICL_PARAMETERS
+    :param suffix: Suffix of the configuration and collinearity file names, for the runs of a sweep
+    """
+    params = dict(ICL_PARAMETERS, **(params or {}))
+    file_name = f"{name1}_{name2}_icl{suffix}.conf"
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    
+    with open(file_path, 'w') as file:
+        file.write("[collinearity]\n")
+       
+        file.write(f"gff1 = {found_files.get('gff1', '')}\n")
+        file.write(f"gff2 = {found_files.get('gff2', '')}\n")
+        file.write(f"lens1 = {found_files.get('lens1', '')}\n")
+        file.write(f"lens2 = {found_files.get('lens2', '')}\n")
+        file.write(f"blast = {found_files.get('blast', '')}\n")
+        file.write("blast_reverse = false\n")
+        # file.write(f"genome1_name = {name1}\n")
+        # file.write(f"genome2_name = {name2}\n")
+        file.write(f"multiple = {params['multiple']}\n")
+        file.write(f"process = {process}\n")
+        file.write(f"evalue = {BLAST_EVALUE}\n")
+        file.write(f"score = {BLAST_SCORE}\n")
+        file.write(f"grading = {params['grading']}\n")
+        file.write(f"mg={params['mg']}\n")
+        file.write(f"pvalue={params['pvalue']}\n")
+        file.write("repeat_number = 20\n")
+        file.write("position = order\n")
+        file.write(f"savefile = {name1}_{name2}_collinearity{suffix}.txt\n")
+    
+    print(f"File created: {file_name}")
+    return file_name
+KS_ALIGNER = "muscle"
+
+def create_ks_conf_file(name1, name2, found_files, workdir=None):
+    """
+    Create a configuration file in the current directory 
+    with the filename format {name1}_ks.conf.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :param workdir: Directory the file is created in (default: the current directory)
+    """
+    file_name = f"{name1}_ks.conf"
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    
+    with open(file_path, 'w') as file:
+        file.write("[ks]\n")
+        file.write(f"cds_file = {found_files.get('cds', '')}\n")
+        file.write(f"pep_file = {found_files.get('pep', '')}\n")
+        file.write(f"align_software = {KS_ALIGNER}\n")
+        file.write(f"pairs_file = {name1}_{name2}_collinearity.txt\n")
+        file.write(f"ks_file = {name1}_ks_result.ks\n")
+    
+    print(f"File created: {file_name}")
+    return file_name
+
+def create_ks_shard_conf_file(name1, name2, shard_num, found_files, workdir=None):
+    """
+    Create a configuration file for one shard of the Ks stage
+    with the filename format {name1}_{name2}_ks_shards/ks_{shard_num}.conf.
+    :param name1: The first name
+    :param name2: The second name
+    :param shard_num: The number of the shard
+    :param found_files: A dictionary containing the paths of the found files
+    :param workdir: Directory the file is created in (default: the current directory)
+    """
+    shard_dir = f"{name1}_{name2}_ks_shards"
+    file_name = os.path.join(shard_dir, f"ks_{shard_num}.conf")
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    os.makedirs(os.path.join(workdir or os.getcwd(), shard_dir), exist_ok=True)
+    
+    with open(file_path, 'w') as file:
+        file.write("[ks]\n")
+        file.write(f"cds_file = {found_files.get('cds', '')}\n")
+        file.write(f"pep_file = {found_files.get('pep', '')}\n")
+        file.write(f"align_software = {KS_ALIGNER}\n")
+        file.write(f"pairs_file = {shard_dir}/pairs_{shard_num}.txt\n")
+        file.write(f"ks_file = {shard_dir}/ks_{shard_num}.ks\n")
+    
+    print(f"File created: {file_name}")
+    return file_name
+
+def create_blockinfo_conf_file(name1, name2, found_files, workdir=None):
+    """
+    Create a configuration file in the current directory 
+    with the filename format {name1}_{name2}_blockinfo.conf.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :param workdir: Directory the file is created in (default: the current directory)
+    """
+    file_name = f"{name1}_{name2}_blockinfo.conf"
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    
+    with open(file_path, 'w') as file:
+        file.write("[blockinfo]\n")
+        file.write(f"blast = {found_files.get('blast', '')}\n")
+        file.write(f"gff1 = {found_files.get('gff1', '')}\n")
+        file.write(f"gff2 = {found_files.get('gff2', '')}\n")
+        file.write(f"lens1 = {found_files.get('lens1', '')}\n")
+        file.write(f"lens2 = {found_files.get('lens2', '')}\n")
+        file.write(f"collinearity = {name1}_{name2}_collinearity.txt\n")
+        file.write(f"evalue = {BLAST_EVALUE}\n")
+        file.write(f"score = {BLAST_SCORE}\n")
+        file.write("repeat_number = 20\n")
+        file.write("position = order\n")
+        file.write(f"ks = {name1}_ks_result.ks\n")
+        file.write(f"ks_col = ks_NG86\n")
+        file.write(f"savefile = {name1}_{name2}_blockinfo.csv\n")
+    
+    print(f"File created: {file_name}")
+    return file_name
+
+def create_blockks_conf_file(name1, name2, found_files, workdir=None):
+    """
+    Create a configuration file in the current directory 
+    with the filename format {name1}_{name2}_blockks.conf.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :param workdir: Directory the file is created in (default: the current directory)
+    """
+    file_name = f"{name1}_{name2}_blockks.conf"
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    
+    with open(file_path, 'w') as file:   
+        file.write("[blockks]\n")
+        file.write(f"lens1 = {found_files.get('lens1', '')}\n")
+        file.write(f"lens2 = {found_files.get('lens2', '')}\n")
+        file.write(f"genome1_name = {name1}\n")
+        file.write(f"genome2_name = {name2}\n")
+        file.write(f"blockinfo = {name1}_{name2}_blockinfo.csv\n")
+        file.write("pvalue = 0.05\n")
+        file.write("tandem = true\n")
+        file.write("tandem_length = 200\n")
+        file.write("makersize = 1\n")
+        file.write("area = 0,3\n")
+        file.write("block_length = 5\n")
+        file.write("figsize = 8,8\n")
+        file.write(f"savefig = {name1}_{name2}_blockks.pdf\n")
+    
+    print(f"File created: {file_name}")
+    return file_name
+
+def create_kspeaks_conf_file(name1, name2, found_files, workdir=None, plot_only=False):
+    """
+    Create a configuration file in the current directory 
+    with the filename format {name1}_{name2}_kspeaks.conf.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :param workdir: Directory the file is created in (default: the current directory)
+    :param plot_only: Create {name1}_{name2}_kspeaks_plot.conf instead, which only draws the figure
+                      and saves its table to a scratch file
+    """
+    file_name = f"{name1}_{name2}_kspeaks{'_plot' if plot_only else ''}.conf"
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    
+    with open(file_path, 'w') as file:   
+        file.write("[kspeaks]\n")
+        file.write(f"blockinfo = {name1}_{name2}_blockinfo.csv\n")
+        file.write("pvalue = 0.05\n")
+        file.write("tandem = true\n") 
+        file.write("block_length = 5\n")
+        file.write("ks_area = 0,10\n")
+        file.write("multiple = 1\n")
+        file.write("homo = -1,1\n")
+        file.write("fontsize = 9\n")
+        file.write("area = 0,3\n")
+        file.write("figsize = 10,6.18\n")
+        
+        file.write(f"savefig = {name1}_{name2}_kspeaks_distri.pdf\n")
+        file.write(f"savefile = {name1}_{name2}_kspeaks_distri{'.plot' if plot_only else ''}.csv\n")
+    
+    print(f"File created: {file_name}")
+    return file_name
+
+def create_filtered_kspeaks_conf_file(name1, name2, ksarea_start, ksarea_end, peak_num, found_files, plot_only=False, workdir=None):
+    """
+    Create a configuration file in the current directory 
+    with the filename format {name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}.conf.
+    :param name1: The first name
+    :param name2: The second name
+    :param ksarea_start: The start value for the Ks area
+    :param ksarea_end: The end value for the Ks area
+    :param peak_num: The number of peaks (not used in the current implementation)
+    :param found_files: A dictionary containing the paths of the found files
+    :param plot_only: Create {name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_plot.conf instead, which only
+                      draws the figure and saves its table to a scratch file
+    :param workdir: Directory the file is created in (default: the current directory)
+    """
+    file_name = f"{name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}{'_plot' if plot_only else ''}.conf"
+    savefile = f"{name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri{'.plot' if plot_only else ''}.csv"
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    
+    with open(file_path, 'w') as file:   
+        file.write("[kspeaks]\n")
+        file.write(f"blockinfo = {name1}_{name2}_blockinfo.csv\n")
+        file.write("pvalue = 0.05\n")
+        file.write("tandem = true\n") 
+        file.write("block_length = 5\n")
+        file.write(f"ks_area = {ksarea_start},{ksarea_end}\n")
+        file.write("multiple = 1\n")
+        file.write("homo = -1,1\n")
+        file.write("fontsize = 9\n")
+        file.write("area = 0,3\n")
+        file.write("figsize = 10,6.18\n")
+        file.write(f"savefig = {name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri.pdf\n")
+        file.write(f"savefile = {savefile}\n")
+    
+    print(f"File created: {file_name}")
+    return file_name
+
+def create_filtered_blockks_conf_file(name1, name2, ksarea_start, ksarea_end, peak_num, found_files, workdir=None):
+    """
+    Create a configuration file in the current directory 
+    with the filename format {name1}_{name2}_blockks_peaks_{peak_num}.conf.
+    :param name1: The first name
+    :param name2: The second name
+    :param ksarea_start: The start value for the Ks area
+    :param ksarea_end: The end value for the Ks area
+    :param peak_num: The number of peaks
+    :param found_files: A dictionary containing the paths of the found files
+    :param workdir: Directory the file is created in (default: the current directory)
+    """
+    file_name = f"{name1}_{name2}_blockks_peaks_{peak_num}.conf"
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    
+    with open(file_path, 'w') as file:   
+        file.write("[blockks]\n")
+        file.write(f"lens1 = {found_files.get('lens1', '')}\n")
+        file.write(f"lens2 = {found_files.get('lens2', '')}\n")
+        file.write(f"genome1_name = {name1}\n")
+        file.write(f"genome2_name = {name2}\n")
+        file.write(f"blockinfo = {name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri.csv\n")
+        file.write("pvalue = 0.05\n")
+        file.write("tandem = true\n")
+        file.write("tandem_length = 200\n")
+        file.write("makersize = 1\n")
+        file.write("area = 0,3\n")
+        file.write("block_length = 5\n")
+        file.write("figsize = 8,8\n")
+        file.write(f"savefig = {name1}_{name2}_blockks_peaks_{peak_num}.pdf\n")
+    
+    print(f"File created: {file_name}")
+    return file_name
+def create_peaksfit_conf_file(name1, name2, ksarea_start, ksarea_end, peak_num, found_files, workdir=None,
+                              plot_only=False):
+    """
+    Create a configuration file in the current directory 
+    with the filename format {name1}_{name2}_peaksfit_{peak_num}.conf.
+    :param name1: The first name
+    :param name2: The second name
+    :param ksarea_start: The start value for the Ks area
+    :param ksarea_end: The end value for the Ks area
+    :param peak_num: The number of peaks
+    :param found_files: A dictionary containing the paths of the found files
+    :param workdir: Directory the file is created in (default: the current directory)
+    :param plot_only: Create {name1}_{name2}_peaksfit_{peak_num}_plot.conf instead, for a wgdi -pf run
+                      drawing the figure of a peak fitted by fit_ks_peaks
+    """
+    file_name = f"{name1}_{name2}_peaksfit_{peak_num}{'_plot' if plot_only else ''}.conf"
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    
+    with open(file_path, 'w') as file:   
+        file.write("[peaksfit]\n")
+        file.write(f"blockinfo = {name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri.csv\n")
+        file.write("mode = median\n")
+        file.write("bins_number = 200\n")
+        file.write("ks_area = 0,10\n")
+        file.write("fontsize=9\n")
+        file.write("area = 0,3\n")
+        file.write("figsize = 10,6.18\n")
+        file.write(f"savefig = {name1}_{name2}_peaksfit_{peak_num}.pdf\n")
+    
+    print(f"File created: {file_name}")
+    return file_name
+
+def create_ksfigure_data_conf_file(name1, name2, peaks_params, workdir=None):
+    """
+    Create a data file in the current directory 
+    with the filename format {name1}_{name2}_ksfigure_data.csv.
+    The file is left untouched if its contents do not change.
+    :param name1: The first name
+    :param name2: The second name
+    :param peaks_params: The fitted Gaussian parameters of each peak, as returned by read_peaksfit_params
+    :param workdir: Directory the file is created in (default: the current directory)
+    """
+    file_name = f"{name1}_{name2}_ksfigure_data.csv"
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    
+    # 动态生成 linestyle 后面的逗号
+    extra_commas = ',' * (3 * len(peaks_params))  
+    lines = [f",color,linewidth,linestyle{extra_commas}\n", f"{name1}_{name2},green,1,-"]
+    for params in peaks_params:
+        for param in params:
+            lines.append(f",{param}")
+    lines.append("\n")
+    write_if_changed(file_path, ''.join(lines))
+    print(f"File created: {file_name}")
+    return file_name
+import os
+
+def create_ksfigure_conf_file(name1, name2, workdir=None):
+    """
+    Create a configuration file in the current directory with the filename format {name1}_{name2}_ksfigure.conf.
+    :param name1: First name
+    :param name2: Second name
+    :param found_files: Dictionary containing paths of found files
+    :param workdir: Directory the file is created in (default: the current directory)
+    """
+    file_name = f"{name1}_{name2}_ksfigure.conf"
+    file_path = os.path.join(workdir or os.getcwd(), file_name)
+    
+    with open(file_path, 'w') as file:   
+        file.write("[ksfigure]\n")
+        # file.write(f"lens1 = {found_files.get('lens1', '')}\n")
+        # file.write(f"lens2 = {found_files.get('lens2', '')}\n")
+        # file.write(f"genome1_name = {name1}\n")
+        # file.write(f"genome2_name = {name2}\n")
+        file.write(f"ksfit = {name1}_{name2}_ksfigure_data.csv\n")
+        file.write("labelfontsize = 15\n")
+        file.write("legendfontsize = 15\n")
+        file.write("xlabel = none\n")
+        file.write("ylabel = none\n")
+        file.write("title = none\n")
+
+        file.write("area = 0,4\n")
+        file.write("fontsize=9\n")
+
+        # file.write("pvalue = 0.05\n")
+        # file.write("tandem = true\n")
+        # file.write("tandem_length = 200\n")
+        # file.write("makersize = 1\n")
+        # file.write("block_length = 5\n")
+        file.write("figsize = 10,6.18\n")
+        file.write("shadow = false\n")
+        file.write(f"savefig = {name1}_{name2}_ksfigure.pdf\n")
+    
+    print(f"File created: {file_name}")
+    return file_name
+
+console_lock = threading.Lock()
+stage_context = threading.local()
+PROGRESS_PATTERNS = (
+    re.compile(r'(\d+(?:\.\d+)?)\s*%'),
+    re.compile(r'(?<![\d.])(\d+)\s*/\s*(\d+)(?![\d.])'),
+)
+
+def console(message):
+    """
+    Print a line to the console without interleaving it with lines printed by concurrent stages.
+    :param message: The line to print
+    """
+    with console_lock:
+        sys.stdout.write(f"{message}\n")
+        sys.stdout.flush()
+
+def parse_progress(line):
+    """
+    Parse a progress report such as a tqdm bar, "45%" or "450/1000" from a line of output.
+    :param line: A line of output
+    :return: The completed fraction between 0 and 1, or None if the line reports no progress
+    """
+    match = PROGRESS_PATTERNS[0].search(line)
+    if match and float(match.group(1)) <= 100:
+        return float(match.group(1)) / 100
+    match = PROGRESS_PATTERNS[1].search(line)
+    if match and 0 < int(match.group(2)) and int(match.group(1)) <= int(match.group(2)):
+        return int(match.group(1)) / int(match.group(2))
+    return None
+
+def format_duration(seconds, decimals=0):
+    """
+    Format a duration as H:MM:SS, or H:MM:SS.ff with decimals.
+    :param seconds: The duration in seconds
+    :param decimals: Number of decimals of the seconds
+    :return: The formatted duration
+    """
+    seconds = round(seconds, decimals)
+    minutes = int(seconds // 60)
+    return f"{minutes // 60}:{minutes % 60:02d}:{seconds - minutes * 60:0{decimals + 3 if decimals else 2}.{decimals}f}"
+
+def iter_output_lines(stream):
+    """
+    Yield the lines of a binary stream as they arrive. Carriage returns also end a line,
+    so progress bars that redraw themselves yield one line per update.
+    :param stream: A binary stream
+    """
+    buffer = b''
+    while True:
+        chunk = stream.read1(65536)
+        if not chunk:
+            break
+        buffer += chunk
+        *lines, buffer = re.split(rb'[\r\n]', buffer)
+        for line in lines:
+            if line:
+                yield line.decode(errors='replace')
+    if buffer:
+        yield buffer.decode(errors='replace')
+
+async def iter_output_lines_async(stream):
+    """
+    Yield the lines of an asyncio stream as they arrive, as iter_output_lines does.
+    :param stream: An asyncio.StreamReader
+    """
+    buffer = b''
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        buffer += chunk
+        *lines, buffer = re.split(rb'[\r\n]', buffer)
+        for line in lines:
+            if line:
+                yield line.decode(errors='replace')
+    if buffer:
+        yield buffer.decode(errors='replace')
+
+def new_output_handler(log, label, tail):
+    """
+    Create the function handling the lines of output of a command: every line is written to the log file,
+    kept in tail and echoed to the console, except that lines reporting progress are summarised
+    as a percentage and an ETA.
+    :param log: The open log file
+    :param label: Prefix of the lines printed to the console
+    :param tail: A deque keeping the last lines of output
+    :return: A callable taking a line and, for lines of the standard output, the open file receiving them or None
+    """
+    write_lock = threading.Lock()
+    started = time.monotonic()
+    progress = {'fraction': 0.0, 'time': started}
+
+    def report_progress(fraction):
+        now = time.monotonic()
+        if fraction < 1 and fraction - progress['fraction'] < 0.05 and now - progress['time'] < 30:
+            return
+        progress['fraction'], progress['time'] = fraction, now
+        eta = (now - started) * (1 - fraction) / fraction if fraction > 0 else None
+        console(f"[{label}] {fraction:.0%} done" + (f", ETA {format_duration(eta)}" if eta is not None else ""))
+
+    def handle(line, output=None):
+        with write_lock:
+            log.write(f"{line}\n")
+            log.flush()
+        if output is not None:
+            output.write(f"{line}\n")
+        tail.append(line)
+        fraction = parse_progress(line)
+        if fraction is None:
+            console(f"[{label}] {line}")
+        else:
+            report_progress(fraction)
+
+    return handle
+
+def stream_command(args, log_file, label, stdout_file=None, tail_lines=200, cwd=None, worker=None, niceness=None):
+    """
+    Run a command, streaming its standard output and error line by line to a log file and the console.
+    Lines reporting progress are summarised as a percentage and an ETA instead of being echoed.
+    Only the last tail_lines lines are kept in memory, for error reporting.
+    :param args: The command and its arguments
+    :param log_file: Path to the log file
+    :param label: Prefix of the lines printed to the console
+    :param stdout_file: Path to a file receiving the standard output only, or None
+    :param tail_lines: Number of lines kept in memory
+    :param cwd: Directory the command runs in (default: the current directory)
+    :param worker: A wgdi worker (see acquire_wgdi_worker) running the wgdi command args in a process forked
+                   from it, instead of a new process; an OSError is raised if the worker fails
+    :param niceness: Niceness increment of the command, or None
+    :return: A tuple (returncode, tail, usage); tail holds the last lines of output and usage the
+             resource usage of the process and its descendants, as returned by os.wait4
+    """
+    tail = collections.deque(maxlen=tail_lines)
+
+    def pump(stream, handle, output=None):
+        for line in iter_output_lines(stream):
+            handle(line, output)
+
+    with open(log_file, 'w') as log:
+        handle = new_output_handler(log, label, tail)
+        output = open(stdout_file, 'w') if stdout_file else None
+        try:
+            if worker is None:
+                process = subprocess.Popen((['nice', '-n', str(niceness)] if niceness else []) + args,
+                                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+                streams = [process.stdout, process.stderr]
+            else:
+                streams = submit_wgdi_job(worker, args, cwd, niceness)
+            readers = [threading.Thread(target=pump, args=(streams[0], handle, output)),
+                       threading.Thread(target=pump, args=(streams[1], handle))]
+            for reader in readers:
+                reader.start()
+            for reader in readers:
+                reader.join()
+            if worker is None:
+                # Reap the process ourselves to get its own resource usage rather than that of all children
+                _, wait_status, usage = os.wait4(process.pid, 0)
+                process.returncode = returncode = os.waitstatus_to_exitcode(wait_status)
+            else:
+                for stream in streams:
+                    stream.close()
+                returncode, usage = finish_wgdi_job(worker)
+        finally:
+            if output is not None:
+                output.close()
+    return returncode, list(tail), usage
+
+def stage_processes():
+    """
+    Get the number of processes the running stage may use, as allotted by the scheduler.
+    :return: The number of processes
+    """
+    return getattr(stage_context, 'processes', None) or 1
+
+def stage_path(file_name):
+    """
+    Resolve a file name relative to the directory of the running stage.
+    :param file_name: A file name relative to the stage's directory, or an absolute path
+    :return: The path of the file
+    """
+    return os.path.join(getattr(stage_context, 'workdir', None) or '', file_name)
+
+def record_command_usage(returncode, usage):
+    """
+    Add the resource usage of a finished command to the metrics of the stage running it, if any.
+    :param returncode: The exit status of the command
+    :param usage: The resource usage returned by os.wait4
+    """
+    metrics = getattr(stage_context, 'metrics', None)
+    if metrics is None:
+        return
+    metrics['user_seconds'] += usage.ru_utime
+    metrics['sys_seconds'] += usage.ru_stime
+    metrics['max_rss_kb'] = max(metrics['max_rss_kb'], usage.ru_maxrss)
+    metrics['exit_status'] = returncode if metrics['exit_status'] in (None, 0) else metrics['exit_status']
+
+def feed_fifo(path, fifo):
+    """
+    Write the decompressed contents of a file to a named pipe, once a reader opens it.
+    :param path: Path to the compressed file
+    :param fifo: Path to the named pipe
+    """
+    try:
+        with open_input(path) as source, open(fifo, 'wb') as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+    except BrokenPipeError:
+        # The reader closed the pipe before the end of the file
+        pass
+    except OSError as e:
+        console(f"Cannot stream {path}: {e}")
+
+@contextlib.contextmanager
+def stream_compressed_inputs(conf_file, workdir=None):
+    """
+    Let a wgdi command read compressed inputs without decompressing them to disk. Every compressed file
+    named in the configuration file is replaced by a named pipe fed by a decompressing thread, in a copy of
+    the configuration file. Each pipe can be read once, which is how wgdi reads its inputs.
+    :param conf_file: Path to the configuration file, relative to the stage's directory
+    :param workdir: Directory of the stage (default: that of the running stage, see stage_path)
+    :return: A context manager yielding the configuration file to run wgdi with
+    """
+    resolve = functools.partial(os.path.join, workdir) if workdir else stage_path
+    with open(resolve(conf_file), 'r') as file:
+        lines = file.readlines()
+    compressed = {}
+    for i, line in enumerate(lines):
+        key, sep, value = line.partition('=')
+        if sep and is_compressed(value.strip()) and os.path.exists(resolve(value.strip())):
+            compressed[i] = (key, value.strip())
+    if not compressed:
+        yield conf_file
+        return
+    stream_dir = tempfile.mkdtemp(prefix='.stream_', dir=resolve('.'))
+    feeders = []
+    try:
+        for i, (key, path) in compressed.items():
+            fifo = os.path.join(stream_dir, f"{i}_{os.path.basename(os.path.splitext(path)[0])}")
+            os.mkfifo(fifo)
+            lines[i] = f"{key}= {fifo}\n"
+            feeder = threading.Thread(target=feed_fifo, args=(resolve(path), fifo), daemon=True)
+            feeder.start()
+            feeders.append((feeder, fifo))
+        stream_conf = os.path.join(stream_dir, os.path.basename(conf_file))
+        with open(stream_conf, 'w') as file:
+            file.writelines(lines)
+        yield stream_conf
+    finally:
+        for feeder, fifo in feeders:
+            if feeder.is_alive():
+                # Release a feeder still waiting for wgdi to open its pipe
+                try:
+                    os.close(os.open(fifo, os.O_RDONLY | os.O_NONBLOCK))
+                except OSError:
+                    pass
+            feeder.join()
+        shutil.rmtree(stream_dir, ignore_errors=True)
+
+wgdi_workers = {'enabled': True, 'command': None, 'idle': [], 'lock': threading.Lock()}
+
+def wgdi_worker_command():
+    """
+    Find the command starting a wgdi worker: this script run with --wgdi-worker by the Python interpreter
+    of the wgdi console script, so that the worker imports the same wgdi as the wgdi command.
+    :return: The command as a list, or None if wgdi is not a Python console script
+    """
+    executable = shutil.which('wgdi')
+    if executable is None:
+        return None
+    try:
+        with open(executable, 'rb') as file:
+            head = file.read(4096)
+    except OSError:
+        return None
+    if not head.startswith(b'#!') or b'wgdi.run' not in head:
+        return None
+    interpreter = head[2:].split(b'\n', 1)[0].decode(errors='replace').split()
+    if not any(os.path.basename(arg).startswith('python') for arg in interpreter):
+        return None
+    return interpreter + [os.path.abspath(__file__), '--wgdi-worker']
+
+def start_wgdi_worker(command):
+    """
+    Start a wgdi worker and wait until it has imported wgdi.
+    :param command: The command starting the worker (see wgdi_worker_command)
+    :return: A worker dictionary with its 'process' and the 'socket' jobs are sent through
+    """
+    parent_socket, child_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    try:
+        process = subprocess.Popen(command + [str(child_socket.fileno())], pass_fds=[child_socket.fileno()],
+                                   stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        parent_socket.close()
+        raise
+    finally:
+        child_socket.close()
+    worker = {'process': process, 'socket': parent_socket}
+    try:
+        reply = json.loads(parent_socket.recv(1 << 16) or b'{"error": "the worker exited"}')
+    except (OSError, ValueError) as e:
+        reply = {'error': str(e)}
+    if 'error' in reply:
+        discard_wgdi_worker(worker)
+        raise OSError(reply['error'])
+    return worker
+
+def acquire_wgdi_worker():
+    """
+    Take an idle wgdi worker, or start one.
+    A wgdi worker imports wgdi and its dependencies once, then runs every wgdi command sent to it
+    in a process forked from it, so that commands start without a new interpreter and cold imports
+    and still cannot affect each other. Workers are only used when wgdi is a Python console script
+    importable by its interpreter; if a worker cannot start, none is started again.
+    :return: A worker dictionary, or None if workers are disabled or unavailable
+    """
+    with wgdi_workers['lock']:
+        if not wgdi_workers['enabled']:
+            return None
+        if wgdi_workers['idle']:
+            return wgdi_workers['idle'].pop()
+        if wgdi_workers['command'] is None:
+            wgdi_workers['command'] = wgdi_worker_command() or []
+        command = wgdi_workers['command']
+        if not command:
+            wgdi_workers['enabled'] = False
+            return None
+    try:
+        return start_wgdi_worker(command)
+    except OSError as e:
+        with wgdi_workers['lock']:
+            if wgdi_workers['enabled']:
+                console(f"Cannot start a wgdi worker ({e}), running wgdi commands in new processes")
+            wgdi_workers['enabled'] = False
+        return None
+
+def release_wgdi_worker(worker):
+    """
+    Return a wgdi worker to the idle workers once its job is finished.
+    :param worker: The worker dictionary
+    """
+    with wgdi_workers['lock']:
+        wgdi_workers['idle'].append(worker)
+
+def discard_wgdi_worker(worker):
+    """
+    Stop a wgdi worker; closing its socket makes it exit.
+    :param worker: The worker dictionary
+    """
+    worker['socket'].close()
+    try:
+        worker['process'].wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        worker['process'].kill()
+        worker['process'].wait()
+
+def stop_wgdi_workers():
+    """
+    Stop the idle wgdi workers.
+    """
+    with wgdi_workers['lock']:
+        idle, wgdi_workers['idle'] = wgdi_workers['idle'], []
+    for worker in idle:
+        discard_wgdi_worker(worker)
+
+def submit_wgdi_job(worker, args, cwd=None, niceness=None):
+    """
+    Send a wgdi command to a worker, which forks a process running it.
+    :param worker: The worker dictionary
+    :param args: The command and its arguments, starting with wgdi
+    :param cwd: Directory the command runs in (default: the current directory)
+    :param niceness: Niceness increment of the command, or None
+    :return: The standard output and error of the command, as binary streams
+    """
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = os.pipe()
+    try:
+        socket.send_fds(worker['socket'], [json.dumps({'args': args, 'cwd': cwd or os.getcwd(),
+                                                       'niceness': niceness}).encode()],
+                        [stdout_write, stderr_write])
+    except OSError:
+        os.close(stdout_read)
+        os.close(stderr_read)
+        raise
+    finally:
+        os.close(stdout_write)
+        os.close(stderr_write)
+    return [os.fdopen(stdout_read, 'rb'), os.fdopen(stderr_read, 'rb')]
+
+def finish_wgdi_job(worker):
+    """
+    Wait for the command sent to a worker to finish.
+    :param worker: The worker dictionary
+    :return: A tuple (returncode, usage), usage being the resource usage of the forked process
+    """
+    reply = worker['socket'].recv(1 << 16)
+    if not reply:
+        raise ConnectionError("the wgdi worker exited")
+    reply = json.loads(reply)
+    if 'error' in reply:
+        raise OSError(reply['error'])
+    return reply['returncode'], resource.struct_rusage(reply['usage'])
+
+def run_wgdi_job(job, fds):
+    """
+    Run a wgdi command in a process forked from a wgdi worker, as the wgdi console script would, and exit.
+    :param job: The job sent by submit_wgdi_job
+    :param fds: The file descriptors receiving the standard output and error of the command
+    """
+    returncode = 1
+    try:
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in fds:
+            os.close(fd)
+        sys.stdout.reconfigure(line_buffering=True)
+        sys.stderr.reconfigure(line_buffering=True)
+        if job.get('niceness'):
+            os.nice(job['niceness'])
+        os.chdir(job['cwd'])
+        sys.argv = job['args']
+        runpy.run_module('wgdi.run', run_name='__main__', alter_sys=True)
+        returncode = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            returncode = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(returncode)
+
+def serve_wgdi_worker(socket_fd):
+    """
+    Run a wgdi worker: import wgdi, then fork a process for every job received until the socket is closed.
+    :param socket_fd: File descriptor of the socket connected to the pipeline
+    """
+    connection = socket.socket(fileno=socket_fd)
+    try:
+        # wgdi.run parses the command line when it is imported
+        sys.argv = ['wgdi']
+        importlib.import_module('wgdi.run')
+    except BaseException as e:
+        connection.send(json.dumps({'error': f"cannot import wgdi: {type(e).__name__}: {e}"}).encode())
+        return
+    connection.send(json.dumps({'ready': True}).encode())
+    while True:
+        message, fds, _, _ = socket.recv_fds(connection, 1 << 16, 2)
+        if not message:
+            break
+        try:
+            pid = os.fork()
+        except OSError as e:
+            for fd in fds:
+                os.close(fd)
+            connection.send(json.dumps({'error': f"cannot fork: {e}"}).encode())
+            continue
+        if pid == 0:
+            connection.close()
+            run_wgdi_job(json.loads(message), fds)
+        for fd in fds:
+            os.close(fd)
+        _, wait_status, usage = os.wait4(pid, 0)
+        connection.send(json.dumps({'returncode': os.waitstatus_to_exitcode(wait_status),
+                                    'usage': list(usage)}).encode())
+
+def run_wgdi_command(option, conf_file, stdout_file=None):
+    """
+    Run a wgdi command, streaming its output to {conf_file without .conf}.log and the console.
+    The command runs in the directory of the running stage, which relative paths are resolved against.
+    Compressed inputs are streamed to wgdi through named pipes (see stream_compressed_inputs).
+    The command runs in a resident wgdi worker when one is available (see acquire_wgdi_worker),
+    and in a new process if there is none or the worker fails.
+    :param option: The wgdi option selecting the program, such as -d or -icl
+    :param conf_file: Path to the configuration file
+    :param stdout_file: Path to a file receiving the standard output only, or None
+    :return: True if the command succeeded
+    """
+    args = ['wgdi', option, conf_file]
+    log_file = stage_path(f"{os.path.splitext(conf_file)[0]}.log")
+    label = getattr(stage_context, 'name', None) or os.path.basename(os.path.splitext(conf_file)[0])
+    console(f"Executing command: {' '.join(args)} (log: {log_file})")
+    try:
+        with stream_compressed_inputs(conf_file) as run_conf_file:
+            run = functools.partial(stream_command, ['wgdi', option, run_conf_file], log_file, label,
+                                    stdout_file and stage_path(stdout_file), cwd=getattr(stage_context, 'workdir', None),
+                                    niceness=getattr(stage_context, 'niceness', None))
+            worker = acquire_wgdi_worker()
+            if worker is not None:
+                try:
+                    returncode, tail, usage = run(worker=worker)
+                except OSError as e:
+                    discard_wgdi_worker(worker)
+                    console(f"wgdi worker failed ({e}), running the command in a new process")
+                    worker = None
+                else:
+                    release_wgdi_worker(worker)
+            if worker is None:
+                returncode, tail, usage = run()
+    except OSError as e:
+        console(f"Command execution failed: {e}")
+        return False
+    record_command_usage(returncode, usage)
+    if returncode != 0:
+        console(f"Command execution failed with exit status {returncode}: {' '.join(args)}")
+        console("Last lines of output:\n" + '\n'.join(tail))
+        return False
+    return True
+
+STOP_GRACE_SECONDS = 5
+
+async def stop_process_group(process):
+    """
+    Stop an asyncio subprocess started in a new session and every process it started: terminate the process
+    group, then kill it if it has not exited after STOP_GRACE_SECONDS.
+    :param process: An asyncio.subprocess.Process
+    """
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            break
+        try:
+            await asyncio.wait_for(asyncio.shield(process.wait()), STOP_GRACE_SECONDS)
+            break
+        except asyncio.TimeoutError:
+            continue
+    await process.wait()
+
+async def run_wgdi_command_async(option, conf_file, stdout_file=None, workdir=None, label=None, niceness=None,
+                                 timeout=None, metrics=None, tail_lines=200):
+    """
+    Run a wgdi command as run_wgdi_command does, in an asyncio subprocess that does not block the event loop.
+    The command is started without a shell, in a new process group; if it times out or the task running it
+    is cancelled, the process group is stopped (see stop_process_group) before the exception is raised again.
+    Commands run this way do not use a resident wgdi worker, and only their exit status is measured.
+    :param option: The wgdi option selecting the program, such as -d or -icl
+    :param conf_file: Path to the configuration file, relative to workdir
+    :param stdout_file: Path to a file receiving the standard output only, relative to workdir, or None
+    :param workdir: Directory the command runs in (default: the current directory)
+    :param label: Prefix of the lines printed to the console (default: the configuration file name)
+    :param niceness: Niceness increment of the command, or None
+    :param timeout: Seconds after which the command is stopped and asyncio.TimeoutError raised, or None
+    :param metrics: A stage record (see new_stage_record) the exit status is saved to, or None
+    :param tail_lines: Number of lines of output kept in memory, for error reporting
+    :return: True if the command succeeded
+    """
+    path = functools.partial(os.path.join, workdir or '')
+    args = ['wgdi', option, conf_file]
+    log_file = path(f"{os.path.splitext(conf_file)[0]}.log")
+    label = label or os.path.basename(os.path.splitext(conf_file)[0])
+    tail = collections.deque(maxlen=tail_lines)
+    console(f"Executing command: {' '.join(args)} (log: {log_file})")
+
+    async def pump(stream, handle, output=None):
+        async for line in iter_output_lines_async(stream):
+            handle(line, output)
+
+    try:
+        with stream_compressed_inputs(conf_file, workdir or os.getcwd()) as run_conf_file, \
+                open(log_file, 'w') as log, \
+                (open(path(stdout_file), 'w') if stdout_file else contextlib.nullcontext()) as output:
+            handle = new_output_handler(log, label, tail)
+            process = await asyncio.create_subprocess_exec(
+                *(['nice', '-n', str(niceness)] if niceness else []), 'wgdi', option, run_conf_file,
+                stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                cwd=workdir, start_new_session=True)
+            try:
+                await asyncio.wait_for(asyncio.gather(pump(process.stdout, handle, output),
+                                                      pump(process.stderr, handle), process.wait()), timeout)
+            except asyncio.TimeoutError:
+                console(f"Command timed out after {format_duration(timeout, 2)}: {' '.join(args)}")
+                raise
+            finally:
+                if process.returncode is None:
+                    await stop_process_group(process)
+    except asyncio.TimeoutError:
+        # An OSError since Python 3.11
+        raise
+    except OSError as e:
+        console(f"Command execution failed: {e}")
+        return False
+    if metrics is not None:
+        metrics['exit_status'] = process.returncode
+    if process.returncode != 0:
+        console(f"Command execution failed with exit status {process.returncode}: {' '.join(args)}")
+        console("Last lines of output:\n" + '\n'.join(tail))
+        return False
+    return True
+
+def run_wgdi_dotplot_command(conf_file):
+    """
+    Run the wgdi -d command.
+    :param conf_file: Path to the configuration file
+    :return: True if the command succeeded
+    """
+    return run_wgdi_command('-d', conf_file)
+
+def run_wgdi_icl_command(conf_file):
+    """
+    Run the wgdi -icl command.
+    :param conf_file: Path to the configuration file
+    :return: True if the command succeeded
+    """
+    return run_wgdi_command('-icl', conf_file)
+
+def run_wgdi_ks_command(conf_file):
+    """
+    Run the wgdi -ks command.
+    :param conf_file: Path to the configuration file
+    :return: True if the command succeeded
+    """
+    return run_wgdi_command('-ks', conf_file)
+
+def run_wgdi_blockinfo_command(conf_file):
+    """
+    Run the wgdi -bi command.
+    :param conf_file: Path to the configuration file
+    :return: True if the command succeeded
+    """
+    return run_wgdi_command('-bi', conf_file)
+
+def run_wgdi_blockks_command(conf_file):
+    """
+    Run the wgdi -bk command.
+    :param conf_file: Path to the configuration file
+    :return: True if the command succeeded
+    """
+    return run_wgdi_command('-bk', conf_file)
+
+def run_wgdi_kspeaks_command(conf_file):
+    """
+    Run the wgdi -kp command.
+    :param conf_file: Path to the configuration file
+    :return: True if the command succeeded
+    """
+    return run_wgdi_command('-kp', conf_file)
+
+def run_wgdi_filtered_kspeaks_command(conf_file):
+    """
+    Run the wgdi -kp command.
+    :param conf_file: Path to the configuration file
+    :return: True if the command succeeded
+    """
+    return run_wgdi_command('-kp', conf_file)
+
+def run_wgdi_filtered_blockks_command(conf_file):
+    """
+    Run the wgdi -bk command.
+    :param conf_file: Path to the configuration file
+    :return: True if the command succeeded
+    """
+    return run_wgdi_command('-bk', conf_file)
+
+def parse_peaksfit_output(output):
+    """
+    Parse the output of wgdi -pf.
+    The fitted parameters are printed on the last line, separated by |, three per Gaussian component.
+    :param output: The standard output of wgdi -pf
+    :return: A dictionary with the fitted 'params' and the 'r_square' of the fit (None if not printed)
+    """
+    r_square = None
+    params = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('R-square:'):
+            r_square = float(line.split(':', 1)[1])
+        elif '|' in line:
+            try:
+                params = [float(value) for value in line.split('|')]
+            except ValueError:
+                continue
+    if params is None:
+        raise ValueError("No fitted parameters found in the wgdi -pf output")
+    return {'params': params, 'r_square': r_square}
+
+def read_peaksfit_params(peaks_num, workdir=None):
+    """
+    Read the fitted parameters saved by run_wgdi_peaksfit_command.
+    :param peaks_num: Number of the peak
+    :param workdir: Directory the parameters were saved in (default: the current directory)
+    :return: A dictionary with the fitted 'params' and the 'r_square' of the fit
+    """
+    with open(os.path.join(workdir or '', f"peaksfit_{peaks_num}_params.json"), 'r') as file:
+        return json.load(file)
+
+def run_wgdi_peaksfit_command(conf_file, peaks_num):
+    """
+    Run the wgdi -pf command once, save its output to peaksfit_{peaks_num}_result.txt
+    and the parsed parameters to peaksfit_{peaks_num}_params.json.
+    :param conf_file: Path to the configuration file
+    :param peaks_num: Number of the peak
+    :return: True if the command succeeded and its output could be parsed
+    """
+    if not run_wgdi_command('-pf', conf_file, stdout_file=f"peaksfit_{peaks_num}_result.txt"):
+        return False
+    return save_peaksfit_params(peaks_num)
+
+def save_peaksfit_params(peaks_num):
+    """
+    Parse the output of wgdi -pf saved to peaksfit_{peaks_num}_result.txt
+    and save the parameters to peaksfit_{peaks_num}_params.json.
+    :param peaks_num: Number of the peak
+    :return: True if the output could be parsed
+    """
+    output_file = f"peaksfit_{peaks_num}_result.txt"
+    print(f"Results saved to {output_file}")
+    with open(stage_path(output_file), 'r') as file:
+        output = file.read()
+    try:
+        fit = parse_peaksfit_output(output)
+    except ValueError as e:
+        print(f"Cannot parse the output of wgdi -pf in {output_file}: {e}")
+        return False
+    params_file = f"peaksfit_{peaks_num}_params.json"
+    with open(stage_path(params_file), "w") as file:
+        json.dump(fit, file)
+    print(f"Fitted parameters saved to {params_file}")
+    return True
+
+def run_wgdi_ksfigure_command(conf_file):
+    """
+    Run the wgdi -kf command.
+    :param conf_file: Path to the configuration file
+    :return: True if the command succeeded
+    """
+    return run_wgdi_command('-kf', conf_file)
+
+
+KS_HEADER = "id1\tid2\tka_NG86\tks_NG86\tka_YN00\tks_YN00\n"
+
+def read_collinearity_pairs(collinearity_file):
+    """
+    Read the gene pairs of a wgdi collinearity file in file order, without duplicates.
+    :param collinearity_file: Path to the collinearity file
+    :return: A tuple (preamble, pairs); preamble is the list of leading comment lines and
+             pairs a list of (block_header, pair_line, (gene1, gene2)) tuples
+    """
+    preamble = []
+    pairs = []
+    seen = set()
+    block_header = None
+    with open(collinearity_file, 'r') as file:
+        for line in file:
+            if line.startswith('#'):
+                if line.startswith('# Alignment'):
+                    block_header = line
+                elif block_header is None:
+                    preamble.append(line)
+                continue
+            fields = line.split()
+            if len(fields) < 3:
+                continue
+            pair = (fields[0], fields[2])
+            if pair in seen:
+                continue
+            seen.add(pair)
+            pairs.append((block_header, line, pair))
+    return preamble, pairs
+
+def summarize_collinearity(collinearity_file):
+    """
+    Summarise the blocks of a wgdi collinearity file.
+    :param collinearity_file: Path to the collinearity file
+    :return: A dictionary with the number of blocks, of gene pairs and of distinct genes of each genome
+             in the blocks, and the minimum, median, mean and maximum block length in gene pairs
+    """
+    lengths = []
+    genes1 = set()
+    genes2 = set()
+    with open(collinearity_file, 'r') as file:
+        for line in file:
+            if line.startswith('#'):
+                if line.startswith('# Alignment'):
+                    lengths.append(0)
+                continue
+            fields = line.split()
+            if len(fields) < 3 or not lengths:
+                continue
+            lengths[-1] += 1
+            genes1.add(fields[0])
+            genes2.add(fields[2])
+    lengths.sort()
+    count = len(lengths)
+    median = (lengths[(count - 1) // 2] + lengths[count // 2]) / 2 if count else 0
+    return {'blocks': count, 'gene_pairs': sum(lengths), 'genes1': len(genes1), 'genes2': len(genes2),
+            'min_length': lengths[0] if count else 0, 'median_length': median,
+            'mean_length': round(sum(lengths) / count, 2) if count else 0,
+            'max_length': lengths[-1] if count else 0}
+
+def write_icl_sweep_table(runs, csv_file):
+    """
+    Summarise the collinearity files of a parameter sweep in one comparison table, written as CSV and printed.
+    :param runs: A list of (params, collinearity_file) tuples, params being a dictionary of ICL_PARAMETERS
+    :param csv_file: Path to the CSV table
+    """
+    columns = ['run'] + list(ICL_PARAMETERS) + ['blocks', 'gene_pairs', 'genes1', 'genes2', 'min_length',
+                                               'median_length', 'mean_length', 'max_length', 'collinearity_file']
+    rows = []
+    for run_num, (params, collinearity_file) in enumerate(runs, 1):
+        row = dict(params, run=run_num, collinearity_file=os.path.basename(collinearity_file))
+        row.update(summarize_collinearity(collinearity_file))
+        rows.append(row)
+    with open(csv_file, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([row[column] for column in columns])
+    widths = {column: max([len(column)] + [len(str(row[column])) for row in rows]) for column in columns}
+    for row in [dict(zip(columns, columns))] + rows:
+        console(' '.join(f"{str(row[column]):>{widths[column]}}" for column in columns))
+    print(f"File created: {os.path.basename(csv_file)}")
+
+def write_if_changed(file_path, content):
+    """
+    Write a file only if its contents differ, so that unchanged files keep their modification time.
+    The file is replaced rather than rewritten in place, so hard links to the old file keep the old contents.
+    :param file_path: Path to the file
+    :param content: The text to write
+    :return: True if the file was written
+    """
+    if os.path.exists(file_path):
+        with open(file_path, 'r') as file:
+            if file.read() == content:
+                return False
+    tmp_file = f"{file_path}.tmp"
+    with open(tmp_file, 'w') as file:
+        file.write(content)
+    os.replace(tmp_file, file_path)
+    return True
+
+def split_collinearity_file(collinearity_file, pairs_files, skip=None):
+    """
+    Split the gene pairs of a collinearity file into contiguous chunks of (nearly) equal size.
+    Every chunk is written as a collinearity file of its own, keeping the block header of each pair.
+    :param collinearity_file: Path to the collinearity file
+    :param pairs_files: Paths of the chunk files, one per shard
+    :param skip: Gene pairs to leave out, or None
+    :return: The number of gene pairs written to the chunks
+    """
+    preamble, pairs = read_collinearity_pairs(collinearity_file)
+    if skip:
+        pairs = [pair for pair in pairs if pair[2] not in skip]
+    shard_num = len(pairs_files)
+    start = 0
+    for i, pairs_file in enumerate(pairs_files):
+        end = start + len(pairs) // shard_num + (1 if i < len(pairs) % shard_num else 0)
+        lines = list(preamble)
+        block_header = None
+        for header, line, _ in pairs[start:end]:
+            if header is not None and header is not block_header:
+                lines.append(header)
+                block_header = header
+            lines.append(line)
+        write_if_changed(pairs_file, ''.join(lines))
+        start = end
+    print(f"Split {len(pairs)} gene pairs of {collinearity_file} into {shard_num} shards")
+    return len(pairs)
+
+def merge_ks_shards(collinearity_file, shard_ks_files, ks_file, ks_store=None):
+    """
+    Merge the Ks results of the shards into one Ks file, in the order in which
+    a single wgdi -ks run over the whole collinearity file writes them. The Ks file
+    is only rewritten if the merged contents differ.
+    :param collinearity_file: Path to the collinearity file
+    :param shard_ks_files: Paths of the Ks files written by the shards
+    :param ks_file: Path to the merged Ks file
+    :param ks_store: The Ks store settings (see build_ks_stages), or None; new results are added to
+                     the store and pairs that were not recomputed are taken from it
+    """
+    header = None
+    rows = {}
+    for shard_ks_file in shard_ks_files:
+        with open(shard_ks_file, 'r') as file:
+            first_line = file.readline()
+            if header is None and first_line:
+                header = first_line
+            for line in file:
+                fields = line.split('\t', 2)
+                if len(fields) == 3:
+                    rows.setdefault((fields[0], fields[1]), line)
+    _, pairs = read_collinearity_pairs(collinearity_file)
+    if ks_store is not None:
+        pair_hashes = ks_pair_hashes([pair for _, _, pair in pairs], ks_store['cds'], ks_store['pep'])
+        connection = open_ks_store(ks_store['file'])
+        try:
+            # Only rows of pairs that were sent to the shards are new; anything else came from the store
+            stored = lookup_ks_store(connection, pair_hashes, ks_store['aligner'])
+            new_rows = {pair: line for pair, line in rows.items() if pair in pair_hashes and pair not in stored}
+            insert_ks_store(connection, new_rows, pair_hashes, ks_store['aligner'], header)
+            header = header or get_ks_store_header(connection)
+        finally:
+            connection.close()
+        rows = {pair: f"{pair[0]}\t{pair[1]}\t{values}" for pair, values in stored.items()}
+        rows.update(new_rows)
+        print(f"Reused {len(stored)} and computed {len(new_rows)} gene pairs with the Ks store {ks_store['file']}")
+    # An unchanged Ks file keeps its modification time, so the stages reading it stay cached
+    content = (header or KS_HEADER) + ''.join(rows[pair] for _, _, pair in pairs if pair in rows)
+    if write_if_changed(ks_file, content):
+        print(f"Merged {len(shard_ks_files)} Ks shards into {ks_file}")
+    else:
+        print(f"Merged {len(shard_ks_files)} Ks shards, {ks_file} is unchanged")
+
+def read_fasta_hashes(fasta_file):
+    """
+    Hash every sequence of a FASTA file.
+    :param fasta_file: Path to the FASTA file
+    :return: A dictionary mapping sequence IDs (the first word of the header) to SHA-1 digests
+    """
+    hashes = {}
+    seq_id = None
+    digest = None
+    with open_input(fasta_file) as stream:
+        for line in io.TextIOWrapper(stream):
+            if line.startswith('>'):
+                if seq_id is not None:
+                    hashes[seq_id] = digest.digest()
+                fields = line[1:].split()
+                seq_id = fields[0] if fields else ''
+                digest = hashlib.sha1()
+            elif seq_id is not None:
+                digest.update(line.strip().encode())
+    if seq_id is not None:
+        hashes[seq_id] = digest.digest()
+    return hashes
+
+def ks_pair_hashes(pairs, cds_file, pep_file):
+    """
+    Hash the CDS and protein sequences of each gene pair. Pairs with a gene missing
+    from either file are left out, as wgdi -ks leaves them out.
+    :param pairs: A list of (gene1, gene2) tuples
+    :param cds_file: Path to the CDS FASTA file
+    :param pep_file: Path to the protein FASTA file
+    :return: A dictionary mapping gene pairs to hexadecimal hashes
+    """
+    cds = read_fasta_hashes(cds_file)
+    pep = read_fasta_hashes(pep_file)
+    pair_hashes = {}
+    for gene1, gene2 in pairs:
+        if gene1 in cds and gene2 in cds and gene1 in pep and gene2 in pep:
+            digest = hashlib.sha1(cds[gene1] + pep[gene1] + cds[gene2] + pep[gene2])
+            pair_hashes[(gene1, gene2)] = digest.hexdigest()
+    return pair_hashes
+
+def open_ks_store(store_file):
+    """
+    Open the persistent Ks store, creating it if needed.
+    Results are keyed on the gene pair, the hash of its sequences and the alignment software.
+    :param store_file: Path to the SQLite database
+    :return: A sqlite3 connection
+    """
+    connection = sqlite3.connect(store_file, timeout=600)
+    connection.execute("CREATE TABLE IF NOT EXISTS ks (id1 TEXT, id2 TEXT, seq_hash TEXT, aligner TEXT, "
+                       "vals TEXT, PRIMARY KEY (id1, id2, seq_hash, aligner))")
+    connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    return connection
+
+def lookup_ks_store(connection, pair_hashes, aligner):
+    """
+    Look up the stored Ks results of gene pairs.
+    :param connection: A connection returned by open_ks_store
+    :param pair_hashes: A dictionary mapping gene pairs to sequence hashes
+    :param aligner: The alignment software
+    :return: A dictionary mapping the gene pairs found to the Ks columns after id1 and id2
+    """
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (id1 TEXT, id2 TEXT, seq_hash TEXT)")
+    connection.execute("DELETE FROM wanted")
+    connection.executemany("INSERT INTO wanted VALUES (?, ?, ?)",
+                           ((gene1, gene2, seq_hash) for (gene1, gene2), seq_hash in pair_hashes.items()))
+    cursor = connection.execute("SELECT ks.id1, ks.id2, ks.vals FROM wanted JOIN ks ON ks.id1 = wanted.id1 "
+                                "AND ks.id2 = wanted.id2 AND ks.seq_hash = wanted.seq_hash AND ks.aligner = ?",
+                                (aligner,))
+    return {(gene1, gene2): vals for gene1, gene2, vals in cursor}
+
+def insert_ks_store(connection, rows, pair_hashes, aligner, header=None):
+    """
+    Add Ks results to the store.
+    :param connection: A connection returned by open_ks_store
+    :param rows: A dictionary mapping gene pairs to lines of a wgdi Ks file
+    :param pair_hashes: A dictionary mapping gene pairs to sequence hashes
+    :param aligner: The alignment software
+    :param header: The header line of the Ks file, or None
+    """
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO ks VALUES (?, ?, ?, ?, ?)",
+                               ((gene1, gene2, pair_hashes[(gene1, gene2)], aligner, line.split('\t', 2)[2])
+                                for (gene1, gene2), line in rows.items()))
+        if header:
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('header', ?)", (header,))
+
+def get_ks_store_header(connection):
+    """
+    Get the Ks file header recorded in the store.
+    :param connection: A connection returned by open_ks_store
+    :return: The header line, or None
+    """
+    row = connection.execute("SELECT value FROM meta WHERE key = 'header'").fetchone()
+    return row[0] if row else None
+
+def split_ks_store_pairs(collinearity_file, pairs_files, shard_ks_files, ks_store):
+    """
+    Split the gene pairs of a collinearity file that are missing from the Ks store into shards.
+    A shard's Ks file is removed when the pairs or sequences it covers change, so that
+    wgdi -ks does not carry over results computed for other sequences.
+    :param collinearity_file: Path to the collinearity file
+    :param pairs_files: Paths of the chunk files, one per shard
+    :param shard_ks_files: Paths of the Ks files written by the shards
+    :param ks_store: The Ks store settings (see build_ks_stages)
+    """
+    _, pairs = read_collinearity_pairs(collinearity_file)
+    pair_hashes = ks_pair_hashes([pair for _, _, pair in pairs], ks_store['cds'], ks_store['pep'])
+    connection = open_ks_store(ks_store['file'])
+    try:
+        stored = lookup_ks_store(connection, pair_hashes, ks_store['aligner'])
+    finally:
+        connection.close()
+    skip = set(stored) | {pair for _, _, pair in pairs if pair not in pair_hashes}
+    missing = split_collinearity_file(collinearity_file, pairs_files, skip)
+    print(f"{len(stored)} of {len(pair_hashes)} gene pairs found in the Ks store, {missing} to compute")
+    for pairs_file, shard_ks_file in zip(pairs_files, shard_ks_files):
+        _, shard_pairs = read_collinearity_pairs(pairs_file)
+        signature = hashlib.sha1(''.join(f"{a}\t{b}\t{pair_hashes[(a, b)]}\n"
+                                         for _, _, (a, b) in shard_pairs).encode()).hexdigest()
+        if write_if_changed(f"{pairs_file}.sig", signature) and os.path.exists(shard_ks_file):
+            os.remove(shard_ks_file)
+
+def write_empty_ks_shard(pairs_file, shard_ks_file):
+    """
+    Give a shard without gene pairs an empty Ks file, as wgdi -ks is not run on it.
+    :param pairs_file: Path to the shard's collinearity file
+    :param shard_ks_file: Path to the shard's Ks file
+    :return: True if the shard has no gene pairs and its Ks file was written, None if wgdi -ks must run
+    """
+    _, pairs = read_collinearity_pairs(pairs_file)
+    if pairs:
+        return None
+    with open(shard_ks_file, 'w') as file:
+        file.write(KS_HEADER)
+    return True
+
+def read_conf_section(conf_file, section):
+    """
+    Read the options of one section of a wgdi configuration file.
+    :param conf_file: Path to the configuration file
+    :param section: Name of the section
+    :return: A dictionary of option names to values
+    """
+    parser = configparser.ConfigParser()
+    parser.read(conf_file)
+    return dict(parser.items(section))
+
+def filter_kspeaks_blockinfo(blockinfo_file, conf_files):
+    """
+    Apply the block filters of wgdi -kp for several kspeaks configuration files at once.
+    The block information is read once; for every configuration the blocks are selected as wgdi -kp does:
+    longer than block_length (default 3) with a pvalue below pvalue, without tandem blocks unless tandem
+    is true, with homo{multiple} and ks_median within homo and ks_area, bounds included. The selection is
+    written to the configuration's savefile, relative to the configuration file's directory.
+    Files whose contents do not change are left untouched.
+    :param blockinfo_file: Path to the block information CSV file written by wgdi -bi
+    :param conf_files: Paths of [kspeaks] configuration files
+    """
+    import numpy as np
+    import pandas as pd
+
+    bkinfo = pd.read_csv(blockinfo_file)
+    bkinfo['chr1'] = bkinfo['chr1'].astype('str')
+    bkinfo['chr2'] = bkinfo['chr2'].astype('str')
+    same_chr = (bkinfo['chr1'] == bkinfo['chr2']).to_numpy()
+    start_distance = np.abs((bkinfo['start1'] - bkinfo['start2']).to_numpy())
+    end_distance = np.abs((bkinfo['end1'] - bkinfo['end2']).to_numpy())
+    length = bkinfo['length'].astype(int).to_numpy()
+    pvalue = bkinfo['pvalue'].to_numpy()
+    ks_median = bkinfo['ks_median'].to_numpy()
+
+    for conf_file in conf_files:
+        options = read_conf_section(conf_file, 'kspeaks')
+        mask = np.ones(len(bkinfo), dtype=bool)
+        if options.get('tandem', 'true').strip().lower() != 'true':
+            tandem_length = int(options.get('tandem_length', 200))
+            mask &= ~(same_chr & ((start_distance <= tandem_length) | (end_distance <= tandem_length)))
+        mask &= length > int(options.get('block_length', 3))
+        mask &= pvalue < float(options.get('pvalue', 1))
+        homo = bkinfo[f"homo{int(options.get('multiple', 1))}"].to_numpy()
+        homo_low, homo_high = [float(value) for value in options.get('homo', '-1,1').split(',')]
+        mask &= (homo >= homo_low) & (homo <= homo_high)
+        ks_low, ks_high = [float(value) for value in options.get('ks_area', '-1,3').split(',')]
+        mask &= (ks_median >= ks_low) & (ks_median <= ks_high)
+        savefile = os.path.join(os.path.dirname(conf_file), options['savefile'])
+        write_if_changed(savefile, bkinfo[mask].to_csv(index=False))
+        print(f"Selected {int(mask.sum())} of {len(bkinfo)} blocks into {savefile}")
+
+def run_kspeaks_plot_command(conf_file, scratch_file):
+    """
+    Run wgdi -kp for its figure only, then remove the table it saved to a scratch file.
+    :param conf_file: Path to the configuration file created with plot_only=True
+    :param scratch_file: Path to the table the plot run saves
+    :return: True if the command succeeded
+    """
+    succeeded = run_wgdi_filtered_kspeaks_command(conf_file)
+    remove_scratch_file(scratch_file)
+    return succeeded
+
+def remove_scratch_file(scratch_file):
+    """
+    Remove a file a wgdi command saved but no stage reads, if it exists.
+    :param scratch_file: Path to the file
+    :return: True
+    """
+    if os.path.exists(scratch_file):
+        os.remove(scratch_file)
+    return True
+
+def fit_ks_peaks(conf_files):
+    """
+    Fit a Gaussian to the Ks distribution of several peaksfit configuration files in-process, as wgdi -pf does:
+    the Ks values of the chosen mode (median, average or total) within area are smoothed with a Gaussian kernel
+    density estimate (Scott's bandwidth divided by 3) evaluated on bins_number points, and one Gaussian
+    amp * exp(-((x - ctr) / wid) ** 2) is fitted to it by least squares from (1, 1, 1).
+    The block information of each configuration is read relative to the configuration file's directory.
+    :param conf_files: Paths of [peaksfit] configuration files
+    :return: A list of dictionaries with the fitted 'params' (amp, ctr, wid) and the 'r_square' of the fit,
+             as parse_peaksfit_output returns them
+    """
+    import numpy as np
+    import pandas as pd
+    from scipy.optimize import curve_fit
+    from scipy.stats import gaussian_kde, linregress
+
+    def gaussian(x, amp, ctr, wid):
+        return amp * np.exp(-((x - ctr) / wid) ** 2)
+
+    fits = []
+    for conf_file in conf_files:
+        options = read_conf_section(conf_file, 'peaksfit')
+        bkinfo = pd.read_csv(os.path.join(os.path.dirname(conf_file), options['blockinfo']))
+        mode = options.get('mode', 'median').strip()
+        if mode == 'total':
+            ks = bkinfo['ks'].astype(str)
+            # wgdi drops the first character of the values starting with '_', only that one
+            ks = ks.where(~ks.str.startswith('_'), ks.str[1:]).str.split('_').explode()
+            data = ks.astype(float).to_numpy()
+        else:
+            data = bkinfo[f"ks_{mode}"].to_numpy(dtype=float)
+        area = [float(value) for value in options.get('area', '0,3').split(',')]
+        data = data[(data >= area[0]) & (data <= area[1])]
+        x = np.linspace(area[0], area[1], int(options['bins_number']))
+        kde = gaussian_kde(data)
+        kde.set_bandwidth(bw_method=kde.factor / 3.)
+        density = kde(x)
+        params, _ = curve_fit(gaussian, x, density, [1, 1, 1], maxfev=80000)
+        params = np.abs(params)
+        r_value = linregress(density, gaussian(x, *params)).rvalue
+        fits.append({'params': [float(param) for param in params], 'r_square': float(r_value ** 2)})
+    return fits
+
+def run_peaksfit_native(conf_files, params_files):
+    """
+    Fit the Ks peaks of several peaksfit configuration files in one call (see fit_ks_peaks)
+    and save the parameters of each, as run_wgdi_peaksfit_command does.
+    Files whose contents do not change are left untouched.
+    :param conf_files: Paths of [peaksfit] configuration files
+    :param params_files: Paths of the files the parameters of each configuration are saved to
+    :return: True if every peak could be fitted
+    """
+    try:
+        fits = fit_ks_peaks(conf_files)
+    except (ValueError, RuntimeError, KeyError) as e:
+        print(f"Cannot fit the Ks peaks: {e}")
+        return False
+    for params_file, fit in zip(params_files, fits):
+        write_if_changed(params_file, json.dumps(fit))
+        print(f"Fitted parameters saved to {os.path.basename(params_file)}: "
+              f"{'  |  '.join(str(param) for param in fit['params'])} (R-square: {fit['r_square']:.4f})")
+    return True
+
+BLAST_COLUMNS = {'query': 'int32', 'subject': 'int32', 'evalue': 'float64', 'score': 'float64',
+                 'start': 'int64', 'end': 'int64'}
+
+def build_blast_columns(blast_file, columns_dir, chunk_size=64 << 20):
+    """
+    Parse a tabular BLAST file once into a binary columnar cache: genes.txt, the dictionary of gene IDs,
+    and one raw NumPy array per column of BLAST_COLUMNS: the query and subject gene numbers, the e-value,
+    the bit score, and the byte range of every hit's line in the BLAST file.
+    The file is read in chunks of whole lines, each parsed by pandas; compressed files are decompressed
+    on the fly and the byte ranges refer to the decompressed contents.
+    :param blast_file: Path to the BLAST file
+    :param columns_dir: Directory of the cache
+    :param chunk_size: Number of bytes read at a time
+    """
+    import numpy as np
+    import pandas as pd
+
+    os.makedirs(columns_dir, exist_ok=True)
+    genes = {}
+    columns = {name: open(os.path.join(columns_dir, f"{name}.bin.tmp"), 'wb') for name in BLAST_COLUMNS}
+    try:
+        with open_input(blast_file) as file:
+            offset = 0
+            remainder = b''
+            while True:
+                data = file.read(chunk_size)
+                block = remainder + data
+                cut = len(block) if not data else block.rfind(b'\n') + 1
+                block, remainder = block[:cut], block[cut:]
+                if block:
+                    # Line boundaries, leaving out blank lines as pandas does
+                    ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+                    if not block.endswith(b'\n'):
+                        ends = np.append(ends, len(block))
+                    starts = np.concatenate(([0], ends[:-1] + 1))
+                    starts, ends = starts[ends > starts], ends[ends > starts]
+                    hits = pd.read_csv(io.BytesIO(block), sep='\t', header=None, usecols=[0, 1, 10, 11],
+                                       dtype={0: str, 1: str, 10: 'float64', 11: 'float64'})
+                    if len(hits) != len(starts):
+                        raise ValueError(f"Cannot parse {blast_file} near byte {offset}")
+                    for name, values in [('query', hits[0]), ('subject', hits[1])]:
+                        codes, uniques = pd.factorize(values)
+                        numbers = np.array([genes.setdefault(gene, len(genes)) for gene in uniques], dtype=np.int32)
+                        columns[name].write(numbers[codes].tobytes())
+                    columns['evalue'].write(hits[10].to_numpy(dtype=np.float64).tobytes())
+                    columns['score'].write(hits[11].to_numpy(dtype=np.float64).tobytes())
+                    columns['start'].write((starts + offset).astype(np.int64).tobytes())
+                    columns['end'].write((ends + offset).astype(np.int64).tobytes())
+                offset += len(block)
+                if not data:
+                    break
+    finally:
+        for column in columns.values():
+            column.close()
+    write_if_changed(os.path.join(columns_dir, 'genes.txt'), ''.join(f"{gene}\n" for gene in genes))
+    for name in BLAST_COLUMNS:
+        os.replace(os.path.join(columns_dir, f"{name}.bin.tmp"), os.path.join(columns_dir, f"{name}.bin"))
+
+def load_blast_columns(columns_dir):
+    """
+    Memory-map the columnar cache written by build_blast_columns.
+    :param columns_dir: Directory of the cache
+    :return: A tuple (genes, columns): the list of gene IDs and a dictionary of read-only NumPy arrays
+    """
+    import numpy as np
+
+    with open(os.path.join(columns_dir, 'genes.txt'), 'r') as file:
+        genes = file.read().splitlines()
+    columns = {}
+    for name, dtype in BLAST_COLUMNS.items():
+        path = os.path.join(columns_dir, f"{name}.bin")
+        # np.memmap cannot map an empty file
+        columns[name] = np.memmap(path, dtype=dtype, mode='r') if os.path.getsize(path) else np.zeros(0, dtype)
+    return genes, columns
+
+def read_gff_genes(gff_file):
+    """
+    Read the gene IDs of a wgdi GFF file (second column).
+    :param gff_file: Path to the GFF file
+    :return: A set of gene IDs
+    """
+    genes = set()
+    with open_input(gff_file) as stream:
+        for line in io.TextIOWrapper(stream):
+            fields = line.split('\t', 2)
+            if len(fields) > 1:
+                genes.add(fields[1])
+    return genes
+
+def select_blast_hits(genes, columns, genes1, genes2, score=BLAST_SCORE, evalue=BLAST_EVALUE):
+    """
+    Select the BLAST hits that wgdi keeps with the given filters, as base.newblast does: hits with a bit score
+    of at least score, an e-value below evalue, between different genes, with the query in genes1 and
+    the subject in genes2, and the first hit of every gene pair.
+    The repeat_number best hits of every query are left to wgdi: it picks them after an unstable sort on score,
+    so only the rows newblast keeps, in the same order, lead it to the same hits among ties.
+    :param genes: The gene IDs of the columnar cache
+    :param columns: The columns of the columnar cache
+    :param genes1: The gene IDs of the first genome
+    :param genes2: The gene IDs of the second genome
+    :param score: The minimum bit score
+    :param evalue: The e-value threshold
+    :return: The indices of the selected hits, in file order
+    """
+    import numpy as np
+
+    in_genes1 = np.fromiter((gene in genes1 for gene in genes), dtype=bool, count=len(genes))
+    in_genes2 = np.fromiter((gene in genes2 for gene in genes), dtype=bool, count=len(genes))
+    query, subject = columns['query'], columns['subject']
+    hit_score = columns['score']
+    mask = (hit_score >= score) & (columns['evalue'] < evalue) & (query != subject)
+    mask &= in_genes1[query] & in_genes2[subject]
+    selected = np.flatnonzero(mask)
+    _, first = np.unique(query[selected].astype(np.int64) * max(len(genes), 1) + subject[selected],
+                         return_index=True)
+    return np.sort(selected[first])
+
+def copy_byte_ranges(source, ranges, target, chunk_size=1 << 20):
+    """
+    Copy lines given by their byte ranges from a stream read once from start to end.
+    :param source: The binary stream
+    :param ranges: Increasing (start, end) byte ranges of the lines, without their line ends
+    :param target: The binary file the lines are written to, each followed by a newline
+    :param chunk_size: Number of bytes read at a time
+    """
+    buffer = b''
+    buffer_start = 0
+    for start, end in ranges:
+        while buffer_start + len(buffer) < end:
+            data = source.read(chunk_size)
+            if not data:
+                raise ValueError("The stream ended before the last byte range")
+            # Drop what precedes the current line before reading on
+            keep = max(0, start - buffer_start)
+            buffer, buffer_start = buffer[keep:] + data, buffer_start + min(keep, len(buffer))
+        target.write(buffer[start - buffer_start:end - buffer_start])
+        target.write(b'\n')
+
+def prefilter_blast_file(blast_file, gff1_file, gff2_file, filtered_file, columns_dir):
+    """
+    Write the BLAST hits that the dotplot, collinearity and blockinfo stages can use (see select_blast_hits)
+    to a smaller BLAST file, lines unchanged and in file order, from which wgdi selects the same hits
+    as from the whole file. The columnar cache of the BLAST file is rebuilt only when the file changes, and the filtered file
+    is rewritten only when the BLAST file, the GFF files or the filters change.
+    :param blast_file: Path to the BLAST file
+    :param gff1_file: Path to the GFF file of the first genome
+    :param gff2_file: Path to the GFF file of the second genome
+    :param filtered_file: Path to the filtered BLAST file
+    :param columns_dir: Directory of the columnar cache
+    """
+    import mmap
+
+    meta_file = os.path.join(columns_dir, 'meta.json')
+    meta = {}
+    if os.path.exists(meta_file):
+        with open(meta_file, 'r') as file:
+            meta = json.load(file)
+    blast_fingerprint = file_fingerprint(blast_file)
+    if meta.get('blast') != blast_fingerprint or meta.get('columns') != BLAST_COLUMNS:
+        started = time.monotonic()
+        build_blast_columns(blast_file, columns_dir)
+        meta = {'blast': blast_fingerprint, 'columns': BLAST_COLUMNS}
+        print(f"Indexed {blast_file} into {columns_dir} in {format_duration(time.monotonic() - started)}")
+    signature = [file_fingerprint(gff1_file), file_fingerprint(gff2_file), BLAST_SCORE, BLAST_EVALUE]
+    # The size rather than the fingerprint, since the artifact store may swap the file for an identical one
+    filtered_size = file_sizes([filtered_file])[filtered_file]
+    if meta.get('signature') == signature and meta.get('filtered_size') == filtered_size:
+        print(f"Filtered BLAST hits are up to date: {filtered_file}")
+        return
+    genes, columns = load_blast_columns(columns_dir)
+    selected = select_blast_hits(genes, columns, read_gff_genes(gff1_file), read_gff_genes(gff2_file))
+    tmp_file = f"{filtered_file}.tmp"
+    ranges = zip(columns['start'][selected].tolist(), columns['end'][selected].tolist())
+    with open(tmp_file, 'wb') as target:
+        if is_compressed(blast_file):
+            with open_input(blast_file) as source:
+                copy_byte_ranges(source, ranges, target)
+        elif len(selected):
+            with open(blast_file, 'rb') as source, \
+                    mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as blast:
+                for start, end in ranges:
+                    target.write(blast[start:end])
+                    target.write(b'\n')
+    os.replace(tmp_file, filtered_file)
+    meta.update(signature=signature, filtered_size=os.path.getsize(filtered_file))
+    with open(meta_file, 'w') as file:
+        json.dump(meta, file)
+    print(f"Kept {len(selected)} of {len(columns['query'])} BLAST hits in {filtered_file}")
+
+def file_fingerprint(path, hash_contents=False):
+    """
+    Fingerprint a file by its size and modification time, or by the SHA-256 of its contents.
+    :param path: Path to the file
+    :param hash_contents: Hash the file contents instead of using size and modification time
+    :return: A fingerprint string, or None if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not hash_contents:
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return f"sha256:{digest.hexdigest()}"
+
+def load_stage_cache(cache_file):
+    """
+    Load the stage cache recorded by previous runs.
+    :param cache_file: Path to the cache file
+    :return: A dictionary mapping stage names to their recorded runs
+    """
+    if not os.path.exists(cache_file):
+        return {}
+    with open(cache_file, 'r') as file:
+        return json.load(file)
+
+def save_stage_cache(entries, cache_file):
+    """
+    Write the stage cache atomically.
+    :param entries: A dictionary mapping stage names to their recorded runs
+    :param cache_file: Path to the cache file
+    """
+    tmp_file = f"{cache_file}.tmp"
+    with open(tmp_file, 'w') as file:
+        json.dump(entries, file, indent=1, sort_keys=True)
+    os.replace(tmp_file, cache_file)
+
+def stage_cache_key(stage, conf_file, hash_inputs=False):
+    """
+    Compute the cache key of a stage from its configuration file and the fingerprints of its inputs.
+    The process setting is left out, since it only depends on the resources free when the stage starts.
+    :param stage: The stage dictionary
+    :param conf_file: The configuration file created for the stage
+    :param hash_inputs: Fingerprint inputs by their contents instead of size and modification time
+    :return: A hexadecimal key
+    """
+    digest = hashlib.sha256()
+    digest.update(stage.get('cache_name', stage['name']).encode())
+    with open(os.path.join(stage.get('workdir') or '', conf_file), 'rb') as file:
+        for line in file:
+            if not re.match(rb'\s*process\s*=', line):
+                digest.update(line)
+    for path in sorted(stage['inputs']):
+        digest.update(f"\0{path}\0{file_fingerprint(path, hash_inputs)}".encode())
+    return digest.hexdigest()
+
+def new_stage_cache(cache_file, force=(), hash_inputs=False):
+    """
+    Create the stage cache used by run_stages.
+    :param cache_file: Path to the cache file
+    :param force: Names of stages to rerun even if cached; 'all' reruns every stage
+    :param hash_inputs: Fingerprint inputs by their contents instead of size and modification time
+    :return: A dictionary holding the cache entries and settings
+    """
+    return {
+        'file': cache_file,
+        'entries': load_stage_cache(cache_file),
+        'force': set(force),
+        'hash_inputs': hash_inputs,
+        'lock': threading.Lock(),
+    }
+
+def lookup_stage_cache(cache, stage, key):
+    """
+    Check whether a stage has a recorded successful run with the same key whose outputs are unchanged.
+    :param cache: The stage cache
+    :param stage: The stage dictionary
+    :param key: The stage's cache key
+    :return: True if the stage can be skipped
+    """
+    if cache['force'] & {stage['name'], stage.get('cache_name'), 'all'}:
+        return False
+    with cache['lock']:
+        entry = cache['entries'].get(stage.get('cache_name', stage['name']))
+    if not entry or entry['key'] != key:
+        return False
+    return all(file_fingerprint(path) == fingerprint for path, fingerprint in entry['outputs'].items())
+
+def record_stage_cache(cache, stage, key):
+    """
+    Record a successful stage run in the cache if all of its outputs exist.
+    :param cache: The stage cache
+    :param stage: The stage dictionary
+    :param key: The stage's cache key
+    """
+    outputs = {path: file_fingerprint(path) for path in stage['outputs']}
+    if None in outputs.values():
+        return
+    with cache['lock']:
+        cache['entries'][stage.get('cache_name', stage['name'])] = {
+            'key': key,
+            'outputs': outputs,
+            'finished': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        save_stage_cache(cache['entries'], cache['file'])
+
+def forget_stage_cache(cache, stage):
+    """
+    Drop the recorded run of a stage, so that a failed rerun is not mistaken for a cached success.
+    :param cache: The stage cache
+    :param stage: The stage dictionary
+    """
+    with cache['lock']:
+        if cache['entries'].pop(stage.get('cache_name', stage['name']), None) is not None:
+            save_stage_cache(cache['entries'], cache['file'])
+
+def print_stage_cache(cache_file):
+    """
+    Print the recorded runs in the stage cache and whether their outputs are still intact.
+    :param cache_file: Path to the cache file
+    """
+    entries = load_stage_cache(cache_file)
+    if not entries:
+        print(f"No cached stages in {cache_file}")
+        return
+    print(f"Cached stages in {cache_file}:")
+    for name, entry in sorted(entries.items()):
+        intact = all(file_fingerprint(path) == fingerprint for path, fingerprint in entry['outputs'].items())
+        state = "valid" if intact else "outputs changed"
+        print(f"{name}: key {entry['key'][:12]}, finished {entry['finished']}, {state}")
+        for path in sorted(entry['outputs']):
+            print(f"    {path}")
+
+def new_journal(journal_file, resume=False, force=()):
+    """
+    Open the journal recording the completion of every stage of a run, one JSON line per stage run.
+    A new run starts a new journal; a resumed run reads the journal of the previous runs and adds to it.
+    :param journal_file: Path to the journal file
+    :param resume: Skip the stages the journal records as done
+    :param force: Names of stages to rerun even if the journal records them as done; 'all' reruns every stage
+    :return: A dictionary holding the journal settings and the last entry of every stage
+    """
+    entries = {}
+    if resume and os.path.exists(journal_file):
+        with open(journal_file, 'r') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+                entries[entry['stage']] = entry
+    elif not resume:
+        open(journal_file, 'w').close()
+    return {'file': journal_file, 'entries': entries, 'resume': resume, 'force': set(force), 'lock': threading.Lock()}
+
+def record_journal(journal, stage, status):
+    """
+    Append the outcome of a stage run to the journal, with the fingerprints of the stage's inputs and outputs.
+    Each entry is a single line written with one call and synced to disk, so that a crash leaves
+    the journal with whole entries (and at most one line cut short, which is ignored).
+    :param journal: The journal
+    :param stage: The stage dictionary
+    :param status: 'done' or 'failed'
+    """
+    entry = {
+        'stage': stage.get('cache_name', stage['name']),
+        'status': status,
+        'finished': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'inputs': {path: file_fingerprint(path) for path in stage['inputs']},
+        'outputs': {path: file_fingerprint(path) for path in stage['outputs']},
+    }
+    line = json.dumps(entry) + '\n'
+    with journal['lock']:
+        journal['entries'][entry['stage']] = entry
+        with open(journal['file'], 'a') as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+
+def lookup_journal(journal, stage):
+    """
+    Check whether the journal records a stage as done, with its inputs and outputs unchanged since.
+    :param journal: The journal
+    :param stage: The stage dictionary
+    :return: True if a resumed run can skip the stage
+    """
+    with journal['lock']:
+        entry = journal['entries'].get(stage.get('cache_name', stage['name']))
+    if not journal['resume'] or not entry or entry['status'] != 'done':
+        return False
+    if journal['force'] & {stage['name'], stage.get('cache_name'), 'all'}:
+        return False
+    recorded = dict(entry['inputs'], **entry['outputs'])
+    current = {path: file_fingerprint(path) for path in stage['inputs'] + stage['outputs']}
+    return recorded == current and None not in current.values()
+
+FICLONE = 0x40049409
+
+def clone_file(src, dst):
+    """
+    Copy a file as a reflink where the filesystem supports it, sharing its blocks with the source,
+    and as a plain copy otherwise.
+    :param src: Path to the source file
+    :param dst: Path to the copy
+    """
+    with open(src, 'rb') as source, open(dst, 'wb') as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            shutil.copyfileobj(source, target, 1 << 20)
+    shutil.copystat(src, dst)
+
+def new_artifact_store(store_dir, manifest_file):
+    """
+    Create the content-addressed artifact store a workspace publishes its files to.
+    Every distinct file content is stored once, as objects/{digest[:2]}/{digest[2:]} under store_dir;
+    the workspace files are hard links to the objects, so identical files of different pairs share one copy.
+    The manifest records the digest of every file the workspace published.
+    :param store_dir: Directory of the artifact store, shared between workspaces
+    :param manifest_file: Path to the workspace's manifest
+    :return: A dictionary holding the store settings and the manifest entries
+    """
+    os.makedirs(os.path.join(store_dir, 'objects'), exist_ok=True)
+    entries = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file, 'r') as file:
+            entries = json.load(file)
+    return {'dir': store_dir, 'manifest_file': manifest_file, 'entries': entries, 'lock': threading.Lock(),
+            'stored': 0, 'linked': 0}
+
+def store_artifact(store, path, digest, link_stored=True):
+    """
+    Add a file to the artifact store. A file whose content is already stored is replaced by
+    a hard link to the stored object; otherwise the file itself becomes the object, through a hard link,
+    or through a reflink or copy when the store is on another filesystem.
+    :param store: The artifact store
+    :param path: Path to the file
+    :param digest: The SHA-256 digest of the file
+    :param link_stored: Replace a file whose content is already stored; False leaves it untouched
+    :return: True if the content was new to the store
+    """
+    object_file = os.path.join(store['dir'], 'objects', digest[:2], digest[2:])
+    os.makedirs(os.path.dirname(object_file), exist_ok=True)
+    try:
+        os.link(path, object_file)
+        return True
+    except FileExistsError:
+        pass
+    except OSError:
+        tmp_file = f"{object_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        clone_file(path, tmp_file)
+        os.replace(tmp_file, object_file)
+        return True
+    if os.path.samefile(path, object_file):
+        return False
+    tmp_file = f"{path}.link.tmp"
+    if filecmp.cmp(path, object_file, shallow=False):
+        if not link_stored:
+            return False
+        # Publish the stored copy in place of the new one
+        src, dst = object_file, path
+    else:
+        # The stored object no longer matches its digest; store this file in its place
+        src, dst = path, object_file
+    try:
+        os.link(src, tmp_file)
+    except OSError:
+        return False
+    os.replace(tmp_file, dst)
+    return src == path
+
+def publish_artifacts(store, paths, link_stored=True):
+    """
+    Publish files to the artifact store and record their digests in the workspace's manifest.
+    Files whose size and modification time have not changed since they were last published are not hashed again.
+    :param store: The artifact store
+    :param paths: Paths of the files; files that do not exist are ignored
+    :param link_stored: Replace files whose content is already stored by links to the stored object
+                        (see store_artifact); input files are left untouched
+    """
+    published = {}
+    for path in paths:
+        fingerprint = file_fingerprint(path)
+        if fingerprint is None:
+            continue
+        with store['lock']:
+            entry = store['entries'].get(path)
+        if entry and entry['fingerprint'] == fingerprint:
+            continue
+        digest = file_fingerprint(path, hash_contents=True).split(':', 1)[1]
+        is_new = store_artifact(store, path, digest, link_stored)
+        published[path] = {'digest': digest, 'fingerprint': file_fingerprint(path)}
+        with store['lock']:
+            store['stored' if is_new else 'linked'] += 1
+    if not published:
+        return
+    with store['lock']:
+        store['entries'].update(published)
+        tmp_file = f"{store['manifest_file']}.tmp"
+        with open(tmp_file, 'w') as file:
+            json.dump(store['entries'], file, indent=1, sort_keys=True)
+        os.replace(tmp_file, store['manifest_file'])
+
+def detach_artifacts(paths):
+    """
+    Give files with more than one hard link, such as files published to the artifact store, a private copy,
+    so that a stage rewriting them in place cannot alter the stored objects or the other workspaces.
+    :param paths: Paths of the files
+    """
+    for path in paths:
+        try:
+            if os.stat(path).st_nlink < 2:
+                continue
+        except OSError:
+            continue
+        tmp_file = f"{path}.detach.tmp"
+        clone_file(path, tmp_file)
+        os.replace(tmp_file, path)
+
+def copy_file_atomically(src, dst):
+    """
+    Copy a file through a temporary file renamed into place, so that the copy is either complete or absent.
+    :param src: Path to the source file
+    :param dst: Path to the copy; its directory is created if needed
+    """
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    tmp_file = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        clone_file(src, tmp_file)
+        os.replace(tmp_file, dst)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_file)
+        raise
+
+def new_scratch_staging(scratch_dir):
+    """
+    Create the staging of a run in a node-local scratch directory, such as a tmpfs or a local SSD.
+    The run gets its own directory under scratch_dir, holding a copy of the inputs and the workspace of every pair;
+    the stages read and write there, and the outputs of every stage that are not intermediate (see make_stage)
+    are copied back to the pair's workspace by a background thread as soon as the stage succeeds
+    (see deliver_stage_outputs). finish_scratch_staging removes the run's directory.
+    :param scratch_dir: The scratch directory
+    :return: A dictionary with the run's scratch directory 'root', the staged 'inputs' by source path,
+             the 'workspaces' mapping each scratch workspace to the pair's workspace and the copy-back 'executor'
+    """
+    os.makedirs(scratch_dir, exist_ok=True)
+    return {
+        'root': tempfile.mkdtemp(prefix='wgdi_', dir=scratch_dir),
+        'inputs': {},
+        'workspaces': {},
+        'executor': ThreadPoolExecutor(max_workers=1),
+        'copies': [],
+        'lock': threading.Lock(),
+    }
+
+def stage_scratch_inputs(staging, found_files):
+    """
+    Declare the stages copying the inputs of a pair to the scratch directory; an input shared by several pairs
+    is copied once.
+    :param staging: The scratch staging (see new_scratch_staging)
+    :param found_files: A dictionary containing the paths of the found files
+    :return: A tuple (stages, found_files); found_files has the paths of the copies
+    """
+    stages = []
+    staged_files = {}
+    for key, path in found_files.items():
+        if path not in staging['inputs']:
+            copy = os.path.join(staging['root'], 'inputs', os.path.basename(path))
+            if copy in staging['inputs'].values():
+                # Inputs of the same name from different search roots
+                copy = os.path.join(staging['root'], 'inputs', str(len(staging['inputs'])), os.path.basename(path))
+            staging['inputs'][path] = copy
+            def run_copy(conf_file, src=path, dst=copy):
+                copy_file_atomically(src, dst)
+
+            stages.append(make_stage(f"inputs:{os.path.basename(path)}", [path], [copy], run_copy))
+        staged_files[key] = staging['inputs'][path]
+    return stages, staged_files
+
+def deliver_stage_outputs(stage):
+    """
+    Queue the copy of the outputs of a stage that ran in a scratch workspace back to the pair's workspace.
+    Intermediate outputs and outputs outside the scratch workspace are not copied.
+    :param stage: The stage dictionary, with the 'staging' it runs in
+    """
+    staging = stage['staging']
+    workdir = staging['workspaces'].get(stage.get('workdir'))
+    if workdir is None or stage.get('intermediate'):
+        return
+    for path in stage['outputs']:
+        relative_path = os.path.relpath(path, stage['workdir'])
+        if relative_path.startswith(os.pardir) or not os.path.exists(path):
+            continue
+        future = staging['executor'].submit(copy_file_atomically, path, os.path.join(workdir, relative_path))
+        with staging['lock']:
+            staging['copies'].append((path, future))
+
+def finish_scratch_staging(staging, failed=False):
+    """
+    Wait for the outputs being copied back from the scratch directory, then remove the run's scratch directory.
+    If the run failed, the logs of the pairs are copied back as well. If an output could not be copied back,
+    the scratch directory is kept so that nothing is lost.
+    :param staging: The scratch staging
+    :param failed: The run failed
+    :return: True if every output was copied back
+    """
+    staging['executor'].shutdown(wait=True)
+    errors = []
+    for path, future in staging['copies']:
+        try:
+            future.result()
+        except OSError as e:
+            errors.append(f"{path}: {e}")
+    if failed:
+        for scratch_workdir, workdir in staging['workspaces'].items():
+            for file_name in os.listdir(scratch_workdir) if os.path.isdir(scratch_workdir) else []:
+                if file_name.endswith('.log'):
+                    try:
+                        copy_file_atomically(os.path.join(scratch_workdir, file_name), os.path.join(workdir, file_name))
+                    except OSError as e:
+                        errors.append(f"{file_name}: {e}")
+    print(f"Copied {len(staging['copies']) - len(errors)} outputs back from {staging['root']}")
+    if errors:
+        print(f"Cannot copy back {len(errors)} files, keeping {staging['root']}:")
+        for error in errors:
+            print(error)
+        return False
+    shutil.rmtree(staging['root'], ignore_errors=True)
+    return True
+
+# Niceness increment of the commands of deferred figure stages
+FIGURE_NICENESS = 10
+
+def make_stage(name, inputs, outputs, run, conf=None, weight=1, multiprocess=False, expand=None, figure=False,
+               command=None, intermediate=False):
+    """
+    Declare a pipeline stage for the stage scheduler.
+    :param name: Unique stage name
+    :param inputs: Files the stage reads
+    :param outputs: Files the stage writes
+    :param run: Callable running the stage; it receives the configuration file name (or None),
+                returns False if the stage failed and may return a list of further stages to schedule
+    :param conf: Callable creating the configuration file and returning its name, or None
+    :param weight: Expected relative run time of the stage; the scheduler starts the stages
+                   heading the longest chains of work first
+    :param multiprocess: The stage runs several processes; the scheduler allots it a share of the free CPUs,
+                         which its conf callable reads with stage_processes()
+    :param expand: For a stage whose run adds further stages, a callable returning the same stages from the
+                   stage's outputs, used when a resumed run skips the stage; or None
+    :param figure: The stage only draws figures, which no other stage reads; run_stages may defer it
+                   to a separate low-priority pool (see its figure_workers)
+    :param command: For a stage whose run only runs a wgdi command, the command as a dictionary
+                    (see make_wgdi_stage), which run_stages_async runs as an asyncio subprocess; or None
+    :param intermediate: The stage's outputs are only read by other stages and are not copied back
+                         from a scratch directory (see new_scratch_staging)
+    :return: A dictionary describing the stage
+    """
+    return {
+        'name': name,
+        'inputs': list(inputs),
+        'outputs': list(outputs),
+        'run': run,
+        'conf': conf,
+        'weight': weight,
+        'multiprocess': multiprocess,
+        'expand': expand,
+        'figure': figure,
+        'command': command,
+        'intermediate': intermediate,
+    }
+
+def make_wgdi_stage(name, inputs, outputs, option, conf, stdout_file=None, after=None, before=None, **kwargs):
+    """
+    Declare a stage running one wgdi command with its configuration file (see run_wgdi_command).
+    :param name: Unique stage name
+    :param inputs: Files the stage reads
+    :param outputs: Files the stage writes
+    :param option: The wgdi option selecting the program, such as -d or -icl
+    :param conf: Callable creating the configuration file and returning its name
+    :param stdout_file: Path to a file receiving the standard output of the command, relative to the
+                        stage's directory, or None
+    :param after: Callable run with the configuration file once the command succeeded, whose result
+                  is the stage's, or None
+    :param before: Callable run with the configuration file before the command; if it returns a result
+                   other than None, the command is not run and that result is the stage's. Or None
+    :param kwargs: Further arguments of make_stage
+    :return: A dictionary describing the stage
+    """
+    def run(conf_file):
+        if before:
+            result = before(conf_file)
+            if result is not None:
+                return result
+        if not run_wgdi_command(option, conf_file, stdout_file):
+            return False
+        return after(conf_file) if after else True
+
+    return make_stage(name, inputs, outputs, run, conf=conf,
+                      command={'option': option, 'stdout_file': stdout_file, 'after': after, 'before': before},
+                      **kwargs)
+
+def prefix_stages(stages, prefix, cache=None, workdir=None, artifacts=None, journal=None, staging=None):
+    """
+    Give the stages of one pair unique names in a batch, and attach the pair's stage cache, workspace,
+    artifact store, journal and scratch staging. The stage cache and the journal still know each stage
+    by its unprefixed name. Stages added by a stage at run time are prefixed the same way.
+    :param stages: List of stage dictionaries
+    :param prefix: Prefix of the stage names
+    :param cache: The pair's stage cache, or None
+    :param workdir: The pair's workspace, the directory its commands run in
+    :param artifacts: The pair's artifact store (see new_artifact_store), or None
+    :param journal: The pair's journal (see new_journal), or None
+    :param staging: The scratch staging the workspace is in (see new_scratch_staging), or None
+    :return: A list of stage dictionaries
+    """
+    def attach(result):
+        if isinstance(result, list):
+            return prefix_stages(result, prefix, cache, workdir, artifacts, journal, staging)
+        return result
+
+    prefixed = []
+    for stage in stages:
+        def run(conf_file, run=stage['run']):
+            return attach(run(conf_file))
+
+        def expand(expand=stage.get('expand')):
+            return attach(expand()) if expand else None
+
+        prefixed.append(dict(stage, name=f"{prefix}{stage['name']}", cache_name=stage.get('cache_name', stage['name']),
+                             run=run, expand=expand, cache=cache, workdir=workdir, artifacts=artifacts,
+                             journal=journal, staging=staging))
+    return prefixed
+
+def read_first_line(path):
+    """
+    Read the first line of a file, such as a cgroup or proc setting.
+    :param path: Path to the file
+    :return: The stripped line, or None if the file cannot be read
+    """
+    try:
+        with open(path, 'r') as file:
+            return file.readline().strip()
+    except OSError:
+        return None
+
+def detect_cpu_count():
+    """
+    Count the CPUs this process may use: the CPUs in its affinity mask, limited by the CPU quota
+    of its cgroup (cgroup v2 cpu.max or cgroup v1 cpu.cfs_quota_us), rounded up.
+    :return: The number of usable CPUs
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = period = None
+    cpu_max = read_first_line('/sys/fs/cgroup/cpu.max')
+    if cpu_max:
+        fields = cpu_max.split()
+        if fields[0] != 'max' and len(fields) == 2:
+            quota, period = int(fields[0]), int(fields[1])
+    else:
+        cfs_quota = read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+        cfs_period = read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+        if cfs_quota and cfs_period and int(cfs_quota) > 0:
+            quota, period = int(cfs_quota), int(cfs_period)
+    if quota and period:
+        cpus = min(cpus, max(1, -(-quota // period)))
+    return cpus
+
+def detect_memory():
+    """
+    Measure the memory this process may use: the available memory of the machine, limited by the memory
+    limit of its cgroup (cgroup v2 memory.max or cgroup v1 memory.limit_in_bytes) minus the memory in use.
+    :return: The usable memory in bytes
+    """
+    memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    try:
+        with open('/proc/meminfo', 'r') as file:
+            for line in file:
+                if line.startswith('MemAvailable:'):
+                    memory = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    for limit_file, usage_file in [('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+                                   ('/sys/fs/cgroup/memory/memory.limit_in_bytes',
+                                    '/sys/fs/cgroup/memory/memory.usage_in_bytes')]:
+        limit = read_first_line(limit_file)
+        if limit and limit.isdigit():
+            usage = read_first_line(usage_file)
+            memory = min(memory, int(limit) - (int(usage) if usage and usage.isdigit() else 0))
+            break
+    return max(memory, 0)
+
+def new_resource_manager(cpus=None, memory=None, memory_per_process=1 << 30):
+    """
+    Create the resource manager the scheduler hands CPUs out with. Every running stage holds one CPU,
+    and a multi-process stage holds the number of processes it was allotted.
+    :param cpus: Number of usable CPUs (default: detect_cpu_count())
+    :param memory: Usable memory in bytes (default: detect_memory())
+    :param memory_per_process: Memory one process of a multi-process stage is expected to need;
+                               no stage gets more processes than the usable memory allows
+    :return: A dictionary with the usable 'cpus', 'memory' and the CPUs 'held' by every running stage
+    """
+    return {
+        'cpus': cpus or detect_cpu_count(),
+        'memory': detect_memory() if memory is None else memory,
+        'memory_per_process': memory_per_process,
+        'held': {},
+    }
+
+def allot_processes(resources, stages):
+    """
+    Allot CPUs to stages starting together. Each single-process stage gets one CPU and the
+    multi-process stages share the remaining free CPUs equally, so a multi-process stage started
+    while others are running gets fewer processes, and one started once they finish gets more.
+    The count is fixed when a stage starts: wgdi reads it from the configuration file and cannot
+    change it while it runs, so CPUs freed later are not given to stages already running, however long.
+    :param resources: The resource manager
+    :param stages: The stage dictionaries
+    :return: A dictionary mapping stage names to their number of processes
+    """
+    free = resources['cpus'] - sum(resources['held'].values())
+    multiprocess = [stage['name'] for stage in stages if stage.get('multiprocess')]
+    memory_cap = max(1, resources['memory'] // max(1, resources['memory_per_process']))
+    allotted = {stage['name']: 1 for stage in stages}
+    if multiprocess:
+        share = max(1, (free - (len(stages) - len(multiprocess))) // len(multiprocess))
+        for name in multiprocess:
+            allotted[name] = min(share, memory_cap)
+    resources['held'].update(allotted)
+    return allotted
+
+RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', resource.RUSAGE_SELF)
+
+def new_stage_record(stage, status='failed', processes=None):
+    """
+    Create the performance record of a stage run.
+    :param stage: The stage dictionary
+    :param status: The initial status: 'done', 'cached', 'failed' or 'skipped'
+    :param processes: Number of processes allotted to the stage, or None for one
+    :return: A dictionary with the stage name, status, start time, wall time, CPU user and system time,
+             peak resident set size, command exit status, the sizes of the stage's input and output files,
+             and the stage's kind (see stage_kind), weight, workspace and processes
+    """
+    return {
+        'stage': stage['name'],
+        'status': status,
+        'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'wall_seconds': 0.0,
+        'user_seconds': 0.0,
+        'sys_seconds': 0.0,
+        'max_rss_kb': 0,
+        'exit_status': None,
+        'input_bytes': file_sizes(stage['inputs']),
+        'output_bytes': {},
+        'kind': stage_kind(stage),
+        'weight': stage.get('weight', 1),
+        'workdir': stage.get('workdir'),
+        'processes': processes or 1,
+    }
+
+def write_run_report(report, json_file, csv_file):
+    """
+    Write the performance records of a run as JSON and as CSV with one row per stage.
+    :param report: A list of records created by new_stage_record
+    :param json_file: Path to the JSON report
+    :param csv_file: Path to the CSV report
+    """
+    with open(json_file, 'w') as file:
+        json.dump({'command': sys.argv, 'stages': report}, file, indent=1)
+    columns = ['stage', 'status', 'started', 'wall_seconds', 'user_seconds', 'sys_seconds', 'max_rss_kb',
+               'exit_status', 'input_bytes', 'output_bytes']
+    with open(csv_file, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for record in report:
+            row = dict(record)
+            row['input_bytes'] = sum(size or 0 for size in record['input_bytes'].values())
+            row['output_bytes'] = sum(size or 0 for size in record['output_bytes'].values())
+            writer.writerow([row[column] for column in columns])
+    print(f"Run report saved to {json_file} and {csv_file}")
+
+def print_run_summary(report):
+    """
+    Print a table of the performance records of a run.
+    :param report: A list of records created by new_stage_record
+    """
+    print(f"{'stage':<28} {'status':<8} {'wall':>10} {'user':>10} {'sys':>9} {'peak RSS':>10} {'in':>10} {'out':>10}")
+    for record in report:
+        input_mb = sum(size or 0 for size in record['input_bytes'].values()) / 2 ** 20
+        output_mb = sum(size or 0 for size in record['output_bytes'].values()) / 2 ** 20
+        print(f"{record['stage']:<28} {record['status']:<8} {format_duration(record['wall_seconds']):>10} "
+              f"{record['user_seconds']:>9.1f}s {record['sys_seconds']:>8.1f}s {record['max_rss_kb'] / 1024:>8.0f}MB "
+              f"{input_mb:>8.1f}MB {output_mb:>8.1f}MB")
+
+def file_sizes(paths):
+    """
+    Get the sizes of files.
+    :param paths: Paths of the files
+    :return: A dictionary mapping each path to its size in bytes, or None if it does not exist
+    """
+    sizes = {}
+    for path in paths:
+        try:
+            sizes[path] = os.path.getsize(path)
+        except OSError:
+            sizes[path] = None
+    return sizes
+
+# Input features the runtime of a stage is modelled on
+RUNTIME_FEATURES = ('blast_bytes', 'genes', 'collinearity_pairs', 'peaks')
+# Features the work of a stage is shared out by: its Ks shards, and the processes allotted to it
+RUNTIME_DIVISORS = ('ks_shards', 'processes')
+# Share of the runtime variance of a stage kind a feature must explain to be modelled on
+RUNTIME_MIN_R2 = 0.5
+# Runs of a stage kind kept in the runtime history
+RUNTIME_HISTORY_LIMIT = 100
+runtime_history_lock = threading.Lock()
+
+def stage_kind(stage):
+    """
+    Name the kind of a stage, shared by the stages of every pair and peak that do the same work,
+    such as peaksfit_plot_peak_N or inputs.
+    :param stage: The stage dictionary
+    :return: The kind
+    """
+    name = stage.get('cache_name', stage['name'])
+    if name.startswith('inputs:'):
+        return 'inputs'
+    return re.sub(r'_\d+(?=_|$)', '_N', name)
+
+def load_runtime_history(history_file):
+    """
+    Load the runtime history of previous runs.
+    :param history_file: Path to the history file
+    :return: A dictionary with the 'samples' of previous stage runs and the cached 'line_counts' of input files
+    """
+    history = {'samples': [], 'line_counts': {}}
+    if history_file and os.path.exists(history_file):
+        with open(history_file, 'r') as file:
+            history.update(json.load(file))
+    return history
+
+def save_runtime_history(history, history_file):
+    """
+    Write the runtime history atomically, keeping the last RUNTIME_HISTORY_LIMIT runs of every stage kind.
+    :param history: The runtime history
+    :param history_file: Path to the history file
+    """
+    kept = collections.Counter()
+    samples = []
+    for sample in reversed(history['samples']):
+        kept[sample['kind']] += 1
+        if kept[sample['kind']] <= RUNTIME_HISTORY_LIMIT:
+            samples.append(sample)
+    history['samples'] = samples[::-1]
+    tmp_file = f"{history_file}.tmp"
+    with open(tmp_file, 'w') as file:
+        json.dump(history, file)
+    os.replace(tmp_file, history_file)
+
+def count_lines(history, path, comment=None):
+    """
+    Count the lines of a possibly compressed file, reusing the count cached in the history while the file
+    is unchanged.
+    :param history: The runtime history, whose line counts are updated
+    :param path: Path to the file
+    :param comment: Prefix of the lines not to count, such as b'#', or None to count every line
+    :return: The number of lines, or None if the file does not exist
+    """
+    fingerprint = file_fingerprint(path)
+    if fingerprint is None:
+        return None
+    cached = history['line_counts'].get(path)
+    if cached and cached['fingerprint'] == fingerprint:
+        return cached['lines']
+    with open_input(path) as stream:
+        if comment is None:
+            lines = sum(chunk.count(b'\n') for chunk in iter(lambda: stream.read(1 << 20), b''))
+        else:
+            lines = sum(1 for line in stream if not line.startswith(comment))
+    history['line_counts'][path] = {'fingerprint': fingerprint, 'lines': lines}
+    return lines
+
+def pair_features(history, found_files, workdir, options=None):
+    """
+    Measure the input features of a pair (see RUNTIME_FEATURES): the size of its BLAST file, the genes of its
+    two .gff files, the gene pairs of its collinearity file and its number of Ks peaks. The BLAST file is sized,
+    not counted, so that only the stages read it. A feature that cannot be measured yet, such as the collinearity pairs before
+    the pair's first run, is estimated from the history: collinearity pairs in proportion to the BLAST size,
+    peaks as their median.
+    :param history: The runtime history
+    :param found_files: A dictionary containing the paths of the found files
+    :param workdir: The pair's workspace
+    :param options: The pipeline options (see build_pair_stages)
+    :return: A dictionary of feature values, with the pair's 'ks_shards'; a value is None if it can be neither
+             measured nor estimated
+    """
+    options = options or {}
+    path = functools.partial(os.path.join, workdir)
+    name = os.path.basename(workdir)
+    genes = [count_lines(history, found_files[k]) for k in ('gff1', 'gff2') if k in found_files]
+    features = {
+        'blast_bytes': file_sizes([found_files['blast']])[found_files['blast']] if 'blast' in found_files else None,
+        'genes': sum(genes) if genes and None not in genes else None,
+        'collinearity_pairs': None,
+        'peaks': None,
+        'ks_shards': max(1, options.get('ks_shards') or 1),
+    }
+    features['collinearity_pairs'] = count_lines(history, path(f"{name}_collinearity.txt"), b'#')
+    for peaks_file in (options.get('peaks_file'), path(f"{name}_peaks.txt")):
+        if options.get('peaks'):
+            features['peaks'] = len(options['peaks'])
+        elif peaks_file and os.path.exists(peaks_file):
+            features['peaks'] = len(read_peaks_file(peaks_file))
+        if features['peaks'] is not None:
+            break
+    samples = [sample['features'] for sample in history['samples']]
+    if features['collinearity_pairs'] is None and features['blast_bytes']:
+        ratios = [sample['collinearity_pairs'] / sample['blast_bytes'] for sample in samples
+                  if sample.get('collinearity_pairs') is not None and sample.get('blast_bytes')]
+        if ratios:
+            features['collinearity_pairs'] = round(features['blast_bytes'] * sorted(ratios)[len(ratios) // 2])
+    if features['peaks'] is None:
+        peaks = sorted(sample['peaks'] for sample in samples if sample.get('peaks') is not None)
+        if peaks:
+            features['peaks'] = peaks[len(peaks) // 2]
+    return features
+
+def workspace_features(history, pairs, options, input_index, root=None, staging=None):
+    """
+    Measure the features of every pair of a run (see pair_features).
+    :param history: The runtime history
+    :param pairs: A list of (name1, name2, peaks) tuples, as returned by read_manifest
+    :param options: The pipeline options; the peaks of a pair replace options['peaks']
+    :param input_index: The index of the search roots built by scan_search_roots
+    :param root: Directory the workspaces are in (default: the current directory)
+    :param staging: The scratch staging of the run (see new_scratch_staging), or None
+    :return: A dictionary mapping the workspace of every pair, and its scratch workspace, to its features
+    """
+    features = {}
+    for name1, name2, peaks in pairs:
+        workdir = os.path.join(os.path.abspath(root or os.getcwd()), f"{name1}_{name2}")
+        features[workdir] = pair_features(history, search_files(name1, name2, input_index), workdir,
+                                          dict(options, peaks=peaks or options.get('peaks')))
+    for scratch_workdir, workdir in (staging['workspaces'].items() if staging is not None else ()):
+        if workdir in features:
+            features[scratch_workdir] = features[workdir]
+    return features
+
+def record_runtime_history(history, report, features):
+    """
+    Add the stages that ran to the runtime history, with the features of their pair.
+    Cached, resumed, failed and skipped stages are left out.
+    :param history: The runtime history
+    :param report: The performance records of the run (see new_stage_record)
+    :param features: A dictionary mapping the workspace of every pair to its features (see pair_features)
+    :return: The number of stage runs added
+    """
+    added = 0
+    for record in report:
+        if record['status'] != 'done' or record.get('workdir') not in features:
+            continue
+        history['samples'].append({'kind': record['kind'], 'weight': record['weight'],
+                                   'seconds': round(record['wall_seconds'], 3),
+                                   'features': dict(features[record['workdir']],
+                                                    processes=record.get('processes', 1)),
+                                   'started': record['started']})
+        added += 1
+    return added
+
+def update_runtime_history(history_file, report, pairs, options, input_index, root=None, staging=None):
+    """
+    Add the stages of a finished run to the runtime history file, measuring the features of its pairs
+    from the outputs of the run. The file is read again first, so that pipelines of the same process
+    finishing one after another each add their stages.
+    :param history_file: Path to the history file
+    :param report: The performance records of the run (see new_stage_record)
+    :param pairs: A list of (name1, name2, peaks) tuples, as returned by read_manifest
+    :param options: The pipeline options
+    :param input_index: The index of the search roots built by scan_search_roots
+    :param root: Directory the workspaces are in (default: the current directory)
+    :param staging: The scratch staging of the run (see new_scratch_staging), or None
+    :return: The number of stage runs added
+    """
+    with runtime_history_lock:
+        history = load_runtime_history(history_file)
+        added = record_runtime_history(history, report, workspace_features(history, pairs, options, input_index,
+                                                                           root, staging))
+        save_runtime_history(history, history_file)
+    return added
+
+def runtime_feature_value(features, feature):
+    """
+    Get the value of a feature of the cost model: a feature such as 'blast_bytes', or a feature shared out
+    by a divisor, such as 'collinearity_pairs/ks_shards' (see RUNTIME_DIVISORS); a missing divisor counts as 1.
+    :param features: The feature values of a stage run
+    :param feature: The name of the feature
+    :return: The value, or None if the feature is unknown
+    """
+    feature, _, divisor = feature.partition('/')
+    value = features.get(feature)
+    if value is None or not divisor:
+        return value
+    return value / (features.get(divisor) or 1)
+
+def fit_cost_model(history):
+    """
+    Fit the cost model of every stage kind in the runtime history: seconds = intercept + slope * feature,
+    by least squares on the one feature that fits the runs of the kind best, among the features, alone or shared
+    out by a divisor (see runtime_feature_value), that grow with its runtime and explain at least RUNTIME_MIN_R2
+    of its variance. A feature is fitted on the runs that have it, at least three. A kind without such
+    a feature is modelled by its mean runtime.
+    :param history: The runtime history
+    :return: A dictionary mapping stage kinds to dictionaries with the 'feature' (or None), 'intercept', 'slope'
+             and the number of 'samples' fitted; the key None holds the 'seconds_per_weight' of a stage of a kind
+             without runs, by the median of seconds / weight over every run
+    """
+    samples = collections.defaultdict(list)
+    for sample in history['samples']:
+        samples[sample['kind']].append(sample)
+    candidates = [feature + divisor for feature in RUNTIME_FEATURES
+                  for divisor in [''] + [f"/{divisor}" for divisor in RUNTIME_DIVISORS]]
+    model = {}
+    for kind, runs in samples.items():
+        mean = sum(run['seconds'] for run in runs) / len(runs)
+        best = {'feature': None, 'intercept': mean, 'slope': 0.0, 'samples': len(runs)}
+        best_r2 = None
+        for feature in candidates:
+            points = [(runtime_feature_value(run['features'], feature), run['seconds']) for run in runs]
+            points = [(x, y) for x, y in points if x is not None]
+            if len(points) < 3 or len({x for x, _ in points}) < 2:
+                continue
+            mean_x = sum(x for x, _ in points) / len(points)
+            mean_y = sum(y for _, y in points) / len(points)
+            variance = sum((y - mean_y) ** 2 for _, y in points)
+            slope = (sum((x - mean_x) * (y - mean_y) for x, y in points) /
+                     sum((x - mean_x) ** 2 for x, _ in points))
+            intercept = mean_y - slope * mean_x
+            error = sum((intercept + slope * x - y) ** 2 for x, y in points)
+            r2 = 1 - error / variance if variance else 0
+            # On a tie, the feature alone wins over the feature shared out
+            if slope > 0 and r2 >= RUNTIME_MIN_R2 and (best['feature'] is None or r2 > best_r2):
+                best = {'feature': feature, 'intercept': intercept, 'slope': slope, 'samples': len(points)}
+                best_r2 = r2
+        model[kind] = best
+    ratios = sorted(sample['seconds'] / sample['weight'] for sample in history['samples'] if sample['weight'])
+    model[None] = {'seconds_per_weight': ratios[len(ratios) // 2] if ratios else None}
+    return model
+
+def predict_stage_seconds(model, stage, features, processes=1):
+    """
+    Predict the runtime of a stage with the cost model.
+    :param model: The cost model (see fit_cost_model)
+    :param stage: The stage dictionary
+    :param features: The features of the stage's pair (see pair_features), or None
+    :param processes: Number of processes a multi-process stage is expected to get
+    :return: A tuple (seconds, basis); basis names the feature of the prediction, 'mean' for a kind modelled by
+             its mean, 'weight' for a kind without runs, or is None and seconds None if there is no history
+    """
+    entry = model.get(stage_kind(stage))
+    if entry is not None:
+        features = dict(features or {}, processes=processes if stage.get('multiprocess') else 1)
+        value = runtime_feature_value(features, entry['feature']) if entry['feature'] else None
+        if value is not None:
+            return max(0.0, entry['intercept'] + entry['slope'] * value), entry['feature']
+        if entry['feature'] is None:
+            return entry['intercept'], 'mean'
+    seconds_per_weight = model.get(None, {}).get('seconds_per_weight')
+    if seconds_per_weight is None:
+        return None, None
+    return stage.get('weight', 1) * seconds_per_weight, 'weight'
+
+def new_runtime_estimator(model, features, processes=1):
+    """
+    Create the function the schedulers weigh stages with (see stage_priorities): the predicted runtime
+    of a stage, or its weight if there is no history.
+    :param model: The cost model (see fit_cost_model)
+    :param features: A dictionary mapping the workspace of every pair to its features
+    :param processes: Number of processes a multi-process stage is expected to get
+    :return: A callable taking a stage dictionary and returning its weight
+    """
+    def estimate(stage):
+        seconds, _ = predict_stage_seconds(model, stage, features.get(stage.get('workdir')), processes)
+        return stage.get('weight', 1) if seconds is None else seconds
+
+    return estimate
+
+def new_stage_run(stage, processes=None, niceness=None):
+    """
+    Start running a stage: create its performance record and point the stage context of this thread at it.
+    :param stage: The stage dictionary
+    :param processes: Number of processes allotted to the stage (see stage_processes), or None
+    :param niceness: Niceness increment of the commands the stage runs, or None
+    :return: A dictionary with the stage's 'record', 'started' time, 'processes' and 'niceness',
+             completed by prepare_stage_run
+    """
+    enter_stage_context(stage, processes, niceness, new_stage_record(stage, processes=processes))
+    console(f"Starting stage: {stage['name']}" + (f" ({processes} processes)" if processes and processes > 1 else ""))
+    return {'record': stage_context.metrics, 'started': time.monotonic(), 'processes': processes,
+            'niceness': niceness, 'conf_file': None, 'key': None, 'skip': False, 'result': None}
+
+def enter_stage_context(stage, processes=None, niceness=None, metrics=None):
+    """
+    Point the stage context of this thread, which the configuration and run callables of a stage read
+    (see stage_processes and stage_path), at a stage.
+    :param stage: The stage dictionary
+    :param processes: Number of processes allotted to the stage, or None
+    :param niceness: Niceness increment of the commands the stage runs, or None
+    :param metrics: The stage's performance record, or None
+    """
+    stage_context.name = stage['name']
+    stage_context.workdir = stage.get('workdir')
+    stage_context.processes = processes
+    stage_context.niceness = niceness
+    stage_context.metrics = metrics
+
+def prepare_stage_run(stage, run, cache=None):
+    """
+    Look a stage up in its journal and the stage cache and, unless they make running it unnecessary,
+    create its configuration file. run['skip'] is then True and run['result'] holds the stage's result.
+    :param stage: The stage dictionary
+    :param run: The dictionary returned by new_stage_run, updated in place
+    :param cache: The stage cache, or None to always run
+    """
+    cache = stage.get('cache', cache)
+    journal = stage.get('journal')
+    record = run['record']
+    if journal is not None and lookup_journal(journal, stage):
+        console(f"Stage {stage['name']} was completed by a previous run, resuming after it")
+        record['status'] = 'resumed'
+        run.update(skip=True, result=stage['expand']() if stage.get('expand') else None)
+        return
+    run['conf_file'] = conf_file = stage['conf']() if stage['conf'] else None
+    if cache is not None and conf_file is not None:
+        run['key'] = stage_cache_key(stage, conf_file, cache['hash_inputs'])
+        if lookup_stage_cache(cache, stage, run['key']):
+            console(f"Stage {stage['name']} is up to date, reusing: {', '.join(stage['outputs'])}")
+            record['status'] = 'cached'
+            if journal is not None:
+                record_journal(journal, stage, 'done')
+            run['skip'] = True
+            return
+    if conf_file is not None:
+        # In-process stages replace their outputs; wgdi may rewrite or append to them in place. Outputs
+        # published by an earlier run stay linked to the store even when this run does not use it
+        detach_artifacts(stage['outputs'])
+
+def close_stage_run(stage, run, result, cache=None):
+    """
+    Record the outcome of a stage that ran: publish its outputs to the artifact store and record it
+    in the stage cache and the journal. A stage that raised an exception is closed with result False.
+    :param stage: The stage dictionary
+    :param run: The dictionary returned by new_stage_run
+    :param result: The value returned by the stage's run callable
+    :param cache: The stage cache, or None
+    :return: result
+    """
+    cache = stage.get('cache', cache)
+    artifacts = stage.get('artifacts')
+    journal = stage.get('journal')
+    if artifacts is not None and result is not False:
+        publish_artifacts(artifacts, stage['outputs'])
+    if stage.get('staging') is not None and result is not False:
+        deliver_stage_outputs(stage)
+    if run['key'] is not None:
+        if result is False:
+            forget_stage_cache(cache, stage)
+        else:
+            record_stage_cache(cache, stage, run['key'])
+    if journal is not None:
+        record_journal(journal, stage, 'failed' if result is False else 'done')
+    run['record']['status'] = 'failed' if result is False else 'done'
+    return result
+
+def end_stage_record(stage, run, report=None):
+    """
+    Complete the performance record of a stage with its wall time and output sizes, and add it to the report.
+    :param stage: The stage dictionary
+    :param run: The dictionary returned by new_stage_run
+    :param report: A list the record is appended to, or None
+    """
+    record = run['record']
+    record['wall_seconds'] = time.monotonic() - run['started']
+    record['output_bytes'] = file_sizes(stage['outputs'])
+    if report is not None:
+        report.append(record)
+
+def execute_stage(stage, cache=None, report=None, processes=None, niceness=None):
+    """
+    Create the configuration file of a stage and run it, unless the stage cache holds
+    a successful run with the same configuration and inputs.
+    Stages without a configuration file are always run.
+    A stage carrying its own 'cache' and 'workdir' (see prefix_stages) uses them instead of the defaults.
+    With an artifact store attached to the stage, the outputs of a wgdi stage are detached from the store
+    before it runs, and the outputs of every stage are published to the store once it succeeds.
+    With a journal attached to the stage, the outcome is recorded in it, and a resumed run skips
+    the stage if the journal records it as done (see lookup_journal).
+    :param stage: The stage dictionary
+    :param cache: The stage cache, or None to always run
+    :param report: A list the stage's performance record is appended to (see new_stage_record), or None
+    :param processes: Number of processes allotted to the stage (see stage_processes), or None
+    :param niceness: Niceness increment of the commands the stage runs, or None
+    :return: The value returned by the stage's run callable
+    """
+    run = new_stage_run(stage, processes, niceness)
+    record = run['record']
+    thread_usage = resource.getrusage(RUSAGE_THREAD)
+    try:
+        prepare_stage_run(stage, run, cache)
+        if run['skip']:
+            return run['result']
+        try:
+            result = stage['run'](run['conf_file'])
+        except Exception:
+            close_stage_run(stage, run, False, cache)
+            raise
+        return close_stage_run(stage, run, result, cache)
+    finally:
+        # Time spent in this thread covers stages running in-process; wgdi commands add their own usage.
+        # The peak memory of an in-process stage can only be bounded by the peak of the whole pipeline.
+        usage = resource.getrusage(RUSAGE_THREAD)
+        record['user_seconds'] += usage.ru_utime - thread_usage.ru_utime
+        record['sys_seconds'] += usage.ru_stime - thread_usage.ru_stime
+        if record['exit_status'] is None and record['status'] not in ('cached', 'resumed'):
+            record['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        stage_context.metrics = None
+        end_stage_record(stage, run, report)
+
+def new_stage_graph(stages):
+    """
+    Create the graph of stages a scheduler runs: a stage depends on the stages producing its inputs.
+    :param stages: List of stage dictionaries
+    :return: A dictionary with the 'pending' stages by name, the 'producers' of every output
+             and the 'status' of every finished stage
+    """
+    graph = {'pending': {}, 'producers': {}, 'status': {}}
+    add_stages(graph, stages)
+    return graph
+
+def add_stages(graph, stages):
+    """
+    Add stages to a stage graph.
+    :param graph: The stage graph (see new_stage_graph)
+    :param stages: List of stage dictionaries
+    """
+    for stage in stages:
+        if stage['name'] in graph['pending'] or stage['name'] in graph['status']:
+            raise ValueError(f"Duplicate stage name: {stage['name']}")
+        for output in stage['outputs']:
+            if output in graph['producers']:
+                raise ValueError(f"Output {output} is produced by both {graph['producers'][output]} "
+                                 f"and {stage['name']}")
+            graph['producers'][output] = stage['name']
+        graph['pending'][stage['name']] = stage
+
+def stage_dependencies(graph, stage):
+    """
+    Find the stages producing the inputs of a stage.
+    :param graph: The stage graph
+    :param stage: The stage dictionary
+    :return: A set of stage names
+    """
+    producers = graph['producers']
+    return {producers[f] for f in stage['inputs'] if f in producers and producers[f] != stage['name']}
+
+def stage_priorities(graph, excluded=lambda stage: False, estimate=None):
+    """
+    Weigh the chain of work every pending stage heads: its weight plus the heaviest chain of the stages
+    depending on it.
+    :param graph: The stage graph
+    :param excluded: Callable telling the stages that do not count towards the chains of others
+    :param estimate: Callable weighing a stage in place of its weight, such as its predicted runtime
+                     (see new_runtime_estimator), or None
+    :return: A dictionary mapping the names of the pending stages to their priority
+    """
+    pending = graph['pending']
+    dependents = collections.defaultdict(set)
+    for name, stage in pending.items():
+        if excluded(stage):
+            continue
+        for dep in stage_dependencies(graph, stage):
+            dependents[dep].add(name)
+    priority = {}
+
+    def chain(name):
+        if name not in priority:
+            weight = estimate(pending[name]) if estimate else pending[name].get('weight', 1)
+            priority[name] = weight + max(
+                (chain(dependent) for dependent in dependents[name]), default=0)
+        return priority[name]
+
+    return {name: chain(name) for name in pending}
+
+def skip_stage(graph, name, reason, report=None):
+    """
+    Skip a pending stage.
+    :param graph: The stage graph
+    :param name: Name of the stage
+    :param reason: Why the stage is skipped
+    :param report: A list the stage's record is appended to, or None
+    """
+    console(f"Skipping stage {name}: {reason}")
+    graph['status'][name] = 'skipped'
+    stage = graph['pending'].pop(name)
+    if report is not None:
+        report.append(new_stage_record(stage, 'skipped'))
+
+def ready_stages(graph, fail_fast=False, report=None):
+    """
+    Find the pending stages whose dependencies are done, skipping those that can no longer run.
+    :param graph: The stage graph
+    :param fail_fast: Skip every pending stage once a stage failed
+    :param report: A list the records of skipped stages are appended to, or None
+    :return: A list of stage names
+    """
+    ready = []
+    stopped = fail_fast and any(s in ('failed', 'timeout') for s in graph['status'].values())
+    for name, stage in list(graph['pending'].items()):
+        deps = stage_dependencies(graph, stage)
+        if stopped or any(graph['status'].get(dep) not in (None, 'done') for dep in deps):
+            skip_stage(graph, name, "a stage failed" if stopped else "an upstream stage did not complete", report)
+        elif all(graph['status'].get(dep) == 'done' for dep in deps):
+            ready.append(name)
+    return ready
+
+def finish_stage(graph, name, result, error=None):
+    """
+    Record the outcome of a stage in the stage graph, adding the stages it returned.
+    :param graph: The stage graph
+    :param name: Name of the stage
+    :param result: The value the stage returned
+    :param error: The exception the stage raised, or None
+    """
+    if error is not None:
+        console(f"Stage {name} failed: {error}")
+        graph['status'][name] = 'failed'
+    elif result is False:
+        console(f"Stage {name} failed")
+        graph['status'][name] = 'failed'
+    else:
+        graph['status'][name] = 'done'
+        console(f"Finished stage: {name}")
+        if isinstance(result, list):
+            add_stages(graph, result)
+
+def run_stages(stages, max_workers, cache=None, report=None, resources=None, fail_fast=False, figure_workers=None,
+               estimate=None):
+    """
+    Run stages concurrently, starting each one as soon as every stage producing its inputs has finished
+    and a worker is free. Among the ready stages, the one heading the heaviest chain of dependent stages
+    (by stage weight, or by predicted runtime with estimate) starts first, so long stages do not end up
+    holding back the end of the run.
+    With a resource manager, stages also wait for a free CPU, and multi-process stages get a share of
+    the free CPUs when they start (see allot_processes).
+    Inputs that no stage produces are expected to exist already.
+    A stage may return a list of new stages, which are added to the graph when it finishes.
+    A failed stage stops the stages depending on it; with fail_fast, it stops every stage not yet started.
+    With figure_workers, the stages only drawing figures (see make_stage) are deferred to a separate pool
+    of that many workers, where their commands run at a lower CPU priority (FIGURE_NICENESS); they take
+    neither workers nor CPUs from the other stages and do not count towards their chains of work.
+    :param stages: List of stage dictionaries
+    :param max_workers: Maximum number of stages running at the same time
+    :param cache: The stage cache, or None to run every stage
+    :param report: A list the performance record of every stage is appended to, or None
+    :param resources: The resource manager (see new_resource_manager), or None
+    :param fail_fast: Skip every pending stage once a stage fails
+    :param figure_workers: Number of workers drawing figures apart from the other stages, or None
+                           to run them like any other stage
+    :param estimate: Callable weighing a stage in place of its weight (see new_runtime_estimator), or None
+    :return: A dictionary mapping stage names to 'done', 'failed' or 'skipped'
+    """
+    graph = new_stage_graph(stages)
+    pending = graph['pending']
+
+    def deferred(stage):
+        return figure_workers is not None and stage.get('figure')
+
+    running = {}
+    drawing = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+            ThreadPoolExecutor(max_workers=figure_workers or 1) as figure_executor:
+        while pending or running:
+            ready = []
+            for name in ready_stages(graph, fail_fast, report):
+                if deferred(pending[name]):
+                    # Queued behind the figures already waiting, once the results they draw are on disk
+                    future = figure_executor.submit(execute_stage, pending.pop(name), cache, report,
+                                                    niceness=FIGURE_NICENESS)
+                    running[future] = name
+                    drawing.add(name)
+                else:
+                    ready.append(name)
+            slots = max_workers - (len(running) - len(drawing))
+            if resources is not None:
+                slots = min(slots, resources['cpus'] - sum(resources['held'].values()))
+            if ready and slots > 0:
+                priority = stage_priorities(graph, deferred, estimate)
+                starting = [pending.pop(name) for name in sorted(ready, key=lambda name: -priority[name])[:slots]]
+                allotted = allot_processes(resources, starting) if resources is not None else {}
+                for stage in starting:
+                    future = executor.submit(execute_stage, stage, cache, report, allotted.get(stage['name']))
+                    running[future] = stage['name']
+            if not running:
+                # Every remaining stage waits on a stage that will never run
+                for name in list(pending):
+                    skip_stage(graph, name, "its inputs are never produced", report)
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                drawing.discard(name)
+                if resources is not None:
+                    resources['held'].pop(name, None)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    finish_stage(graph, name, False, e)
+                else:
+                    finish_stage(graph, name, result)
+    return graph['status']
+
+def call_in_stage_context(stage, run, func, *args):
+    """
+    Call a function of a stage in the stage context of the stage (see enter_stage_context).
+    :param stage: The stage dictionary
+    :param run: The dictionary returned by new_stage_run
+    :param func: The function
+    :param args: Its arguments
+    :return: The value returned by func
+    """
+    enter_stage_context(stage, run['processes'], run['niceness'], run['record'])
+    try:
+        return func(*args)
+    finally:
+        stage_context.metrics = None
+
+async def execute_stage_async(stage, cache=None, report=None, processes=None, niceness=None, timeout=None):
+    """
+    Run a stage as execute_stage does without blocking the event loop: the command of a wgdi stage
+    (see make_wgdi_stage) runs as an asyncio subprocess, while configuration files, the stage cache
+    and the stages running in-process run in threads of the default executor.
+    A wgdi command running longer than timeout is stopped, the stage is recorded as 'timeout' and
+    asyncio.TimeoutError raised; if the task is cancelled, its command is stopped and the stage recorded
+    as 'cancelled'. A stage running in-process, including the wgdi commands it runs, cannot be stopped
+    and finishes in its thread.
+    :param stage: The stage dictionary
+    :param cache: The stage cache, or None to always run
+    :param report: A list the stage's performance record is appended to (see new_stage_record), or None
+    :param processes: Number of processes allotted to the stage (see stage_processes), or None
+    :param niceness: Niceness increment of the command of the stage, or None
+    :param timeout: Seconds the wgdi command of the stage may run, or None
+    :return: The value returned by the stage's run callable, or its command's result
+    """
+    command = stage.get('command')
+    if not command:
+        return await asyncio.to_thread(execute_stage, stage, cache, report, processes, niceness)
+    run = new_stage_run(stage, processes, niceness)
+    stage_context.metrics = None
+    try:
+        await asyncio.to_thread(call_in_stage_context, stage, run, prepare_stage_run, stage, run, cache)
+        if run['skip']:
+            return run['result']
+        try:
+            result = None
+            if command.get('before'):
+                result = await asyncio.to_thread(call_in_stage_context, stage, run, command['before'], run['conf_file'])
+            if result is None:
+                result = await run_wgdi_command_async(command['option'], run['conf_file'], command.get('stdout_file'),
+                                                      stage.get('workdir'), stage['name'], niceness, timeout,
+                                                      run['record'])
+            if result and command.get('after'):
+                result = await asyncio.to_thread(call_in_stage_context, stage, run, command['after'], run['conf_file'])
+        except BaseException as e:
+            def close_stopped_run():
+                close_stage_run(stage, run, False, cache)
+                if isinstance(e, asyncio.TimeoutError):
+                    run['record']['status'] = 'timeout'
+                elif isinstance(e, asyncio.CancelledError):
+                    run['record']['status'] = 'cancelled'
+
+            # Off the event loop, as the journal is synced to disk; shielded, so a second cancellation
+            # does not leave the stage half closed
+            await asyncio.shield(asyncio.to_thread(close_stopped_run))
+            raise
+        return await asyncio.to_thread(close_stage_run, stage, run, result, cache)
+    finally:
+        end_stage_record(stage, run, report)
+
+async def run_stages_async(stages, max_workers, cache=None, report=None, resources=None, fail_fast=False,
+                           figure_workers=None, stage_timeout=None, estimate=None):
+    """
+    Run stages as run_stages does, as tasks of the running asyncio event loop (see execute_stage_async),
+    so that one process can run many pipelines without a thread per running command.
+    A stage whose command times out stops the stages depending on it, like a failed stage.
+    If the task running the stages is cancelled, the running stages are cancelled and the stages
+    not yet started recorded as 'cancelled' before asyncio.CancelledError is raised again.
+    :param stages: List of stage dictionaries
+    :param max_workers: Maximum number of stages running at the same time
+    :param cache: The stage cache, or None to run every stage
+    :param report: A list the performance record of every stage is appended to, or None
+    :param resources: The resource manager (see new_resource_manager), or None
+    :param fail_fast: Skip every pending stage once a stage fails
+    :param figure_workers: Number of stages drawing figures at the same time apart from the other stages,
+                           or None to run them like any other stage
+    :param stage_timeout: Seconds the wgdi command of a stage may run, or None
+    :param estimate: Callable weighing a stage in place of its weight (see new_runtime_estimator), or None
+    :return: A dictionary mapping stage names to 'done', 'failed', 'timeout', 'skipped' or 'cancelled'
+    """
+    graph = new_stage_graph(stages)
+    pending = graph['pending']
+    figure_slots = asyncio.Semaphore(figure_workers or 1)
+
+    def deferred(stage):
+        return figure_workers is not None and stage.get('figure')
+
+    async def draw(stage):
+        async with figure_slots:
+            return await execute_stage_async(stage, cache, report, niceness=FIGURE_NICENESS, timeout=stage_timeout)
+
+    running = {}
+    drawing = set()
+    try:
+        while pending or running:
+            ready = []
+            for name in ready_stages(graph, fail_fast, report):
+                if deferred(pending[name]):
+                    running[asyncio.ensure_future(draw(pending.pop(name)))] = name
+                    drawing.add(name)
+                else:
+                    ready.append(name)
+            slots = max_workers - (len(running) - len(drawing))
+            if resources is not None:
+                slots = min(slots, resources['cpus'] - sum(resources['held'].values()))
+            if ready and slots > 0:
+                priority = stage_priorities(graph, deferred, estimate)
+                starting = [pending.pop(name) for name in sorted(ready, key=lambda name: -priority[name])[:slots]]
+                allotted = allot_processes(resources, starting) if resources is not None else {}
+                for stage in starting:
+                    task = asyncio.ensure_future(execute_stage_async(stage, cache, report, allotted.get(stage['name']),
+                                                                     timeout=stage_timeout))
+                    running[task] = stage['name']
+            if not running:
+                for name in list(pending):
+                    skip_stage(graph, name, "its inputs are never produced", report)
+                break
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                name = running.pop(task)
+                drawing.discard(name)
+                if resources is not None:
+                    resources['held'].pop(name, None)
+                try:
+                    result = task.result()
+                except asyncio.TimeoutError:
+                    console(f"Stage {name} timed out")
+                    graph['status'][name] = 'timeout'
+                except Exception as e:
+                    finish_stage(graph, name, False, e)
+                else:
+                    finish_stage(graph, name, result)
+    finally:
+        if running or pending:
+            # Cancelled: stop the running stages and their commands
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            for name in running.values():
+                graph['status'][name] = 'cancelled'
+                if resources is not None:
+                    resources['held'].pop(name, None)
+            for name, stage in list(pending.items()):
+                graph['status'][name] = 'cancelled'
+                if report is not None:
+                    report.append(new_stage_record(stage, 'cancelled'))
+                del pending[name]
+    return graph['status']
+
+def build_ks_stages(name1, name2, found_files, options=None, workdir=None):
+    """
+    Declare the stages computing {name1}_ks_result.ks. With more than one shard, the collinearity
+    pairs are split into ks_shards chunks, each chunk runs its own wgdi -ks and the results are merged.
+    A shard whose inputs have not changed is reused from the stage cache, so reruns only repeat failed shards.
+    With a Ks store, only the pairs missing from the store are sent to the shards, and the Ks file
+    is assembled from the stored and the new results.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :param options: The pipeline options (see build_pair_stages)
+    :param workdir: Directory the pair's files are written to (default: the current directory)
+    :return: A list of stage dictionaries
+    """
+    options = options or {}
+    path = functools.partial(os.path.join, workdir or '')
+    seq_inputs = [found_files[k] for k in ('cds', 'pep') if k in found_files]
+    collinearity_file = path(f"{name1}_{name2}_collinearity.txt")
+    ks_file = path(f"{name1}_ks_result.ks")
+    ks_shards = max(1, options.get('ks_shards') or 1)
+    ks_store = None
+    if options.get('ks_store'):
+        ks_store = {'file': options['ks_store'], 'cds': found_files.get('cds', ''), 'pep': found_files.get('pep', ''),
+                    'aligner': KS_ALIGNER}
+    elif ks_shards == 1:
+        return [make_wgdi_stage('ks', seq_inputs + [collinearity_file], [ks_file], '-ks',
+                                conf=lambda: create_ks_conf_file(name1, name2, found_files, workdir), weight=50)]
+
+    shard_dir = f"{name1}_{name2}_ks_shards"
+    pairs_files = [path(f"{shard_dir}/pairs_{i + 1}.txt") for i in range(ks_shards)]
+    shard_ks_files = [path(f"{shard_dir}/ks_{i + 1}.ks") for i in range(ks_shards)]
+
+    def run_split(conf_file):
+        os.makedirs(path(shard_dir), exist_ok=True)
+        if ks_store is None:
+            split_collinearity_file(collinearity_file, pairs_files)
+        else:
+            split_ks_store_pairs(collinearity_file, pairs_files, shard_ks_files, ks_store)
+
+    def run_merge(conf_file):
+        merge_ks_shards(collinearity_file, shard_ks_files, ks_file, ks_store)
+
+    split_inputs = [collinearity_file] + (seq_inputs if ks_store else [])
+    stages = [make_stage('ks_split', split_inputs, pairs_files, run_split, intermediate=True)]
+    for i in range(ks_shards):
+        def shard_conf(shard_num=i + 1):
+            return create_ks_shard_conf_file(name1, name2, shard_num, found_files, workdir)
+
+        def empty_shard(conf_file, i=i):
+            return write_empty_ks_shard(pairs_files[i], shard_ks_files[i])
+
+        stages.append(make_wgdi_stage(f"ks_shard_{i + 1}", seq_inputs + [pairs_files[i]], [shard_ks_files[i]],
+                                      '-ks', conf=shard_conf, before=empty_shard, weight=50 / ks_shards,
+                                      intermediate=True))
+    stages.append(make_stage('ks_merge', split_inputs + shard_ks_files, [ks_file], run_merge))
+    return stages
+
+def build_prefilter_stages(name1, name2, found_files, options=None, workdir=None):
+    """
+    Declare the stage prefiltering the BLAST file of a pair, unless disabled by the 'blast_prefilter' option.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :param options: A dictionary of pipeline options, see build_pair_stages
+    :param workdir: Directory the pair's files are written to (default: the current directory)
+    :return: A tuple (stages, found_files); found_files has the filtered file as BLAST file if prefiltered
+    """
+    options = options or {}
+    if not options.get('blast_prefilter', True) or not all(k in found_files for k in ('blast', 'gff1', 'gff2')):
+        return [], found_files
+    path = functools.partial(os.path.join, workdir or '')
+    filtered_file = path(f"{name1}_{name2}_filtered.blast")
+    columns_dir = path(f"{name1}_{name2}_blast_columns")
+    blast_inputs = [found_files['blast'], found_files['gff1'], found_files['gff2']]
+
+    def run_prefilter(conf_file):
+        prefilter_blast_file(*blast_inputs, filtered_file, columns_dir)
+
+    # The stages reading the BLAST file get the filtered file instead
+    return ([make_stage('blast_prefilter', blast_inputs, [filtered_file], run_prefilter, weight=10,
+                        intermediate=True)],
+            dict(found_files, blast=filtered_file))
+
+def build_icl_sweep_stages(name1, name2, found_files, sweep, options=None, workdir=None):
+    """
+    Declare one wgdi -icl stage per combination of a parameter sweep, all reading the same (prefiltered)
+    inputs and running concurrently, and a stage comparing their results in {name1}_{name2}_icl_sweep.csv.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :param sweep: A list of (param, values) tuples, see icl_sweep_grid
+    :param options: A dictionary of pipeline options, see build_pair_stages
+    :param workdir: Directory the pair's files are written to (default: the current directory)
+    :return: A list of stage dictionaries
+    """
+    path = functools.partial(os.path.join, workdir or '')
+    stages, found_files = build_prefilter_stages(name1, name2, found_files, options, workdir)
+    genome_inputs = [found_files[k] for k in ('blast', 'gff1', 'gff2', 'lens1', 'lens2') if k in found_files]
+    runs = []
+
+    def create_sweep_conf(params, suffix):
+        return create_icl_conf_file(name1, name2, found_files, workdir, stage_processes(), params, suffix)
+
+    for run_num, params in enumerate(icl_sweep_grid(sweep), 1):
+        suffix = f"_sweep_{run_num}"
+        collinearity_file = path(f"{name1}_{name2}_collinearity{suffix}.txt")
+        runs.append((params, collinearity_file))
+        stages.append(make_wgdi_stage(f"collinearity{suffix}", genome_inputs, [collinearity_file], '-icl',
+                                      conf=functools.partial(create_sweep_conf, params, suffix),
+                                      weight=20, multiprocess=True))
+
+    def run_summary(conf_file):
+        write_icl_sweep_table(runs, path(f"{name1}_{name2}_icl_sweep.csv"))
+
+    stages.append(make_stage('icl_sweep_summary', [collinearity_file for _, collinearity_file in runs],
+                             [path(f"{name1}_{name2}_icl_sweep.csv")], run_summary))
+    return stages
+
+def build_pair_stages(name1, name2, found_files, options=None, workdir=None):
+    """
+    Declare the stages of the pipeline for one pair of species.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :param options: A dictionary of pipeline options: 'blast_prefilter' (True by default) to have the stages
+                    read the BLAST file through prefilter_blast_file, 'ks_shards' and 'ks_store'
+                    (see build_ks_stages), how the Ks peaks are chosen (see resolve_peaks),
+                    'kspeaks_engine', 'kspeaks_plots', 'peaksfit_engine' and 'peaksfit_plots'
+                    (see build_peak_stages), 'figures' ('inline' by default, 'deferred' or 'none'; with
+                    'deferred' or 'none' and the native kspeaks engine, the kspeaks table is selected in-process
+                    and its figure drawn by a separate stage; 'none' leaves out the stages only drawing figures),
+                    and 'icl_sweep' to run a collinearity parameter sweep instead of the pipeline
+                    (see build_icl_sweep_stages)
+    :param workdir: Directory the pair's files are written to (default: the current directory)
+    :return: A list of stage dictionaries
+    """
+    options = options or {}
+    if options.get('icl_sweep'):
+        return build_icl_sweep_stages(name1, name2, found_files, options['icl_sweep'], options, workdir)
+    path = functools.partial(os.path.join, workdir or '')
+    prefilter_stages, found_files = build_prefilter_stages(name1, name2, found_files, options, workdir)
+    genome_inputs = [found_files[k] for k in ('blast', 'gff1', 'gff2', 'lens1', 'lens2') if k in found_files]
+    lens_inputs = [found_files[k] for k in ('lens1', 'lens2') if k in found_files]
+    collinearity_file = path(f"{name1}_{name2}_collinearity.txt")
+    ks_file = path(f"{name1}_ks_result.ks")
+    blockinfo_file = path(f"{name1}_{name2}_blockinfo.csv")
+    kspeaks_file = path(f"{name1}_{name2}_kspeaks_distri.csv")
+    kspeaks_figure_file = path(f"{name1}_{name2}_kspeaks_distri.pdf")
+    peaks_file = path(f"{name1}_{name2}_peaks.txt")
+    figures = options.get('figures', 'inline')
+
+    def run_peaks(conf_file):
+        peaks = resolve_peaks(kspeaks_file, options)
+        write_peaks_file(peaks_file, peaks)
+        return build_peak_stages(name1, name2, found_files, peaks, options, workdir)
+
+    def resume_peaks():
+        return build_peak_stages(name1, name2, found_files, read_peaks_file(peaks_file), options, workdir)
+
+    if figures == 'inline' or options.get('kspeaks_engine', 'native') != 'native':
+        kspeaks_stages = [
+            make_wgdi_stage('kspeaks', [blockinfo_file], [kspeaks_file, kspeaks_figure_file], '-kp',
+                            conf=lambda: create_kspeaks_conf_file(name1, name2, found_files, workdir)),
+        ]
+    else:
+        # The table is selected in-process and the figure, if any, drawn by a stage nothing waits on
+        def run_kspeaks(conf_file):
+            filter_kspeaks_blockinfo(blockinfo_file, [path(create_kspeaks_conf_file(name1, name2, found_files,
+                                                                                    workdir))])
+
+        kspeaks_stages = [make_stage('kspeaks', [blockinfo_file], [kspeaks_file], run_kspeaks)]
+        if figures != 'none':
+            def remove_plot_table(conf_file):
+                return remove_scratch_file(path(f"{name1}_{name2}_kspeaks_distri.plot.csv"))
+
+            kspeaks_stages.append(make_wgdi_stage(
+                'kspeaks_plot', [blockinfo_file], [kspeaks_figure_file], '-kp',
+                conf=lambda: create_kspeaks_conf_file(name1, name2, found_files, workdir, plot_only=True),
+                after=remove_plot_table, figure=True))
+    figure_stages = [] if figures == 'none' else [
+        make_wgdi_stage('dotplot', genome_inputs, [path(f"{name1}_{name2}_dotplot.pdf")], '-d',
+                        conf=lambda: create_dotplot_conf_file(name1, name2, found_files, workdir), weight=5,
+                        figure=True),
+        make_wgdi_stage('blockks', lens_inputs + [blockinfo_file], [path(f"{name1}_{name2}_blockks.pdf")], '-bk',
+                        conf=lambda: create_blockks_conf_file(name1, name2, found_files, workdir), figure=True),
+    ]
+    return prefilter_stages + figure_stages + [
+        make_wgdi_stage('collinearity', genome_inputs, [collinearity_file], '-icl',
+                        conf=lambda: create_icl_conf_file(name1, name2, found_files, workdir, stage_processes()),
+                        weight=20, multiprocess=True),
+    ] + build_ks_stages(name1, name2, found_files, options, workdir) + [
+        make_wgdi_stage('blockinfo', genome_inputs + [collinearity_file, ks_file], [blockinfo_file], '-bi',
+                        conf=lambda: create_blockinfo_conf_file(name1, name2, found_files, workdir), weight=5),
+    ] + kspeaks_stages + [
+        make_stage('peaks', [kspeaks_file], [peaks_file], run_peaks, expand=resume_peaks),
+    ]
+
+def build_peak_stages(name1, name2, found_files, peaks, options=None, workdir=None):
+    """
+    Declare the filtered kspeaks, blockks and peaksfit stages of every Ks peak, and the ksfigure stage
+    that combines them. Each peak writes its own files, so the peaks run concurrently.
+    With the native kspeaks engine (options['kspeaks_engine'], 'native' by default), one kspeaks_filter stage
+    writes the blocks of every peak in a single pass over the block information, and the kspeaks figures are
+    drawn by separate stages nothing waits on, unless options['kspeaks_plots'] is False.
+    The 'wgdi' engine runs wgdi -kp for every peak instead.
+    With options['figures'] set to 'none', the stages only drawing figures are left out.
+    Likewise, the native peaksfit engine (options['peaksfit_engine']) fits the Gaussians of every peak in one
+    peaksfit stage (see fit_ks_peaks), and wgdi -pf only draws the peaksfit figures, unless
+    options['peaksfit_plots'] is False; the 'wgdi' engine takes the fitted parameters from wgdi -pf.
+    :param name1: The first name
+    :param name2: The second name
+    :param found_files: A dictionary containing the paths of the found files
+    :param peaks: A list of (ksarea_start, ksarea_end) tuples
+    :param options: The pipeline options (see build_pair_stages)
+    :param workdir: Directory the pair's files are written to (default: the current directory)
+    :return: A list of stage dictionaries
+    """
+    if len(set(peaks)) != len(peaks):
+        raise ValueError(f"Ks peaks must be distinct: {peaks}")
+    options = options or {}
+    kspeaks_engine = options.get('kspeaks_engine', 'native')
+    peaksfit_engine = options.get('peaksfit_engine', 'native')
+    figures = options.get('figures', 'inline')
+    path = functools.partial(os.path.join, workdir or '')
+    lens_inputs = [found_files[k] for k in ('lens1', 'lens2') if k in found_files]
+    blockinfo_file = path(f"{name1}_{name2}_blockinfo.csv")
+    stages = []
+    if kspeaks_engine == 'native':
+        def run_filter(conf_file):
+            conf_files = [path(create_filtered_kspeaks_conf_file(name1, name2, ksarea_start, ksarea_end, i + 1,
+                                                                 found_files, workdir=workdir))
+                          for i, (ksarea_start, ksarea_end) in enumerate(peaks)]
+            filter_kspeaks_blockinfo(blockinfo_file, conf_files)
+
+        stages.append(make_stage('kspeaks_filter', [blockinfo_file],
+                                 [path(f"{name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri.csv")
+                                  for ksarea_start, ksarea_end in peaks], run_filter))
+    for i, (ksarea_start, ksarea_end) in enumerate(peaks):
+        peak_num = i + 1
+        distri_file = path(f"{name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri.csv")
+        figure_file = path(f"{name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri.pdf")
+
+        def kspeaks_conf(ksarea_start=ksarea_start, ksarea_end=ksarea_end, peak_num=peak_num):
+            return create_filtered_kspeaks_conf_file(name1, name2, ksarea_start, ksarea_end, peak_num, found_files,
+                                                     workdir=workdir)
+
+        def blockks_conf(ksarea_start=ksarea_start, ksarea_end=ksarea_end, peak_num=peak_num):
+            return create_filtered_blockks_conf_file(name1, name2, ksarea_start, ksarea_end, peak_num, found_files,
+                                                     workdir)
+
+        def peaksfit_conf(ksarea_start=ksarea_start, ksarea_end=ksarea_end, peak_num=peak_num):
+            return create_peaksfit_conf_file(name1, name2, ksarea_start, ksarea_end, peak_num, found_files, workdir)
+
+        def save_params(conf_file, peak_num=peak_num):
+            return save_peaksfit_params(peak_num)
+
+        if kspeaks_engine != 'native':
+            stages.append(make_wgdi_stage(f"kspeaks_peak_{peak_num}", [blockinfo_file], [distri_file, figure_file],
+                                          '-kp', conf=kspeaks_conf))
+        elif options.get('kspeaks_plots', True) and figures != 'none':
+            def plot_conf(ksarea_start=ksarea_start, ksarea_end=ksarea_end, peak_num=peak_num):
+                return create_filtered_kspeaks_conf_file(name1, name2, ksarea_start, ksarea_end, peak_num,
+                                                         found_files, plot_only=True, workdir=workdir)
+
+            def remove_plot_table(conf_file, scratch_file=distri_file[:-len('.csv')] + '.plot.csv'):
+                return remove_scratch_file(scratch_file)
+
+            stages.append(make_wgdi_stage(f"kspeaks_plot_peak_{peak_num}", [blockinfo_file], [figure_file], '-kp',
+                                          conf=plot_conf, after=remove_plot_table, figure=True))
+        if figures != 'none':
+            stages.append(make_wgdi_stage(f"blockks_peak_{peak_num}", lens_inputs + [distri_file],
+                                          [path(f"{name1}_{name2}_blockks_peaks_{peak_num}.pdf")], '-bk',
+                                          conf=blockks_conf, figure=True))
+        if peaksfit_engine != 'native':
+            stages.append(make_wgdi_stage(f"peaksfit_peak_{peak_num}", [distri_file],
+                                          [path(f"{name1}_{name2}_peaksfit_{peak_num}.pdf"),
+                                           path(f"peaksfit_{peak_num}_result.txt"),
+                                           path(f"peaksfit_{peak_num}_params.json")],
+                                          '-pf', conf=peaksfit_conf, stdout_file=f"peaksfit_{peak_num}_result.txt",
+                                          after=save_params))
+        elif options.get('peaksfit_plots', True) and figures != 'none':
+            def peaksfit_plot_conf(ksarea_start=ksarea_start, ksarea_end=ksarea_end, peak_num=peak_num):
+                return create_peaksfit_conf_file(name1, name2, ksarea_start, ksarea_end, peak_num, found_files,
+                                                 workdir, plot_only=True)
+
+            stages.append(make_wgdi_stage(f"peaksfit_plot_peak_{peak_num}", [distri_file],
+                                          [path(f"{name1}_{name2}_peaksfit_{peak_num}.pdf"),
+                                           path(f"peaksfit_{peak_num}_result.txt")],
+                                          '-pf', conf=peaksfit_plot_conf, stdout_file=f"peaksfit_{peak_num}_result.txt",
+                                          figure=True))
+    if peaksfit_engine == 'native':
+        def run_fit(conf_file):
+            conf_files = [path(create_peaksfit_conf_file(name1, name2, ksarea_start, ksarea_end, i + 1, found_files,
+                                                         workdir))
+                          for i, (ksarea_start, ksarea_end) in enumerate(peaks)]
+            return run_peaksfit_native(conf_files, [path(f"peaksfit_{i + 1}_params.json") for i in range(len(peaks))])
+
+        stages.append(make_stage('peaksfit', [path(f"{name1}_{name2}_kspeaks_{ksarea_start}_{ksarea_end}_distri.csv")
+                                              for ksarea_start, ksarea_end in peaks],
+                                 [path(f"peaksfit_{i + 1}_params.json") for i in range(len(peaks))], run_fit))
+
+    ksfigure_data_file = path(f"{name1}_{name2}_ksfigure_data.csv")
+
+    def run_ksfigure_data(conf_file):
+        peaks_params = [read_peaksfit_params(i + 1, workdir)['params'] for i in range(len(peaks))]
+        create_ksfigure_data_conf_file(name1, name2, peaks_params, workdir)
+
+    stages.append(make_stage('ksfigure_data', [path(f"peaksfit_{i + 1}_params.json") for i in range(len(peaks))],
+                             [ksfigure_data_file], run_ksfigure_data))
+    if figures != 'none':
+        stages.append(make_wgdi_stage('ksfigure', [ksfigure_data_file], [path(f"{name1}_{name2}_ksfigure.pdf")], '-kf',
+                                      conf=lambda: create_ksfigure_conf_file(name1, name2, workdir), figure=True))
+    return stages
+
+def parse_ks_value(text):
+    """
+    Parse a Ks value, keeping integers as integers so that file names match what the user typed.
+    :param text: The value as text
+    :return: An int or a float
+    """
+    text = text.strip()
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def parse_peak(text):
+    """
+    Parse a Ks peak written as START,END (or START END).
+    :param text: The peak as text
+    :return: A (ksarea_start, ksarea_end) tuple
+    """
+    fields = text.replace(',', ' ').split()
+    if len(fields) != 2:
+        raise ValueError(f"Expected a Ks peak as START,END, got: {text!r}")
+    ksarea_start, ksarea_end = parse_ks_value(fields[0]), parse_ks_value(fields[1])
+    if ksarea_start >= ksarea_end:
+        raise ValueError(f"Ks peak start must be below its end: {text!r}")
+    return ksarea_start, ksarea_end
+
+def parse_icl_sweep(text):
+    """
+    Parse the values a wgdi -icl parameter takes in a sweep, written as PARAM=VALUE/VALUE/...
+    :param text: The parameter and its values as text
+    :return: A (param, values) tuple
+    """
+    param, _, values = text.partition('=')
+    param = param.strip()
+    values = [value.strip() for value in values.split('/') if value.strip()]
+    if param not in ICL_PARAMETERS:
+        raise ValueError(f"Expected one of {', '.join(ICL_PARAMETERS)} as sweep parameter, got: {text!r}")
+    if not values:
+        raise ValueError(f"Expected the sweep values as {param}=VALUE/VALUE/..., got: {text!r}")
+    return param, values
+
+def icl_sweep_grid(sweep):
+    """
+    List the combinations of a parameter sweep.
+    :param sweep: A list of (param, values) tuples, see parse_icl_sweep; a parameter given twice
+                  takes the values of both
+    :return: A list of dictionaries of ICL_PARAMETERS, one per combination
+    """
+    grid = {}
+    for param, values in sweep:
+        grid.setdefault(param, [])
+        grid[param] += [value for value in values if value not in grid[param]]
+    return [dict(ICL_PARAMETERS, **dict(zip(grid, combination)))
+            for combination in itertools.product(*grid.values())]
+
+def read_peaks_file(peaks_file):
+    """
+    Read Ks peaks from a file with one START,END (or START END) per line; blank lines and # comments are ignored.
+    :param peaks_file: Path to the file
+    :return: A list of (ksarea_start, ksarea_end) tuples
+    """
+    peaks = []
+    with open(peaks_file, 'r') as file:
+        for line in file:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                peaks.append(parse_peak(line))
+    return peaks
+
+def write_peaks_file(peaks_file, peaks):
+    """
+    Write Ks peaks in the format read by read_peaks_file.
+    :param peaks_file: Path to the file
+    :param peaks: A list of (ksarea_start, ksarea_end) tuples
+    """
+    write_if_changed(peaks_file, ''.join(f"{ksarea_start},{ksarea_end}\n" for ksarea_start, ksarea_end in peaks))
+    print(f"File created: {peaks_file}")
+
+def detect_ks_peaks(kspeaks_file, max_peaks=None, min_prominence=0.1, grid_size=1000):
+    """
+    Detect the peaks of the Ks distribution of the collinear blocks in a kspeaks file.
+    A Gaussian kernel density (Scott's bandwidth) is estimated over the ks_median column;
+    each local maximum whose prominence is at least min_prominence times the highest density
+    becomes a peak, spanning the density minima on either side of it.
+    :param kspeaks_file: Path to the CSV file written by wgdi -kp
+    :param max_peaks: Keep only the most prominent max_peaks peaks, or None to keep all
+    :param min_prominence: Minimum prominence, relative to the highest density
+    :param grid_size: Number of points the density is evaluated at
+    :return: A list of (ksarea_start, ksarea_end) tuples in increasing Ks order
+    """
+    import numpy as np
+
+    with open(kspeaks_file, 'r', newline='') as file:
+        values = [row['ks_median'] for row in csv.DictReader(file)]
+    ks = np.asarray(values, dtype=float)
+    ks = ks[np.isfinite(ks) & (ks >= 0)]
+    if ks.size < 2 or ks.std() == 0:
+        raise ValueError(f"Not enough Ks values in {kspeaks_file} to detect peaks")
+
+    bandwidth = ks.std(ddof=1) * ks.size ** (-1 / 5)
+    grid = np.linspace(max(0.0, ks.min() - 3 * bandwidth), ks.max() + 3 * bandwidth, grid_size)
+    density = np.zeros(grid_size)
+    # Evaluate the kernels in chunks to bound memory on large block sets
+    for start in range(0, ks.size, 4096):
+        chunk = ks[start:start + 4096]
+        density += np.exp(-0.5 * ((grid[:, None] - chunk[None, :]) / bandwidth) ** 2).sum(axis=1)
+    density /= ks.size * bandwidth * np.sqrt(2 * np.pi)
+
+    slope = np.sign(np.diff(density))
+    maxima = np.flatnonzero((slope[:-1] > 0) & (slope[1:] <= 0)) + 1
+    minima = np.concatenate(([0], np.flatnonzero((slope[:-1] < 0) & (slope[1:] >= 0)) + 1, [grid_size - 1]))
+    peaks = []
+    for index in maxima:
+        left = minima[minima < index].max()
+        right = minima[minima > index].min()
+        prominence = density[index] - max(density[left], density[right])
+        if prominence >= min_prominence * density.max():
+            peaks.append((prominence, round(float(grid[left]), 2), round(float(grid[right]), 2)))
+    peaks.sort(reverse=True)
+    if max_peaks is not None:
+        peaks = peaks[:max_peaks]
+    return sorted((start, end) for _, start, end in peaks if start < end)
+
+def prompt_peaks():
+    """
+    Prompt the user for the number of Ks peaks and the start and end of each peak.
+    :return: A list of (ksarea_start, ksarea_end) tuples
+    """
+    peak_num = int(input("Enter peak number: "))
+    peaks = []
+    for i in range(peak_num):
+        ksarea_start = parse_ks_value(input("Enter peak start: "))
+        ksarea_end = parse_ks_value(input("Enter peak end: "))
+        peaks.append((ksarea_start, ksarea_end))
+    return peaks
+
+def resolve_peaks(kspeaks_file, peak_options):
+    """
+    Choose the Ks peaks to analyse: the peaks given on the command line or in a file, peaks detected
+    automatically from the kspeaks file, or, in an interactive session without either, the user's answers.
+    Non-interactive sessions never wait on standard input and fall back to automatic detection.
+    :param kspeaks_file: Path to the CSV file written by wgdi -kp
+    :param peak_options: A dictionary with optional keys 'peaks' (a list of (start, end) tuples),
+                         'peaks_file', 'auto' and 'max_peaks'
+    :return: A list of (ksarea_start, ksarea_end) tuples
+    """
+    peaks = list(peak_options.get('peaks') or [])
+    if peak_options.get('peaks_file'):
+        peaks += read_peaks_file(peak_options['peaks_file'])
+    if peaks:
+        return peaks
+    if peak_options.get('auto') or not sys.stdin.isatty():
+        peaks = detect_ks_peaks(kspeaks_file, peak_options.get('max_peaks'))
+        print(f"Detected Ks peaks: {', '.join(f'{start}-{end}' for start, end in peaks)}")
+        return peaks
+    return prompt_peaks()
+
+def read_manifest(manifest_file):
+    """
+    Read a batch manifest: one species pair per line, "name1 name2", optionally followed by
+    the Ks peaks START,END of the pair. Blank lines and lines starting with # are ignored.
+    :param manifest_file: Path to the manifest
+    :return: A list of (name1, name2, peaks) tuples
+    """
+    pairs = []
+    with open(manifest_file, 'r') as file:
+        for line_num, line in enumerate(file, 1):
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) < 2:
+                raise ValueError(f"{manifest_file}:{line_num}: expected 'name1 name2 [START,END ...]'")
+            try:
+                peaks = [parse_peak(field) for field in fields[2:]]
+            except ValueError as e:
+                raise ValueError(f"{manifest_file}:{line_num}: {e}")
+            pairs.append((fields[0], fields[1], peaks))
+    if len({(name1, name2) for name1, name2, _ in pairs}) != len(pairs):
+        raise ValueError(f"{manifest_file}: a species pair is listed twice")
+    return pairs
+
+def build_workspace_stages(pairs, options, input_index, force=(), use_cache=True, hash_inputs=False,
+                           artifact_dir=None, prefix_names=True, resume=False, root=None, staging=None):
+    """
+    Declare the stages of every pair of a run. Each pair runs in its own workspace, the directory
+    {name1}_{name2}, with its own stage cache and journal {name1}_{name2}_journal.jsonl, so that pairs
+    sharing a species never write the same files; with prefix_names, its stages are named {name1}_{name2}:{stage}.
+    The inputs of every pair are looked up in the index of the search roots.
+    With an artifact store, the inputs and outputs of every pair are published to it.
+    With a scratch staging, the inputs are copied to the scratch directory and every pair runs in a workspace there,
+    its outputs being copied back to its workspace (see new_scratch_staging); as the scratch workspaces do not
+    outlive the run, the stage cache, the journal and the artifact store are not used.
+    :param pairs: A list of (name1, name2, peaks) tuples, as returned by read_manifest
+    :param options: The pipeline options (see build_pair_stages); the peaks of a pair replace options['peaks']
+    :param input_index: The index of the search roots built by scan_search_roots
+    :param force: Names of stages to rerun even if cached (see new_stage_cache)
+    :param use_cache: Use the stage cache of every pair
+    :param hash_inputs: Fingerprint inputs by their contents instead of size and modification time
+    :param artifact_dir: Directory of the artifact store shared by the workspaces, or None
+    :param prefix_names: Prefix the stage names with the pair
+    :param resume: Skip the stages that the journal of a previous run records as done
+    :param root: Directory the workspaces are created in (default: the current directory)
+    :param staging: The scratch staging of the run (see new_scratch_staging), or None
+    :return: A list of stage dictionaries
+    """
+    stages = []
+    for name1, name2, peaks in pairs:
+        workdir = os.path.join(os.path.abspath(root or os.getcwd()), f"{name1}_{name2}")
+        os.makedirs(workdir, exist_ok=True)
+        found_files = search_files(name1, name2, input_index)
+        pair_options = dict(options, peaks=peaks or options.get('peaks'))
+        prefix = f"{name1}_{name2}:" if prefix_names else ''
+        if staging is not None:
+            input_stages, found_files = stage_scratch_inputs(staging, found_files)
+            scratch_workdir = os.path.join(staging['root'], f"{name1}_{name2}")
+            os.makedirs(scratch_workdir, exist_ok=True)
+            staging['workspaces'][scratch_workdir] = workdir
+            stages += input_stages + prefix_stages(
+                build_pair_stages(name1, name2, found_files, pair_options, scratch_workdir), prefix,
+                workdir=scratch_workdir, staging=staging)
+            continue
+        cache = None
+        if use_cache:
+            cache = new_stage_cache(os.path.join(workdir, f"{name1}_{name2}_stage_cache.json"), force, hash_inputs)
+        artifacts = None
+        if artifact_dir:
+            artifacts = new_artifact_store(artifact_dir, os.path.join(workdir, f"{name1}_{name2}_artifacts.json"))
+            publish_artifacts(artifacts, found_files.values(), link_stored=False)
+        journal = new_journal(os.path.join(workdir, f"{name1}_{name2}_journal.jsonl"), resume, force)
+        stages += prefix_stages(build_pair_stages(name1, name2, found_files, pair_options, workdir), prefix,
+                                cache, workdir, artifacts, journal)
+    return stages
+
+def print_runtime_plan(pairs, options, input_index, model, features, max_workers, cpus=1):
+    """
+    Print the stages a run would declare with their predicted runtimes, without running them: per pair,
+    the predicted time of every stage, the feature the prediction is based on and the pair's critical path,
+    then the total stage time and the wall time the run would take on max_workers workers.
+    The Ks peaks of a pair are those given, or as many as its peak feature (see pair_features).
+    :param pairs: A list of (name1, name2, peaks) tuples, as returned by read_manifest
+    :param options: The pipeline options (see build_pair_stages)
+    :param input_index: The index of the search roots built by scan_search_roots
+    :param model: The cost model (see fit_cost_model)
+    :param features: A dictionary mapping the workspace of every pair to its features
+    :param max_workers: Maximum number of stages running at the same time
+    :param cpus: Number of CPUs the stages share, the processes a multi-process stage is expected to get
+    """
+    estimate = new_runtime_estimator(model, features, cpus)
+    predicted = model.get(None, {}).get('seconds_per_weight') is not None
+    deferred = (lambda stage: stage.get('figure')) if options.get('figures') == 'deferred' else (lambda stage: False)
+    stages = []
+    for name1, name2, peaks in pairs:
+        workdir = os.path.join(os.getcwd(), f"{name1}_{name2}")
+        found_files = search_files(name1, name2, input_index)
+        pair_options = dict(options, peaks=peaks or options.get('peaks'))
+        measured = features[workdir]
+        print(f"{name1} {name2}: " + ', '.join(f"{feature} {measured[feature]}"
+                                               for feature in RUNTIME_FEATURES + ('ks_shards',)
+                                               if measured[feature] is not None))
+        pair_stages = build_pair_stages(name1, name2, found_files, pair_options, workdir)
+        if not pair_options.get('icl_sweep'):
+            # Stand-in peaks with outputs of their own
+            peaks = pair_options['peaks'] or [(i, i + 1) for i in range(measured['peaks'] or 1)]
+            pair_stages += build_peak_stages(name1, name2, found_files, peaks, pair_options, workdir)
+        pair_stages = prefix_stages(pair_stages, f"{name1}_{name2}:" if len(pairs) > 1 else '', workdir=workdir)
+        for stage in pair_stages:
+            seconds, basis = predict_stage_seconds(model, stage, measured, cpus)
+            print(f"  {stage['name']:<44} {'-' if seconds is None else f'{seconds:.1f}s':>10}  "
+                  f"{basis or 'no history'}")
+        if predicted:
+            priority = stage_priorities(new_stage_graph(pair_stages), deferred, estimate)
+            print(f"  {'critical path':<44} {max(priority.values(), default=0):>9.1f}s")
+        stages += pair_stages
+    if not predicted:
+        print("No runtime history yet: run the pipeline once to predict its stages")
+        return
+    total = sum(estimate(stage) for stage in stages)
+    critical_path = max(stage_priorities(new_stage_graph(stages), deferred, estimate).values(), default=0)
+    print(f"Predicted stage time: {total:.1f}s")
+    print(f"Predicted wall time on {max_workers} workers: {max(critical_path, total / max_workers):.1f}s "
+          f"(critical path {critical_path:.1f}s)")
+
+def new_pipeline(name1, name2, options=None, search_roots=None, root=None, max_workers=None, cpus=None,
+                 use_cache=True, force=(), hash_inputs=False, artifact_dir=None, resume=False, fail_fast=False,
+                 figure_workers=None, stage_timeout=None, scratch=None, history_file=None):
+    """
+    Create the pipeline of one pair of species for a Python program to run with run_pipeline, instead of
+    running this script. Its stages are those the script runs for the pair, in the workspace {root}/{name1}_{name2}
+    (see build_workspace_stages); the Ks peaks not given in options are detected, never asked for.
+    Nothing changes the current directory, so one process can run the pipelines of many pairs at the same time.
+    :param name1: The first name
+    :param name2: The second name
+    :param options: The pipeline options (see build_pair_stages)
+    :param search_roots: Directories holding the input files, in order of precedence (default: the current directory)
+    :param root: Directory the workspace is created in (default: the current directory)
+    :param max_workers: Maximum number of stages running at the same time (default: the number of CPUs)
+    :param cpus: Number of CPUs the stages share (default: detect_cpu_count())
+    :param use_cache: Use the stage cache of the workspace
+    :param force: Names of stages to rerun even if cached
+    :param hash_inputs: Fingerprint inputs by their contents instead of size and modification time
+    :param artifact_dir: Directory of the artifact store, or None
+    :param resume: Skip the stages that the journal of a previous run records as done
+    :param fail_fast: Skip every pending stage once a stage fails
+    :param figure_workers: Number of stages drawing figures apart from the other stages, or None
+                           (see run_stages_async)
+    :param stage_timeout: Seconds the wgdi command of a stage may run, or None
+    :param scratch: Node-local scratch directory the pipeline runs in (see new_scratch_staging), or None;
+                    a pipeline staged in scratch runs once
+    :param history_file: Runtime history file (see load_runtime_history), or None; with one, the stages on the
+                         longest predicted chains start first and every run adds its stages to the history
+    :return: A dictionary with the pair's 'name1', 'name2', 'workdir', 'stages', the 'resources', 'staging'
+             and settings they run with, and the 'report' and 'status' of the last run
+    """
+    input_index = scan_search_roots(search_roots or [os.getcwd()])
+    missing = find_missing_inputs(name1, name2, search_files(name1, name2, input_index))
+    if missing:
+        raise FileNotFoundError(f"Missing inputs for {name1} {name2}: {', '.join(missing)}")
+    options = dict(options or {}, auto=True)
+    root = os.path.abspath(root or os.getcwd())
+    staging = new_scratch_staging(scratch) if scratch else None
+    stages = build_workspace_stages([(name1, name2, options.get('peaks'))], options, input_index, force, use_cache,
+                                    hash_inputs, artifact_dir, prefix_names=False, resume=resume, root=root,
+                                    staging=staging)
+    resources = new_resource_manager(cpus)
+    estimate = record_history = None
+    if history_file:
+        pairs = [(name1, name2, options.get('peaks'))]
+        with runtime_history_lock:
+            history = load_runtime_history(history_file)
+            features = workspace_features(history, pairs, options, input_index, root, staging)
+        estimate = new_runtime_estimator(fit_cost_model(history), features, resources['cpus'])
+        record_history = functools.partial(update_runtime_history, history_file, pairs=pairs, options=options,
+                                           input_index=input_index, root=root, staging=staging)
+    return {
+        'name1': name1,
+        'name2': name2,
+        'workdir': os.path.join(root, f"{name1}_{name2}"),
+        'stages': stages,
+        'resources': resources,
+        'staging': staging,
+        'max_workers': max_workers or resources['cpus'],
+        'fail_fast': fail_fast,
+        'figure_workers': figure_workers,
+        'stage_timeout': stage_timeout,
+        'estimate': estimate,
+        'record_history': record_history,
+        'report': [],
+        'status': {},
+    }
+
+async def run_pipeline(pipeline, timeout=None):
+    """
+    Run a pipeline created by new_pipeline on the running asyncio event loop (see run_stages_async),
+    and save its run report to {name1}_{name2}_run_report.json and .csv in its workspace.
+    Many pipelines may run at the same time, for example with asyncio.gather.
+    If the run takes longer than timeout, or the task running it is cancelled, the running commands
+    are stopped and the exception raised once the report is saved.
+    A pipeline staged in scratch has its outputs copied back and its scratch directory removed at the end
+    of the run (see finish_scratch_staging); pipeline['delivered'] tells whether every output was copied back.
+    A pipeline with a runtime history adds the stages that ran to it. The idle resident wgdi workers
+    (see stop_wgdi_workers) are stopped at the end of every run.
+    :param pipeline: The pipeline dictionary
+    :param timeout: Seconds the whole run may take, or None
+    :return: The performance records of the stages (see new_stage_record), whose 'status' is 'done', 'cached',
+             'resumed', 'failed', 'timeout', 'skipped' or 'cancelled'
+    """
+    staging = pipeline['staging']
+    if staging is not None and not os.path.isdir(staging['root']):
+        raise RuntimeError("A pipeline staged in scratch runs once")
+    report = pipeline['report'] = []
+    pipeline['status'] = {}
+    report_name = os.path.join(pipeline['workdir'], f"{pipeline['name1']}_{pipeline['name2']}_run_report")
+    try:
+        pipeline['status'] = await asyncio.wait_for(
+            run_stages_async(pipeline['stages'], pipeline['max_workers'], report=report,
+                             resources=pipeline['resources'], fail_fast=pipeline['fail_fast'],
+                             figure_workers=pipeline['figure_workers'], stage_timeout=pipeline['stage_timeout'],
+                             estimate=pipeline['estimate']),
+            timeout)
+    finally:
+        if staging is not None:
+            failed = not pipeline['status'] or any(s != 'done' for s in pipeline['status'].values())
+            pipeline['delivered'] = await asyncio.to_thread(finish_scratch_staging, staging, failed)
+        # Resident workers started by the stages running in-process, which a later run starts again
+        await asyncio.to_thread(stop_wgdi_workers)
+        await asyncio.to_thread(write_run_report, report, f"{report_name}.json", f"{report_name}.csv")
+        if pipeline['record_history'] is not None:
+            await asyncio.to_thread(pipeline['record_history'], report)
+    return report
+
+def main():
+    """
+    Generate configuration files and run wgdi commands.
+    """
+    parser = argparse.ArgumentParser(description="Generate configuration files and run wgdi commands")
+    parser.add_argument("name1", nargs="?", help="First species name")
+    parser.add_argument("name2", nargs="?", help="Second species name")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="Run every species pair listed in FILE, one 'name1 name2 [START,END ...]' per line, "
+                             "sharing the --jobs budget")
+    parser.add_argument("--search-root", action="append", default=[], metavar="DIR",
+                        help="Directory holding input files; may be repeated, earlier directories take precedence "
+                             "(default: the current directory)")
+    parser.add_argument("--input-index", default=".wgdi_input_index.json", metavar="FILE",
+                        help="File keeping the listings of the search roots between runs; a root is listed again "
+                             "only when its modification time changes (default: .wgdi_input_index.json)")
+    parser.add_argument("--skip-incomplete", action="store_true",
+                        help="Run the pairs whose inputs are all found instead of stopping when some are missing")
+    parser.add_argument("-j", "--jobs", type=int, metavar="N",
+                        help="Maximum number of stages running at the same time, over all pairs "
+                             "(default: number of usable CPUs)")
+    parser.add_argument("--cpus", type=int, metavar="N",
+                        help="Number of CPUs the stages share; wgdi -icl gets the CPUs the other running stages "
+                             "leave free (default: the CPUs allowed by the affinity mask and cgroup quota)")
+    parser.add_argument("--memory-per-process", type=float, default=1.0, metavar="GB",
+                        help="Memory one wgdi -icl process needs; limits its processes to the usable memory "
+                             "(default: 1)")
+    parser.add_argument("--artifact-store", default="wgdi_artifacts", metavar="DIR",
+                        help="Content-addressed store the inputs and outputs of every workspace are hard-linked "
+                             "into, so identical files are stored once (default: wgdi_artifacts)")
+    parser.add_argument("--no-artifact-store", action="store_true", help="Do not publish files to the artifact store")
+    parser.add_argument("--no-blast-prefilter", action="store_true",
+                        help="Have dotplot, collinearity and blockinfo read the whole BLAST file instead of "
+                             "the hits passing their shared score, e-value and gene filters")
+    parser.add_argument("--ks-shards", type=int, default=1, metavar="N",
+                        help="Split the Ks stage into N wgdi -ks runs over chunks of the collinearity pairs (default: 1)")
+    parser.add_argument("--ks-store", metavar="FILE",
+                        help="Persistent SQLite store of Ks results; only gene pairs missing from it are computed")
+    parser.add_argument("--peak", action="append", type=parse_peak, default=[], metavar="START,END",
+                        help="Ks peak to analyse; may be repeated")
+    parser.add_argument("--peaks-file", metavar="FILE", help="File with one Ks peak START,END per line")
+    parser.add_argument("--auto-peaks", action="store_true",
+                        help="Detect the Ks peaks automatically instead of prompting for them")
+    parser.add_argument("--max-peaks", type=int, metavar="N", help="Keep at most N automatically detected peaks")
+    parser.add_argument("--kspeaks-engine", choices=['native', 'wgdi'], default='native',
+                        help="Filter the blocks of every peak in-process in one pass (native, default) "
+                             "or with one wgdi -kp run per peak")
+    parser.add_argument("--no-kspeaks-plots", action="store_true",
+                        help="With the native kspeaks engine, do not draw the per-peak kspeaks figures")
+    parser.add_argument("--icl-sweep", action="append", type=parse_icl_sweep, default=[],
+                        metavar="PARAM=VALUE/VALUE",
+                        help="Instead of the pipeline, run wgdi -icl once per combination of the values given to "
+                             f"{', '.join(ICL_PARAMETERS)} and compare the blocks found in "
+                             "{name1}_{name2}_icl_sweep.csv; may be repeated, e.g. --icl-sweep pvalue=0.2/0.05 "
+                             "--icl-sweep grading=50,40,25/60,50,30")
+    parser.add_argument("--peaksfit-engine", choices=['native', 'wgdi'], default='native',
+                        help="Fit the Gaussian of every Ks peak in-process in one call (native, default) "
+                             "or take it from one wgdi -pf run per peak")
+    parser.add_argument("--no-peaksfit-plots", action="store_true",
+                        help="With the native peaksfit engine, do not draw the per-peak peaksfit figures")
+    parser.add_argument("--figures", choices=['inline', 'deferred', 'none'], default='inline',
+                        help="Draw the figures as part of the run (inline, default), in a separate low-priority "
+                             "pool once the results they draw are on disk, without holding back the other stages "
+                             "(deferred), or not at all where wgdi allows it (none)")
+    parser.add_argument("--no-wgdi-worker", action="store_true",
+                        help="Run every wgdi command in a new process instead of forking it from a resident "
+                             "worker that has imported wgdi once")
+    parser.add_argument("--scratch", metavar="DIR",
+                        help="Copy the inputs to a node-local scratch directory DIR, such as a tmpfs or local SSD, "
+                             "run every stage there and copy the outputs back to the workspaces as stages finish; "
+                             "the scratch files are removed at the end of the run. Stages are not cached")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip the stages the journal of the previous run records as done, if their inputs "
+                             "and outputs are unchanged, including the Ks peaks chosen and their branches")
+    parser.add_argument("--fail-fast", action="store_true",
+                        help="Start no further stage once a stage fails; stages already running finish")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE",
+                        help="Rerun STAGE even if it is cached; may be repeated, 'all' reruns every stage")
+    parser.add_argument("--no-cache", action="store_true", help="Run every stage and do not record the runs")
+    parser.add_argument("--hash-inputs", action="store_true",
+                        help="Fingerprint stage inputs by their contents instead of size and modification time")
+    parser.add_argument("--cache-info", action="store_true", help="Print the stage cache and exit")
+    parser.add_argument("--history", default=".wgdi_runtime_history.json", metavar="FILE",
+                        help="File keeping the runtimes of the stages of previous runs and the sizes of their inputs; "
+                             "the stages on the longest predicted chains start first (default: .wgdi_runtime_history.json)")
+    parser.add_argument("--no-history", action="store_true",
+                        help="Neither predict runtimes from nor add this run to the runtime history")
+    parser.add_argument("--plan", action="store_true",
+                        help="Print the predicted time of every stage, the critical path of every pair and "
+                             "the predicted total and wall time, and exit without running anything")
+    parser.add_argument("--summary", action="store_true",
+                        help="Print a table of per-stage wall time, CPU time, peak memory and file sizes at exit")
+
+    args = parser.parse_args()
+    if args.manifest and args.name1:
+        parser.error("give either a species pair or --manifest, not both")
+    if not args.manifest and not args.name2:
+        parser.error("the species names name1 and name2 are required")
+    if args.scratch and args.resume:
+        parser.error("--resume cannot be used with --scratch, whose workspaces do not outlive a run")
+
+    options = {'blast_prefilter': not args.no_blast_prefilter, 'ks_shards': args.ks_shards,
+               'ks_store': args.ks_store, 'peaks': args.peak, 'peaks_file': args.peaks_file,
+               'auto': args.auto_peaks, 'max_peaks': args.max_peaks, 'kspeaks_engine': args.kspeaks_engine,
+               'kspeaks_plots': not args.no_kspeaks_plots, 'peaksfit_engine': args.peaksfit_engine,
+               'peaksfit_plots': not args.no_peaksfit_plots, 'icl_sweep': args.icl_sweep, 'figures': args.figures}
+    if args.manifest:
+        try:
+            pairs = read_manifest(args.manifest)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        # Concurrent pairs cannot share standard input, so peaks not given are detected
+        options['auto'] = True
+        report_name = "batch_run_report"
+    else:
+        pairs = [(args.name1, args.name2, [])]
+        report_name = os.path.join(f"{args.name1}_{args.name2}", f"{args.name1}_{args.name2}_run_report")
+
+    if args.cache_info:
+        for name1, name2, _ in pairs:
+            print_stage_cache(os.path.join(os.getcwd(), f"{name1}_{name2}", f"{name1}_{name2}_stage_cache.json"))
+        return
+
+    input_index = scan_search_roots(args.search_root or [os.getcwd()], args.input_index)
+    missing = {(name1, name2): find_missing_inputs(name1, name2, search_files(name1, name2, input_index))
+               for name1, name2, _ in pairs}
+    incomplete = [pair for pair, file_names in missing.items() if file_names]
+    if incomplete:
+        print(f"Missing inputs for {len(incomplete)} of {len(pairs)} pairs:")
+        for name1, name2 in incomplete:
+            print(f"{name1} {name2}: {', '.join(missing[(name1, name2)])}")
+        if not args.skip_incomplete or len(incomplete) == len(pairs):
+            raise SystemExit(1)
+        pairs = [pair for pair in pairs if not missing[(pair[0], pair[1])]]
+
+    history_file = None if args.no_history else args.history
+    history = load_runtime_history(history_file)
+    model = fit_cost_model(history)
+    features = workspace_features(history, pairs, options, input_index) if history_file or args.plan else {}
+    if args.plan:
+        cpus = max(1, args.cpus or detect_cpu_count())
+        print_runtime_plan(pairs, options, input_index, model, features, max(1, args.jobs or cpus), cpus)
+        if history_file:
+            # Keep the line counts, so the next run does not count the inputs again
+            save_runtime_history(history, history_file)
+        return
+
+    artifact_dir = None if args.no_artifact_store else os.path.abspath(args.artifact_store)
+    staging = new_scratch_staging(args.scratch) if args.scratch else None
+    if staging is not None:
+        print(f"Running in scratch directory {staging['root']}")
+    stages = build_workspace_stages(pairs, options, input_index, args.force, not args.no_cache, args.hash_inputs,
+                                    artifact_dir, prefix_names=bool(args.manifest), resume=args.resume,
+                                    staging=staging)
+    for scratch_workdir, workdir in (staging['workspaces'].items() if staging is not None else ()):
+        if workdir in features:
+            features[scratch_workdir] = features[workdir]
+    resources = new_resource_manager(args.cpus, memory_per_process=int(args.memory_per_process * 2 ** 30))
+    print(f"Usable resources: {resources['cpus']} CPUs, {resources['memory'] / 2 ** 30:.1f} GB memory")
+    wgdi_workers['enabled'] = not args.no_wgdi_worker
+    report = []
+    status = {}
+    delivered = True
+    try:
+        status = run_stages(stages, max(1, args.jobs or resources['cpus']), report=report, resources=resources, fail_fast=args.fail_fast,
+                            figure_workers=max(1, resources['cpus'] // 4) if args.figures == 'deferred' else None,
+                            estimate=new_runtime_estimator(model, features, resources['cpus']))
+    finally:
+        stop_wgdi_workers()
+        if staging is not None:
+            delivered = finish_scratch_staging(staging, failed=not status or any(s != 'done' for s in status.values()))
+        write_run_report(report, f"{report_name}.json", f"{report_name}.csv")
+        if history_file:
+            update_runtime_history(history_file, report, pairs, options, input_index, staging=staging)
+        if args.summary:
+            print_run_summary(report)
+    if any(s != 'done' for s in status.values()) or not delivered:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['--wgdi-worker']:
+        serve_wgdi_worker(int(sys.argv[2]))
+    else:
+        main()